@@ -0,0 +1,135 @@
+# boutique/analytics.py
+"""
+Séries temporelles pour les tableaux de bord.
+
+Chaque série est calculée en une seule requête GROUP BY sur la période tronquée
+(jour, semaine ou mois), puis complétée avec des zéros pour les périodes sans
+données. Le chiffre d'affaires est la somme des lignes de commande
+(prix * quantité) : une commande contenant plusieurs articles d'une même
+boutique n'est plus comptée plusieurs fois.
+"""
+from datetime import date, datetime, time, timedelta
+import logging
+
+from django.db.models import Count, DateField, DateTimeField, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from cart.models import OrderItem
+from users.models import User
+from .models import BoutiqueDailyStats
+
+logger = logging.getLogger(__name__)
+
+TRUNCATIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+LINE_AMOUNT = ExpressionWrapper(
+    F('prix') * F('quantite'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def period_start(day, granularity):
+    """Premier jour de la période (lundi pour les semaines) contenant ``day``."""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def period_starts(start, end, granularity):
+    """Débuts de toutes les périodes couvrant [start, end], dans l'ordre."""
+    current = period_start(start, granularity)
+    periods = []
+    while current <= end:
+        periods.append(current)
+        if granularity == 'month':
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            current += timedelta(days=7 if granularity == 'week' else 1)
+    return periods
+
+
+def date_bounds(start, end):
+    """Datetimes [début de ``start``, début du lendemain de ``end``) dans le fuseau courant."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def _field_for_path(model, path):
+    parts = path.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    return model._meta.get_field(parts[-1])
+
+
+def time_series(queryset, date_field, value, start, end, granularity='month'):
+    """
+    Agrège ``value`` (ex. Sum(...), Count('id')) par période de ``date_field``
+    entre les dates ``start`` et ``end`` incluses. Retourne une liste de
+    ``(début de période, valeur)`` sans trou.
+    """
+    if granularity not in TRUNCATIONS:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    if isinstance(_field_for_path(queryset.model, date_field), DateTimeField):
+        lower, upper = date_bounds(start, end)
+    else:
+        lower, upper = start, end + timedelta(days=1)
+    rows = (
+        queryset.filter(**{f'{date_field}__gte': lower, f'{date_field}__lt': upper})
+        .annotate(period=TRUNCATIONS[granularity](date_field, output_field=DateField()))
+        .values('period')
+        .annotate(value=value)
+        .order_by('period')
+    )
+    totals = {row['period']: row['value'] or 0 for row in rows}
+    return [(period, totals.get(period, 0)) for period in period_starts(start, end, granularity)]
+
+
+def sales_series(start, end, granularity='month', boutique=None, statuses=None):
+    """Chiffre d'affaires (lignes de commande) par période, éventuellement pour une boutique."""
+    lines = OrderItem.objects.all()
+    if boutique is not None:
+        lines = lines.filter(produit__boutique=boutique)
+    if statuses:
+        lines = lines.filter(order__status__in=statuses)
+    return time_series(lines, 'order__created_at', Sum(LINE_AMOUNT), start, end, granularity)
+
+
+def boutique_sales_series(boutique, start, end, granularity='month'):
+    """Chiffre d'affaires d'une boutique par période, lu dans BoutiqueDailyStats."""
+    stats = BoutiqueDailyStats.objects.filter(boutique=boutique)
+    return time_series(stats, 'date', Sum('revenue'), start, end, granularity)
+
+
+def signup_series(start, end, granularity='week', role='client'):
+    """Nombre d'inscriptions par période."""
+    users = User.objects.filter(role=role)
+    return time_series(users, 'created_at', Count('id'), start, end, granularity)
+
+
+def parse_period(request, default_days=365, default_granularity='month'):
+    """
+    Lit ``?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day|week|month``.
+    Par défaut : les ``default_days`` derniers jours. Lève ValueError si invalide.
+    """
+    params = request.query_params
+    end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+    start = parse_date(params['start']) if params.get('start') else end - timedelta(days=default_days)
+    granularity = params.get('granularity', default_granularity)
+    if start is None or end is None:
+        raise ValueError("Dates must use the YYYY-MM-DD format")
+    if start > end:
+        raise ValueError("start must be before end")
+    if granularity not in TRUNCATIONS:
+        raise ValueError(f"granularity must be one of: {', '.join(TRUNCATIONS)}")
+    return start, end, granularity
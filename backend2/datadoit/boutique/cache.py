@@ -0,0 +1,152 @@
+# boutique/cache.py
+"""
+Cache de réponses pour les endpoints publics du catalogue.
+
+Chaque endpoint déclare les portées (scopes) dont dépend sa réponse : une
+boutique (``boutique:<id>`` : sa fiche, ses catégories, ses produits) ou une
+liste transverse (``categories``, ``boutiques``, ``products``). Chaque portée
+a sa version dans le cache Redis (settings.CACHES) et la clé d'une réponse
+combine l'endpoint, ses paramètres et les versions de ses portées.
+boutique/signals.py, le paiement d'une commande (cart/services.py) et les
+notes (boutique/ratings.py) n'incrémentent que les portées réellement
+touchées : une commande sur une boutique n'invalide que ses pages, et les
+champs absents des réponses (popularité, compteurs bruts des notes) ne
+provoquent aucune invalidation. Les anciennes entrées ne sont plus jamais
+lues et expirent d'elles-mêmes.
+
+Toutes les réponses dépendent aussi de la portée racine ``all``, incrémentée
+par ``bump_catalog_version()`` sans argument (recalculs globaux).
+"""
+from functools import wraps
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+ROOT_SCOPE = 'all'
+CATEGORIES_SCOPE = 'categories'
+BOUTIQUES_SCOPE = 'boutiques'
+PRODUCTS_SCOPE = 'products'
+
+
+def boutique_scope(boutique_id):
+    return f"boutique:{boutique_id}"
+
+
+def _version_key(scope):
+    return f"catalog:version:{scope}"
+
+
+def _updated_at_key(scope):
+    return f"catalog:updated_at:{scope}"
+
+
+def get_catalog_versions(scopes):
+    """``({scope: version}, dernière modification)`` des portées ``scopes`` (un aller-retour en régime établi)."""
+    keys = [_version_key(scope) for scope in scopes] + [_updated_at_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    versions = {}
+    for scope in scopes:
+        version = values.get(_version_key(scope))
+        if version is None:
+            cache.add(_version_key(scope), 1, timeout=None)
+            cache.add(_updated_at_key(scope), int(time.time()), timeout=None)
+            version = cache.get(_version_key(scope), 1)
+        versions[scope] = version
+    updated_at = max((values.get(_updated_at_key(scope)) or 0 for scope in scopes), default=0)
+    return versions, updated_at or int(time.time())
+
+
+def bump_catalog_version(*scopes):
+    """Invalide les réponses qui dépendent de ``scopes`` (toutes si aucune portée n'est donnée)."""
+    now = int(time.time())
+    for scope in set(scopes or (ROOT_SCOPE,)):
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.add(_version_key(scope), 1, timeout=None)
+        cache.set(_updated_at_key(scope), now, timeout=None)
+
+
+def bump_boutiques(boutique_ids, *scopes):
+    """Invalide les pages des boutiques ``boutique_ids``, plus les portées transverses ``scopes``."""
+    bump_catalog_version(*[boutique_scope(boutique_id) for boutique_id in boutique_ids if boutique_id is not None], *scopes)
+
+
+def _cache_key(endpoint, request, kwargs, versions):
+    # Les URLs d'images sont absolues : la clé dépend aussi de l'hôte
+    params = sorted((k, request.query_params.getlist(k)) for k in request.query_params)
+    raw = json.dumps([request.scheme, request.get_host(), sorted(kwargs.items()), params], default=str)
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    version = '.'.join(str(versions[scope]) for scope in sorted(versions))
+    return f"catalog:{endpoint}:v{version}:{digest}"
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def _finalize(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f"public, max-age={settings.CATALOG_CACHE_MAX_AGE}, must-revalidate"
+    return response
+
+
+def cached_catalog_response(*scopes):
+    """
+    Décorateur read-through pour une vue DRF publique (à placer sous @api_view).
+    ``scopes`` : portées dont dépend la réponse, formatées avec les paramètres
+    d'URL de la vue, ex. ``cached_catalog_response('boutique:{boutique_id}')``.
+    Seules les réponses GET 200 sont mises en cache ; les autres méthodes passent
+    directement à la vue.
+    """
+    def decorator(view_func):
+        endpoint = view_func.__name__
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            versions, updated_at = get_catalog_versions(
+                [ROOT_SCOPE] + [scope.format(**kwargs) for scope in scopes]
+            )
+            key = _cache_key(endpoint, request, kwargs, versions)
+            entry = cache.get(key)
+            if entry is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                body = JSONRenderer().render(response.data)
+                entry = {
+                    # Données "à plat", sans référence au serializer, pour pouvoir les pickler
+                    'data': json.loads(body),
+                    'etag': f'"{hashlib.md5(body).hexdigest()}"',
+                    'last_modified': updated_at,
+                }
+                cache.set(key, entry, timeout=settings.CATALOG_CACHE_TIMEOUT)
+                logger.debug(f"Catalog cache miss for {endpoint} ({versions})")
+            else:
+                logger.debug(f"Catalog cache hit for {endpoint} ({versions})")
+
+            if _not_modified(request, entry['etag'], entry['last_modified']):
+                return _finalize(Response(status=status.HTTP_304_NOT_MODIFIED), entry['etag'], entry['last_modified'])
+            return _finalize(Response(entry['data']), entry['etag'], entry['last_modified'])
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,113 @@
+# boutique/management/commands/benchmark_catalog_search.py
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from boutique.models import Boutique, CategoryProduit, Produit
+
+NOUNS = ['robe', 'chemise', 'pantalon', 'veste', 'basket', 'sac', 'montre', 'lampe', 'chaise', 'tapis',
+         'casque', 'clavier', 'savon', 'parfum', 'bracelet', 'jupe', 'manteau', 'ceinture', 'coussin', 'tasse']
+ADJECTIVES = ['bleu', 'rouge', 'noir', 'blanc', 'vintage', 'moderne', 'coton', 'cuir', 'artisanal', 'léger',
+              'élégant', 'sport', 'classique', 'naturel', 'premium', 'compact', 'doux', 'brillant']
+COULEURS = ['bleu', 'rouge', 'noir', 'blanc', 'vert', 'beige']
+TAILLES = ['XS', 'S', 'M', 'L', 'XL', '38', '40', '42']
+
+SEED_BATCH = 5000
+
+
+def _scenarios(category_ids):
+    """(nom, paramètres) représentatifs du trafic : mot seul, mots + filtres, tri prix, mot partiel, facettes seules."""
+    noun, adjective = random.choice(NOUNS), random.choice(ADJECTIVES)
+    return [
+        ('mot', {'q': noun}),
+        ('deux mots', {'q': f'{noun} {adjective}'}),
+        ('mot + filtres', {'q': noun, 'prix_max': '100', 'en_stock': '1', 'couleur': random.choice(COULEURS)}),
+        ('mot + catégorie', {'q': adjective, 'category_id': str(random.choice(category_ids))}),
+        ('tri prix', {'q': noun, 'sort': 'price_asc'}),
+        ('mot partiel', {'q': noun[:4] + adjective[:2]}),
+        ('sans mot', {'prix_min': '20', 'prix_max': '200', 'sort': 'popularity'}),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Mesure la latence (p50/p95/p99) de /boutique/search/ ; --seed génère un catalogue synthétique'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=50, help='Passages sur l\'ensemble des scénarios.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Produits synthétiques à créer avant la mesure (ex. 1000000). Base de test uniquement.',
+        )
+        parser.add_argument('--boutique', type=int, help='Boutique qui reçoit les produits générés par --seed.')
+
+    def seed(self, count, boutique_id):
+        try:
+            boutique = Boutique.objects.select_related('marchand').get(pk=boutique_id)
+        except Boutique.DoesNotExist:
+            raise CommandError('--seed nécessite --boutique <id> d\'une boutique existante')
+        categories = list(CategoryProduit.objects.filter(boutique=boutique)[:10]) or [
+            CategoryProduit.objects.create(nom='Benchmark', boutique=boutique)
+        ]
+        rng = random.Random(42)
+        created = 0
+        while created < count:
+            batch = []
+            for _ in range(min(SEED_BATCH, count - created)):
+                nom = f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)}"
+                prix = rng.randint(5, 900)
+                batch.append(Produit(
+                    nom=nom,
+                    description=f"{nom} {rng.choice(NOUNS)} {' '.join(rng.sample(ADJECTIVES, 4))}",
+                    prix=prix,
+                    prix_reduit=round(prix * 0.8, 2) if rng.random() < 0.2 else None,
+                    stock=rng.randint(0, 50),
+                    couleur=rng.choice(COULEURS),
+                    taille=rng.choice(TAILLES),
+                    category_produit=rng.choice(categories),
+                    boutique=boutique,
+                    marchand=boutique.marchand,
+                    en_stock=rng.random() < 0.85,
+                    popularity_score=rng.random() * 100,
+                ))
+            Produit.objects.bulk_create(batch)
+            created += len(batch)
+            self.stdout.write(f"{created}/{count} produits générés")
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE "produits"')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['boutique'])
+
+        category_ids = list(CategoryProduit.objects.values_list('pk', flat=True)[:100]) or [0]
+        timings = {}
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host and not host.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        # Cache factice : chaque requête exécute réellement la recherche
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            for _ in range(options['runs']):
+                for name, params in _scenarios(category_ids):
+                    start = time.perf_counter()
+                    response = client.get('/boutique/search/', params)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    if response.status_code != 200:
+                        raise CommandError(f"{name} {params} -> HTTP {response.status_code}: {response.content[:200]}")
+                    timings.setdefault(name, []).append(elapsed)
+
+        total = Produit.objects.count()
+        self.stdout.write(f"{total} produits, {options['runs']} passages, base {connection.vendor}")
+        everything = []
+        for name, values in timings.items():
+            everything += values
+            self.stdout.write(self._line(name, values))
+        self.stdout.write(self.style.SUCCESS(self._line('total', everything)))
+
+    def _line(self, name, values):
+        q = statistics.quantiles(values, n=100)
+        return f"{name:<16} p50 {q[49]:7.1f} ms   p95 {q[94]:7.1f} ms   p99 {q[98]:7.1f} ms   max {max(values):7.1f} ms"
@@ -0,0 +1,19 @@
+# boutique/management/commands/rebuild_dashboard_stats.py
+from django.core.management.base import BaseCommand
+
+from boutique.rollups import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les statistiques du tableau de bord marchand depuis l\'historique des commandes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--boutique', type=int, action='append', dest='boutiques',
+            help='ID de boutique à recalculer (répétable). Toutes les boutiques par défaut.',
+        )
+
+    def handle(self, *args, **options):
+        rebuild_stats(boutique_ids=options['boutiques'])
+        target = ', '.join(map(str, options['boutiques'])) if options['boutiques'] else 'toutes les boutiques'
+        self.stdout.write(self.style.SUCCESS(f"Statistiques recalculées ({target})."))
@@ -0,0 +1,14 @@
+# boutique/management/commands/reconcile_ratings.py
+from django.core.management.base import BaseCommand
+
+from boutique.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recalcule rating_count / rating_sum / average_rating des produits et marchands depuis les notes'
+
+    def handle(self, *args, **kwargs):
+        produits, marchands = reconcile_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f"Notes réconciliées : {produits} produits et {marchands} marchands corrigés."
+        ))
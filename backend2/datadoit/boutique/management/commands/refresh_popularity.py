@@ -0,0 +1,12 @@
+# boutique/management/commands/refresh_popularity.py
+from django.core.management.base import BaseCommand
+
+from boutique.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recalcule le score de popularité décroissant des produits (à planifier, ex. toutes les heures)'
+
+    def handle(self, *args, **kwargs):
+        updated = refresh_popularity()
+        self.stdout.write(self.style.SUCCESS(f"Popularité recalculée : {updated} produits actifs."))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-18 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0010_alter_produit_est_nouveau'),
+        ('users', '0008_comment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='boutique',
+            index=models.Index(fields=['is_approved', 'created_at', 'id'], name='boutiques_approved_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['created_at', 'id'], name='produits_created_id_idx'),
+        ),
+    ]
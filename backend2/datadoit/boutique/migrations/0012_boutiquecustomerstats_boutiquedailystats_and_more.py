@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-18 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0011_boutique_boutiques_approved_created_idx_and_more'),
+        ('users', '0008_comment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoutiqueCustomerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_count', models.IntegerField(default=0, verbose_name='Nombre de commandes')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total dépensé')),
+                ('boutique', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customer_stats', to='boutique.boutique')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='boutique_stats', to='users.client')),
+            ],
+            options={
+                'verbose_name': 'Statistiques client boutique',
+                'verbose_name_plural': 'Statistiques clients boutiques',
+                'db_table': 'boutique_customer_stats',
+                'constraints': [models.UniqueConstraint(fields=('boutique', 'client'), name='unique_boutique_customer_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BoutiqueDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Chiffre d'affaires")),
+                ('order_count', models.IntegerField(default=0, verbose_name='Nombre de commandes')),
+                ('customer_count', models.IntegerField(default=0, verbose_name='Clients distincts')),
+                ('units_sold', models.IntegerField(default=0, verbose_name='Articles vendus')),
+                ('boutique', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='boutique.boutique')),
+            ],
+            options={
+                'verbose_name': 'Statistiques journalières boutique',
+                'verbose_name_plural': 'Statistiques journalières boutiques',
+                'db_table': 'boutique_daily_stats',
+                'constraints': [models.UniqueConstraint(fields=('boutique', 'date'), name='unique_boutique_daily_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProduitDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('units_sold', models.IntegerField(default=0, verbose_name='Articles vendus')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Chiffre d'affaires")),
+                ('boutique', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='produit_daily_stats', to='boutique.boutique')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='boutique.produit')),
+            ],
+            options={
+                'verbose_name': 'Statistiques journalières produit',
+                'verbose_name_plural': 'Statistiques journalières produits',
+                'db_table': 'produit_daily_stats',
+                'indexes': [models.Index(fields=['boutique', 'date'], name='produit_stats_boutique_idx')],
+                'constraints': [models.UniqueConstraint(fields=('produit', 'date'), name='unique_produit_daily_stats')],
+            },
+        ),
+    ]
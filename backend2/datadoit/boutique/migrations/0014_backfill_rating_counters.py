@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 01:10
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Produit = apps.get_model('boutique', 'Produit')
+    Marchand = apps.get_model('users', 'Marchand')
+    Rating = apps.get_model('boutique', 'Rating')
+
+    per_produit = Rating.objects.values('produit_id').annotate(count=Count('id'), total=Sum('value')).order_by()
+    per_marchand = {}
+    owners = dict(Produit.objects.values_list('id', 'boutique__marchand_id'))
+    fallback = dict(Produit.objects.values_list('id', 'marchand_id'))
+    for row in per_produit:
+        Produit.objects.filter(pk=row['produit_id']).update(
+            rating_count=row['count'],
+            rating_sum=row['total'],
+            average_rating=round(row['total'] / row['count'], 1),
+        )
+        owner = owners.get(row['produit_id']) or fallback.get(row['produit_id'])
+        if owner is not None:
+            count, total = per_marchand.get(owner, (0, 0))
+            per_marchand[owner] = (count + row['count'], total + row['total'])
+    for marchand_id, (count, total) in per_marchand.items():
+        Marchand.objects.filter(pk=marchand_id).update(
+            rating_count=count,
+            rating_sum=total,
+            average_rating=round(total / count, 1),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0013_produit_rating_count_produit_rating_sum'),
+        ('users', '0009_marchand_rating_count_marchand_rating_sum'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0014_backfill_rating_counters'),
+        ('users', '0009_marchand_rating_count_marchand_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='popularity_score',
+            field=models.FloatField(default=0.0, editable=False, verbose_name='Score de popularité'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='popularity_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Popularité mise à jour le'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['-popularity_score', 'id'], name='produits_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['boutique', '-popularity_score'], name='produits_boutique_pop_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 00:57
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = {
+    # Expressions identiques à celles de ``icontains`` sous PostgreSQL : UPPER("col"::text) LIKE UPPER(...)
+    'produits_nom_trgm_idx': 'UPPER("nom"::text) gin_trgm_ops',
+    'produits_description_trgm_idx': 'UPPER("description"::text) gin_trgm_ops',
+}
+
+
+def search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Doit rester identique à boutique.search.search_vector()
+    vector = SearchVector('nom', weight='A', config='simple') + SearchVector('description', weight='B', config='simple')
+    return GinIndex(vector, name='produits_search_idx')
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Produit = apps.get_model('boutique', 'Produit')
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.add_index(Produit, search_index(), concurrently=True)
+    for name, expression in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "produits" USING GIN ({expression})')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in ('produits_search_idx', *TRIGRAM_INDEXES):
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY ne peut pas s'exécuter dans une transaction
+    atomic = False
+
+    dependencies = [
+        ('boutique', '0015_produit_popularity_score_and_more'),
+        ('users', '0009_marchand_rating_count_marchand_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('prix_reduit', 'prix'), models.F('id'), name='produits_prix_effectif_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
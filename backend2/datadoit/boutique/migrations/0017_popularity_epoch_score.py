@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 01:22
+
+from datetime import datetime, timezone
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Copie figée de boutique/popularity.py : une migration ne doit pas dépendre du code courant
+EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+MIN_SCORE = 1e-6
+
+
+def _exponent(at):
+    return (at - EPOCH).total_seconds() / (settings.POPULARITY_HALF_LIFE_DAYS * 86400)
+
+
+def _convert(apps, to_epoch):
+    Produit = apps.get_model('boutique', 'Produit')
+    produits = Produit.objects.exclude(popularity_score=0).exclude(popularity_updated_at__isnull=True).only(
+        'id', 'popularity_score', 'popularity_updated_at'
+    ).order_by('pk')
+    batch = []
+    for produit in produits.iterator(chunk_size=BATCH_SIZE):
+        exponent = _exponent(produit.popularity_updated_at)
+        if to_epoch:
+            # Score valable à popularity_updated_at -> log2 ramené à l'époque
+            score = produit.popularity_score
+            produit.popularity_score = exponent + math.log2(score) if score > MIN_SCORE else 0.0
+        else:
+            produit.popularity_score = 2 ** (produit.popularity_score - exponent)
+        batch.append(produit)
+        if len(batch) >= BATCH_SIZE:
+            Produit.objects.bulk_update(batch, ['popularity_score'])
+            batch = []
+    Produit.objects.bulk_update(batch, ['popularity_score'])
+
+
+def scores_to_epoch(apps, schema_editor):
+    _convert(apps, to_epoch=True)
+
+
+def scores_from_epoch(apps, schema_editor):
+    _convert(apps, to_epoch=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0016_produit_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(scores_to_epoch, scores_from_epoch),
+        migrations.RemoveIndex(
+            model_name='produit',
+            name='produits_popularity_idx',
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['-popularity_score', '-id'], name='produits_popularity_desc_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 # boutique/models.py
 from datetime import timedelta, timezone
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.core.validators import validate_email
 from django.utils.translation import gettext_lazy as _
 
@@ -58,6 +60,9 @@ class Boutique(models.Model):
         verbose_name = _("Boutique")
         verbose_name_plural = _("Boutiques")
         db_table = 'boutiques'
+        indexes = [
+            models.Index(fields=['is_approved', 'created_at', 'id'], name='boutiques_approved_created_idx'),
+        ]
 
     def __str__(self):
         return self.nom
@@ -114,6 +119,12 @@ class Produit(models.Model):
     average_rating = models.FloatField(
         default=0.0, editable=False, verbose_name=_("Note moyenne")
     )  # Average rating, replaces 'note'
+    # Compteurs maintenus par boutique/ratings.py : average_rating = rating_sum / rating_count
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("Nombre de notes"))
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("Somme des notes"))
+    # Maintenu par boutique/popularity.py (log2 du score ramené à une époque fixe, 0.0 = aucun score)
+    popularity_score = models.FloatField(default=0.0, editable=False, verbose_name=_("Score de popularité"))
+    popularity_updated_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_("Popularité mise à jour le"))
     marchand = models.ForeignKey(
     'users.Marchand',
     null=True,
@@ -132,21 +143,26 @@ class Produit(models.Model):
         verbose_name = _("Produit")
         verbose_name_plural = _("Produits")
         db_table = 'produits'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='produits_created_id_idx'),
+            models.Index(fields=['-popularity_score', '-id'], name='produits_popularity_desc_idx'),
+            models.Index(fields=['boutique', '-popularity_score'], name='produits_boutique_pop_idx'),
+            # Prix effectif : filtres et tris par prix de la recherche (boutique/search.py)
+            models.Index(Coalesce('prix_reduit', 'prix'), F('id'), name='produits_prix_effectif_idx'),
+        ]
 
     def __str__(self):
         return self.nom
 
     def calculate_average_rating(self):
-        """Calculate the average rating from all associated ratings."""
-        ratings = self.ratings.all()
-        if ratings:
-            average = sum(rating.value for rating in ratings) / ratings.count()
-            self.average_rating = round(average, 1)
-            self.save(update_fields=['average_rating'])
-        else:
-            self.average_rating = 0.0
-            self.save(update_fields=['average_rating'])
+        """Recalcule les compteurs de notes depuis la table ratings (réconciliation)."""
+        totals = self.ratings.aggregate(count=models.Count('id'), total=models.Sum('value'))
+        self.rating_count = totals['count']
+        self.rating_sum = totals['total'] or 0
+        self.average_rating = round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0.0
+        self.save(update_fields=['rating_count', 'rating_sum', 'average_rating'])
         return self.average_rating
+
     @property
     def is_new(self):
         """Vérifie si le produit est nouveau (moins de 30 jours depuis la création)."""
@@ -174,10 +190,34 @@ class Rating(models.Model):
     def __str__(self):
         return f"{self.user.username}: {self.value} pour {self.produit.nom}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs d'origine, pour ne reporter que la différence sur les compteurs
+        if 'produit_id' in field_names and 'value' in field_names:
+            instance._counted = (instance.produit_id, instance.value)
+        return instance
+
     def save(self, *args, **kwargs):
-        """Override save to update product's average rating."""
-        super().save(*args, **kwargs)
-        self.produit.calculate_average_rating()
+        """Met à jour les compteurs du produit et du marchand par incréments (voir boutique/ratings.py)."""
+        from .popularity import record_rating
+        from .ratings import apply_rating_delta
+
+        previous = None
+        if not self._state.adding:
+            previous = getattr(self, '_counted', None) or Rating.objects.filter(pk=self.pk).values_list('produit_id', 'value').first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous and previous[0] == self.produit_id:
+                apply_rating_delta(self.produit_id, self.value - previous[1], 0)
+                record_rating(self.produit_id, self.value - previous[1], self.created_at)
+            else:
+                if previous:
+                    apply_rating_delta(previous[0], -previous[1], -1)
+                    record_rating(previous[0], -previous[1], self.created_at)
+                apply_rating_delta(self.produit_id, self.value, 1)
+                record_rating(self.produit_id, self.value, self.created_at)
+        self._counted = (self.produit_id, self.value)
 class Echange(models.Model):
     boutique = models.ForeignKey(Boutique, on_delete=models.CASCADE, related_name='echanges')
     utilisateur = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='echanges')
@@ -218,4 +258,65 @@ class WishlistItem(models.Model):
         unique_together = ('wishlist', 'produit')  # Prevent duplicate products in wishlist
 
     def __str__(self):
-        return f"{self.produit.nom} in wishlist"
\ No newline at end of file
+        return f"{self.produit.nom} in wishlist"
+
+# Agrégats du tableau de bord marchand, maintenus par boutique/rollups.py
+class BoutiqueDailyStats(models.Model):
+    boutique = models.ForeignKey(Boutique, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField(verbose_name=_("Date"))
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name=_("Chiffre d'affaires"))
+    order_count = models.IntegerField(default=0, verbose_name=_("Nombre de commandes"))
+    customer_count = models.IntegerField(default=0, verbose_name=_("Clients distincts"))
+    units_sold = models.IntegerField(default=0, verbose_name=_("Articles vendus"))
+
+    class Meta:
+        verbose_name = _("Statistiques journalières boutique")
+        verbose_name_plural = _("Statistiques journalières boutiques")
+        db_table = 'boutique_daily_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['boutique', 'date'], name='unique_boutique_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.boutique_id} - {self.date}: {self.revenue}"
+
+
+class ProduitDailyStats(models.Model):
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='daily_stats')
+    boutique = models.ForeignKey(Boutique, on_delete=models.CASCADE, related_name='produit_daily_stats')
+    date = models.DateField(verbose_name=_("Date"))
+    units_sold = models.IntegerField(default=0, verbose_name=_("Articles vendus"))
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name=_("Chiffre d'affaires"))
+
+    class Meta:
+        verbose_name = _("Statistiques journalières produit")
+        verbose_name_plural = _("Statistiques journalières produits")
+        db_table = 'produit_daily_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['produit', 'date'], name='unique_produit_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['boutique', 'date'], name='produit_stats_boutique_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.produit_id} - {self.date}: {self.units_sold}"
+
+
+class BoutiqueCustomerStats(models.Model):
+    """Une ligne par (boutique, client) ayant au moins une commande : compte les clients actifs."""
+    boutique = models.ForeignKey(Boutique, on_delete=models.CASCADE, related_name='customer_stats')
+    client = models.ForeignKey('users.Client', on_delete=models.CASCADE, related_name='boutique_stats')
+    order_count = models.IntegerField(default=0, verbose_name=_("Nombre de commandes"))
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name=_("Total dépensé"))
+
+    class Meta:
+        verbose_name = _("Statistiques client boutique")
+        verbose_name_plural = _("Statistiques clients boutiques")
+        db_table = 'boutique_customer_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['boutique', 'client'], name='unique_boutique_customer_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.boutique_id} - {self.client_id}: {self.order_count}"
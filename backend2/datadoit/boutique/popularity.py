@@ -0,0 +1,203 @@
+# boutique/popularity.py
+"""
+Score de popularité des produits.
+
+Le score d'un produit est une somme de points qui décroît exponentiellement
+(demi-vie settings.POPULARITY_HALF_LIFE_DAYS) :
+  - chaque article commandé rapporte POPULARITY_ORDER_WEIGHT point ;
+  - chaque note rapporte POPULARITY_RATING_WEIGHT * note / 5.
+``Produit.popularity_score`` le stocke ramené à une époque fixe, en
+logarithme : log2(score à t) + (t - EPOCH) / demi-vie. Cette valeur ne change
+pas avec le temps et tous les produits décroissent au même rythme : trier
+par la colonne revient à trier par le score courant, sans recalcul pour les
+produits inactifs. 0.0 signifie « aucun score » (les scores réels valent
+plusieurs centaines). Chaque événement (commande, annulation, note) ajoute
+ses points à la ligne ; ``refresh_popularity`` (commande
+``refresh_popularity``) recalcule tout depuis l'historique récent et doit
+être relancé après un changement de demi-vie.
+
+Si settings.POPULARITY_LEADERBOARDS est activé, les scores sont recopiés dans
+des sorted sets Redis par boutique et par catégorie de produit.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Produit, Rating
+
+logger = logging.getLogger(__name__)
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # django-redis absent : pas de classements Redis
+    get_redis_connection = None
+
+# Au-delà de ce nombre de demi-vies, un événement pèse moins de 0,1 % : ignoré au recalcul
+HORIZON_HALF_LIVES = 10
+
+# Origine des scores stockés ; assez ancienne pour que tout score réel soit positif
+EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+NO_SCORE = 0.0
+# En dessous (en points courants), un score est considéré comme nul
+MIN_SCORE = 1e-6
+
+
+def _half_life_seconds():
+    return settings.POPULARITY_HALF_LIFE_DAYS * 86400
+
+
+def decay(age):
+    """Facteur de décroissance pour un ``timedelta`` écoulé."""
+    return 0.5 ** (max(age.total_seconds(), 0) / _half_life_seconds())
+
+
+def _epoch_exponent(at):
+    return (at - EPOCH).total_seconds() / _half_life_seconds()
+
+
+def current_score(stored, now):
+    """Points courants à ``now`` d'une valeur de ``popularity_score``."""
+    return 2 ** (stored - _epoch_exponent(now)) if stored != NO_SCORE else 0.0
+
+
+def stored_score(score, now):
+    """Valeur de ``popularity_score`` pour ``score`` points courants à ``now``."""
+    return _epoch_exponent(now) + math.log2(score) if score > MIN_SCORE else NO_SCORE
+
+
+def rating_points(value):
+    return settings.POPULARITY_RATING_WEIGHT * value / 5
+
+
+def order_points(quantite):
+    return settings.POPULARITY_ORDER_WEIGHT * quantite
+
+
+def leaderboards_enabled():
+    return settings.POPULARITY_LEADERBOARDS and get_redis_connection is not None
+
+
+def boutique_key(boutique_id):
+    return f"popularity:boutique:{boutique_id}"
+
+
+def category_key(category_produit_id):
+    return f"popularity:category:{category_produit_id}"
+
+
+def _push_leaderboards(produits):
+    if not leaderboards_enabled() or not produits:
+        return
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for produit in produits:
+            if produit.boutique_id:
+                pipe.zadd(boutique_key(produit.boutique_id), {produit.pk: produit.popularity_score})
+            if produit.category_produit_id:
+                pipe.zadd(category_key(produit.category_produit_id), {produit.pk: produit.popularity_score})
+        pipe.execute()
+    except Exception as e:
+        # Les classements sont un accélérateur : la base reste la référence
+        logger.error(f"Error updating popularity leaderboards: {str(e)}")
+
+
+def add_points(points_at):
+    """
+    ``points_at`` : {produit_id: [(points, datetime de l'événement), ...]}.
+    Deux requêtes quel que soit le nombre de produits (verrouillage + bulk_update).
+    """
+    if not points_at:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        produits = list(
+            Produit.objects.select_for_update()
+            .filter(pk__in=list(points_at))
+            .only('id', 'popularity_score', 'popularity_updated_at', 'boutique_id', 'category_produit_id')
+            .order_by('pk')
+        )
+        for produit in produits:
+            score = current_score(produit.popularity_score, now)
+            score += sum(points * decay(now - at) for points, at in points_at[produit.pk])
+            produit.popularity_score = stored_score(score, now)
+            produit.popularity_updated_at = now
+        Produit.objects.bulk_update(produits, ['popularity_score', 'popularity_updated_at'])
+        transaction.on_commit(lambda: _push_leaderboards(produits))
+
+
+def record_sales(units_by_produit, ordered_at):
+    """Quantités positives (commande) ou négatives (annulation) commandées à ``ordered_at``."""
+    add_points({
+        produit_id: [(order_points(units), ordered_at)]
+        for produit_id, units in units_by_produit.items() if units
+    })
+
+
+def record_rating(produit_id, value_delta, rated_at):
+    if value_delta:
+        add_points({produit_id: [(rating_points(value_delta), rated_at)]})
+
+
+def refresh_popularity(batch_size=1000):
+    """Recalcule tous les scores à partir des commandes et notes des dernières demi-vies."""
+    from cart.models import OrderItem
+    from .rollups import EXCLUDED_STATUSES
+
+    now = timezone.now()
+    since = now - timedelta(seconds=HORIZON_HALF_LIVES * _half_life_seconds())
+    scores = defaultdict(float)
+    sales = (
+        OrderItem.objects.filter(order__created_at__gte=since)
+        .exclude(order__status__in=EXCLUDED_STATUSES)
+        .values_list('produit_id', 'quantite', 'order__created_at')
+    )
+    for produit_id, quantite, ordered_at in sales.iterator(chunk_size=batch_size):
+        scores[produit_id] += order_points(quantite) * decay(now - ordered_at)
+    ratings = Rating.objects.filter(created_at__gte=since).values_list('produit_id', 'value', 'created_at')
+    for produit_id, value, rated_at in ratings.iterator(chunk_size=batch_size):
+        scores[produit_id] += rating_points(value) * decay(now - rated_at)
+
+    updated = 0
+    with transaction.atomic():
+        Produit.objects.update(popularity_score=NO_SCORE, popularity_updated_at=now)
+        produits = list(
+            Produit.objects.filter(pk__in=list(scores))
+            .only('id', 'popularity_score', 'popularity_updated_at', 'boutique_id', 'category_produit_id')
+        )
+        for produit in produits:
+            produit.popularity_score = stored_score(scores[produit.pk], now)
+            produit.popularity_updated_at = now
+        updated = Produit.objects.bulk_update(produits, ['popularity_score', 'popularity_updated_at'], batch_size=batch_size)
+
+    if leaderboards_enabled():
+        rebuild_leaderboards()
+    logger.info(f"Popularity refreshed for {updated} produits")
+    return updated
+
+
+def rebuild_leaderboards():
+    connection = get_redis_connection('default')
+    keys = list(connection.scan_iter(match='popularity:*'))
+    if keys:
+        connection.delete(*keys)
+    produits = Produit.objects.exclude(popularity_score=NO_SCORE).only(
+        'id', 'popularity_score', 'boutique_id', 'category_produit_id'
+    )
+    _push_leaderboards(list(produits.iterator()))
+
+
+def top_product_ids(boutique_id=None, category_produit_id=None, limit=8):
+    """Ids des produits les plus populaires lus dans Redis, ou None si indisponible."""
+    if not leaderboards_enabled():
+        return None
+    key = category_key(category_produit_id) if category_produit_id else boutique_key(boutique_id)
+    try:
+        return [int(pk) for pk in get_redis_connection('default').zrevrange(key, 0, limit - 1)]
+    except Exception as e:
+        logger.error(f"Error reading popularity leaderboard {key}: {str(e)}")
+        return None
@@ -0,0 +1,184 @@
+# boutique/query_planner.py
+"""
+Planification des querysets à partir des serializers.
+
+Inspecte les champs (et serializers imbriqués) d'un serializer DRF et applique
+les select_related / prefetch_related / only() correspondants, pour que la
+sérialisation d'une liste coûte un nombre constant de requêtes.
+
+Un serializer peut compléter le plan via ``Meta.related_hints`` : chemins
+relatifs à son modèle, utiles quand un ``__str__`` (StringRelatedField)
+traverse d'autres relations, ex. ``('marchand__user',)``.
+"""
+from functools import lru_cache
+import logging
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+
+logger = logging.getLogger(__name__)
+
+
+class QueryPlan:
+    def __init__(self):
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.only = set()
+        # Chemins dont le modèle doit être chargé en entier ('' = modèle racine) :
+        # un niveau y est ajouté dès qu'il lit des attributs qu'on ne sait pas déduire
+        self.unrestricted = set()
+
+    def columns(self):
+        if '' in self.unrestricted:
+            return []
+        columns = []
+        for path in self.only:
+            parts = path.split('__')
+            ancestors = ('__'.join(parts[:i]) for i in range(1, len(parts)))
+            if not any(ancestor in self.unrestricted for ancestor in ancestors):
+                columns.append(path)
+        return sorted(columns)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        columns = self.columns()
+        if columns:
+            queryset = queryset.only(*columns)
+        return queryset
+
+
+def _join(prefix, name):
+    return f"{prefix}__{name}" if prefix else name
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _walk_source(model, source):
+    """Résout 'a.b.c' en (liste des relations traversées, modèle final, dernier attribut)."""
+    parts = source.split('.')
+    relations = []
+    for part in parts[:-1]:
+        field = _model_field(model, part)
+        if field is None or not field.is_relation or field.many_to_many or field.one_to_many:
+            return None, None, None
+        relations.append(part)
+        model = field.related_model
+    return relations, model, parts[-1]
+
+
+def _plan_serializer(serializer, model, plan, prefix='', prefetched=False):
+    """
+    Remplit ``plan`` pour ``serializer`` dont les objets sont des instances de ``model``
+    atteintes par le chemin ``prefix``. Sous un prefetch, toute relation est préchargée
+    par prefetch_related (select_related ne peut pas traverser un prefetch) et only()
+    ne s'applique plus : ces niveaux sont chargés en entier.
+    """
+    def add_column(path):
+        if not prefetched:
+            plan.only.add(path)
+
+    def add_relation(path):
+        (plan.prefetch_related if prefetched else plan.select_related).add(path)
+
+    add_column(_join(prefix, model._meta.pk.name))
+
+    meta = getattr(serializer, 'Meta', None)
+    for hint in getattr(meta, 'related_hints', ()):
+        add_relation(_join(prefix, hint))
+
+    for field_name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            # Convention du projet : get_image lit obj.image, get_logo lit obj.logo...
+            model_field = _model_field(model, field_name)
+            if model_field is None or model_field.is_relation:
+                plan.unrestricted.add(prefix)
+            else:
+                add_column(_join(prefix, field_name))
+            continue
+        source = field.source
+        if source == '*':
+            if isinstance(field, serializers.BaseSerializer):
+                _plan_serializer(field, model, plan, prefix, prefetched)
+            continue
+
+        relations, target_model, attr = _walk_source(model, source)
+        if relations is None:
+            # Propriété ou méthode du modèle : impossible de savoir ce qu'elle lit
+            plan.unrestricted.add(prefix)
+            continue
+        path = prefix
+        for relation in relations:
+            path = _join(path, relation)
+            add_column(path)
+            add_relation(path)
+
+        model_field = _model_field(target_model, attr)
+        attr_path = _join(path, attr)
+
+        if isinstance(field, (serializers.ListSerializer, ManyRelatedField)):
+            if model_field is None or not model_field.is_relation:
+                plan.unrestricted.add(prefix)
+                continue
+            plan.prefetch_related.add(attr_path)
+            child = field.child if isinstance(field, serializers.ListSerializer) else None
+            if child is not None:
+                _plan_serializer(child, model_field.related_model, plan, attr_path, prefetched=True)
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            if model_field is None or not model_field.is_relation:
+                plan.unrestricted.add(prefix)
+                continue
+            add_column(attr_path)
+            add_relation(attr_path)
+            _plan_serializer(field, model_field.related_model, plan, attr_path, prefetched)
+            continue
+
+        if isinstance(field, PrimaryKeyRelatedField):
+            # La valeur vient de la colonne <fk>_id, aucune jointure nécessaire
+            if model_field is not None:
+                add_column(attr_path)
+            continue
+
+        if isinstance(field, RelatedField):
+            # StringRelatedField, SlugRelatedField... : l'objet lié est chargé en entier
+            if model_field is None or not model_field.is_relation:
+                plan.unrestricted.add(prefix)
+                continue
+            add_column(attr_path)
+            add_relation(attr_path)
+            plan.unrestricted.add(attr_path)
+            continue
+
+        if model_field is None or model_field.many_to_many or model_field.one_to_many:
+            plan.unrestricted.add(prefix)
+            continue
+        add_column(attr_path)
+
+
+@lru_cache(maxsize=None)
+def build_plan(serializer_class):
+    serializer = serializer_class(context={})
+    plan = QueryPlan()
+    _plan_serializer(serializer, serializer_class.Meta.model, plan)
+    logger.debug(
+        f"Query plan for {serializer_class.__name__}: select_related={sorted(plan.select_related)}, "
+        f"prefetch_related={sorted(plan.prefetch_related)}, only={plan.columns() or 'all'}"
+    )
+    return plan
+
+
+def plan_queryset(queryset, serializer_class):
+    """Applique au queryset le plan de chargement déduit de ``serializer_class``."""
+    return build_plan(serializer_class).apply(queryset)
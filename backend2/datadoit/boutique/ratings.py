@@ -0,0 +1,89 @@
+# boutique/ratings.py
+"""
+Compteurs de notes dénormalisés.
+
+Produit et Marchand portent ``rating_count`` / ``rating_sum`` ; chaque création,
+modification ou suppression de Rating les ajuste par un UPDATE atomique (F())
+qui recalcule aussi ``average_rating`` : le coût d'une note ne dépend plus du
+nombre d'avis existants. Le marchand d'un produit est celui de sa boutique
+(à défaut, Produit.marchand). ``reconcile_ratings`` recalcule tout depuis la
+table des notes (commande ``reconcile_ratings``).
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+
+from users.models import Marchand
+from .cache import bump_boutiques, bump_catalog_version
+from .models import Produit, Rating
+
+logger = logging.getLogger(__name__)
+
+
+def _average(delta_sum=0, delta_count=0):
+    """average_rating après application des deltas (0.0 s'il ne reste aucune note)."""
+    return Case(
+        When(rating_count__lte=-delta_count, then=Value(0.0)),
+        default=Round(
+            Cast(F('rating_sum') + delta_sum, FloatField()) / Cast(F('rating_count') + delta_count, FloatField()),
+            1,
+        ),
+        output_field=FloatField(),
+    )
+
+
+def _increments(delta_sum, delta_count):
+    return {
+        'rating_count': F('rating_count') + delta_count,
+        'rating_sum': F('rating_sum') + delta_sum,
+        'average_rating': _average(delta_sum, delta_count),
+    }
+
+
+def apply_rating_delta(produit_id, delta_sum, delta_count):
+    """Deux UPDATE, quel que soit le nombre de notes du produit."""
+    if not delta_sum and not delta_count:
+        return
+    Produit.objects.filter(pk=produit_id).update(**_increments(delta_sum, delta_count))
+    marchand_id = Produit.objects.filter(pk=produit_id).values(
+        owner=Coalesce('boutique__marchand_id', 'marchand_id')
+    )
+    Marchand.objects.filter(pk=Subquery(marchand_id[:1])).update(**_increments(delta_sum, delta_count))
+    # Les UPDATE ne déclenchent pas les signaux du catalogue : average_rating est affiché sur
+    # les pages de la boutique ; les listes transverses le rattrapent à l'expiration de leurs entrées
+    boutique_ids = list(Produit.objects.filter(pk=produit_id).values_list('boutique_id', flat=True))
+    transaction.on_commit(lambda: bump_boutiques(boutique_ids))
+
+
+def _count(ratings):
+    return Subquery(ratings.order_by().annotate(n=Func('id', function='COUNT')).values('n'), output_field=IntegerField())
+
+
+def _sum(ratings):
+    return Coalesce(
+        Subquery(ratings.order_by().annotate(s=Func('value', function='SUM')).values('s'), output_field=IntegerField()),
+        0,
+    )
+
+
+@transaction.atomic
+def reconcile_ratings():
+    """Recalcule compteurs et moyennes depuis la table ratings. Retourne (produits, marchands) corrigés."""
+    produit_ratings = Rating.objects.filter(produit=OuterRef('pk'))
+    marchand_ratings = Rating.objects.filter(
+        Q(produit__boutique__marchand=OuterRef('pk')) |
+        Q(produit__boutique__isnull=True, produit__marchand=OuterRef('pk'))
+    )
+    fixed = []
+    for model, ratings in ((Produit, produit_ratings), (Marchand, marchand_ratings)):
+        drifted = model.objects.annotate(
+            actual_count=_count(ratings), actual_sum=_sum(ratings)
+        ).filter(~Q(rating_count=F('actual_count')) | ~Q(rating_sum=F('actual_sum')))
+        fixed.append(drifted.count())
+        model.objects.update(rating_count=_count(ratings), rating_sum=_sum(ratings))
+        model.objects.update(average_rating=_average())
+    transaction.on_commit(bump_catalog_version)
+    logger.info(f"Ratings reconciled: {fixed[0]} produits, {fixed[1]} marchands corrected")
+    return tuple(fixed)
@@ -0,0 +1,185 @@
+# boutique/rollups.py
+"""
+Maintenance des agrégats du tableau de bord marchand.
+
+BoutiqueDailyStats, ProduitDailyStats et BoutiqueCustomerStats sont mis à jour
+par incréments (lignes verrouillées puis bulk_update) dans la transaction qui
+crée la commande (checkout) ou qui change son statut (update_order_status).
+Une commande annulée n'est pas comptée. ``rebuild_stats`` recalcule tout
+depuis l'historique (commande ``rebuild_dashboard_stats``).
+"""
+from collections import defaultdict
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from cart.models import OrderItem
+from .analytics import LINE_AMOUNT, date_bounds
+from .models import BoutiqueCustomerStats, BoutiqueDailyStats, ProduitDailyStats
+from .popularity import record_sales
+
+logger = logging.getLogger(__name__)
+
+EXCLUDED_STATUSES = ('cancelled',)
+
+
+def counts_in_stats(status):
+    return status not in EXCLUDED_STATUSES
+
+
+def _bump_many(model, key_field, deltas, common, defaults=None):
+    """
+    Ajoute ``deltas[clé][champ]`` aux lignes ``model(**common, key_field=clé)`` en trois
+    requêtes quel que soit le nombre de clés : création des lignes manquantes (les
+    conflits sont ignorés), verrouillage, puis un seul bulk_update.
+    """
+    defaults = defaults or {}
+    model.objects.bulk_create(
+        [model(**common, **{key_field: key}, **defaults.get(key, {})) for key in deltas],
+        ignore_conflicts=True,
+    )
+    rows = list(
+        model.objects.select_for_update()
+        .filter(**common, **{f'{key_field}__in': list(deltas)})
+        .order_by('pk')
+    )
+    fields = set()
+    for row in rows:
+        for field, delta in deltas[getattr(row, key_field)].items():
+            setattr(row, field, getattr(row, field) + delta)
+            fields.add(field)
+    if fields:
+        model.objects.bulk_update(rows, sorted(fields))
+
+
+def apply_order(order, sign=1):
+    """
+    Ajoute (sign=1) ou retire (sign=-1) ``order`` des agrégats de chaque boutique
+    concernée. Doit être appelée dans la transaction qui modifie la commande ;
+    le nombre de requêtes ne dépend pas du nombre de lignes.
+    """
+    day = timezone.localdate(order.created_at)
+    lines = OrderItem.objects.filter(order=order, produit__boutique__isnull=False).values_list(
+        'produit_id', 'produit__boutique_id', 'prix', 'quantite'
+    )
+
+    boutiques = defaultdict(lambda: {'revenue': Decimal('0'), 'order_count': sign, 'customer_count': sign, 'units_sold': 0})
+    produits = defaultdict(lambda: {'units_sold': 0, 'revenue': Decimal('0')})
+    produit_boutique = {}
+    for produit_id, boutique_id, prix, quantite in lines:
+        amount = sign * prix * quantite
+        boutiques[boutique_id]['revenue'] += amount
+        boutiques[boutique_id]['units_sold'] += sign * quantite
+        produits[produit_id]['units_sold'] += sign * quantite
+        produits[produit_id]['revenue'] += amount
+        produit_boutique[produit_id] = {'boutique_id': boutique_id}
+    if not boutiques:
+        return
+
+    # Le client n'est compté qu'une fois par jour et par boutique
+    day_start, day_end = date_bounds(day, day)
+    seen_today = set(
+        OrderItem.objects.filter(
+            order__client_id=order.client_id,
+            order__created_at__gte=day_start,
+            order__created_at__lt=day_end,
+            produit__boutique_id__in=list(boutiques),
+        ).exclude(order_id=order.pk).exclude(order__status__in=EXCLUDED_STATUSES)
+        .values_list('produit__boutique_id', flat=True).distinct()
+    )
+    for boutique_id in seen_today:
+        boutiques[boutique_id]['customer_count'] = 0
+
+    # Popularité des produits : même événement, même transaction
+    record_sales({produit_id: totals['units_sold'] for produit_id, totals in produits.items()}, order.created_at)
+
+    _bump_many(BoutiqueDailyStats, 'boutique_id', boutiques, {'date': day})
+    _bump_many(ProduitDailyStats, 'produit_id', produits, {'date': day}, defaults=produit_boutique)
+    _bump_many(
+        BoutiqueCustomerStats, 'boutique_id',
+        {boutique_id: {'order_count': sign, 'total_spent': totals['revenue']} for boutique_id, totals in boutiques.items()},
+        {'client_id': order.client_id},
+    )
+
+
+def record_order(order):
+    if counts_in_stats(order.status):
+        apply_order(order, sign=1)
+
+
+def record_status_change(order, previous_status):
+    """À appeler après le changement de statut, dans la même transaction."""
+    was_counted = counts_in_stats(previous_status)
+    is_counted = counts_in_stats(order.status)
+    if was_counted and not is_counted:
+        apply_order(order, sign=-1)
+    elif is_counted and not was_counted:
+        apply_order(order, sign=1)
+
+
+@transaction.atomic
+def rebuild_stats(boutique_ids=None, batch_size=1000):
+    """Recalcule les agrégats depuis les commandes (toutes les boutiques par défaut)."""
+    stats_models = (BoutiqueDailyStats, ProduitDailyStats, BoutiqueCustomerStats)
+    lines = OrderItem.objects.filter(produit__boutique__isnull=False).exclude(order__status__in=EXCLUDED_STATUSES)
+    if boutique_ids is not None:
+        lines = lines.filter(produit__boutique_id__in=boutique_ids)
+        for model in stats_models:
+            model.objects.filter(boutique_id__in=boutique_ids).delete()
+    else:
+        for model in stats_models:
+            model.objects.all().delete()
+
+    lines = lines.annotate(day=TruncDate('order__created_at')).order_by()
+
+    daily = lines.values('produit__boutique_id', 'day').annotate(
+        revenue=Sum(LINE_AMOUNT),
+        orders=Count('order_id', distinct=True),
+        customers=Count('order__client_id', distinct=True),
+        units=Sum('quantite'),
+    )
+    BoutiqueDailyStats.objects.bulk_create(
+        (
+            BoutiqueDailyStats(
+                boutique_id=row['produit__boutique_id'], date=row['day'], revenue=row['revenue'],
+                order_count=row['orders'], customer_count=row['customers'], units_sold=row['units'],
+            )
+            for row in daily.iterator()
+        ),
+        batch_size=batch_size,
+    )
+
+    per_product = lines.values('produit_id', 'produit__boutique_id', 'day').annotate(
+        units=Sum('quantite'),
+        revenue=Sum(LINE_AMOUNT),
+    )
+    ProduitDailyStats.objects.bulk_create(
+        (
+            ProduitDailyStats(
+                produit_id=row['produit_id'], boutique_id=row['produit__boutique_id'], date=row['day'],
+                units_sold=row['units'], revenue=row['revenue'],
+            )
+            for row in per_product.iterator()
+        ),
+        batch_size=batch_size,
+    )
+
+    customers = lines.values('produit__boutique_id', 'order__client_id').annotate(
+        orders=Count('order_id', distinct=True),
+        spent=Sum(LINE_AMOUNT),
+    )
+    BoutiqueCustomerStats.objects.bulk_create(
+        (
+            BoutiqueCustomerStats(
+                boutique_id=row['produit__boutique_id'], client_id=row['order__client_id'],
+                order_count=row['orders'], total_spent=row['spent'],
+            )
+            for row in customers.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    logger.info(f"Dashboard stats rebuilt for {'all boutiques' if boutique_ids is None else boutique_ids}")
@@ -0,0 +1,200 @@
+# boutique/search.py
+"""
+Recherche dans le catalogue public (``/boutique/search/``).
+
+  - ``q`` est cherché dans ``nom`` (poids A) et ``description`` (poids B) :
+    sur PostgreSQL par ``websearch_to_tsquery`` classé par ``ts_rank``, servi
+    par l'index GIN de la migration boutique 0016 ; si aucun mot ne correspond
+    (mot partiel, faute de frappe), repli sur ``icontains`` classé par
+    similarité trigramme, servi par les index GIN ``UPPER(...) gin_trgm_ops``.
+    Les autres bases (développement) n'utilisent que ``icontains`` ;
+  - filtres : catégorie, boutique, couleur, taille, prix effectif
+    (``prix_reduit`` s'il existe, sinon ``prix``), promotion, stock ;
+  - facettes (catégories, boutiques, couleurs, tailles, tranches de prix,
+    stock) calculées en une seule requête : les produits retenus sont
+    matérialisés une fois (CTE) puis regroupés par facette.
+"""
+from decimal import Decimal, InvalidOperation
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Boutique, CategoryProduit
+
+logger = logging.getLogger(__name__)
+
+# Doit rester identique à l'expression indexée par la migration boutique 0016
+TS_CONFIG = 'simple'
+MAX_QUERY_LENGTH = 100
+
+FULL_TEXT = 'fts'
+SUBSTRING = 'substring'
+
+# tri -> (champ de la clé de pagination, décroissant)
+SORTS = {
+    'relevance': ('rank', True),
+    'popularity': ('popularity_score', True),
+    'newest': ('created_at', True),
+    'price_asc': ('prix_effectif', False),
+    'price_desc': ('prix_effectif', True),
+}
+
+FACET_COLUMNS = ('category_produit_id', 'boutique_id', 'couleur', 'taille', 'en_stock')
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('nom', weight='A', config=TS_CONFIG)
+        + SearchVector('description', weight='B', config=TS_CONFIG)
+    )
+
+
+def _int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    if not value.isdigit():
+        raise ValueError(f"{name} doit être un entier")
+    return int(value)
+
+
+def _decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"{name} doit être un nombre")
+
+
+def _flag(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    return value.lower() in ('1', 'true', 'oui')
+
+
+def parse_filters(params):
+    """Paramètres de requête -> filtres ; lève ValueError si l'un d'eux est invalide."""
+    filters = {
+        'q': (params.get('q') or '').strip()[:MAX_QUERY_LENGTH],
+        'category_id': _int(params, 'category_id'),
+        'boutique_id': _int(params, 'boutique_id'),
+        'couleur': params.get('couleur') or None,
+        'taille': params.get('taille') or None,
+        'prix_min': _decimal(params, 'prix_min'),
+        'prix_max': _decimal(params, 'prix_max'),
+        'promo': _flag(params, 'promo'),
+        'en_stock': _flag(params, 'en_stock'),
+        'sort': params.get('sort') or ('relevance' if params.get('q') else 'popularity'),
+    }
+    if filters['sort'] not in SORTS:
+        raise ValueError(f"sort doit être l'un de : {', '.join(SORTS)}")
+    if filters['sort'] == 'relevance' and not filters['q']:
+        filters['sort'] = 'popularity'
+    return filters
+
+
+def filter_products(queryset, filters):
+    queryset = queryset.annotate(prix_effectif=Coalesce('prix_reduit', 'prix'))
+    if filters['category_id'] is not None:
+        queryset = queryset.filter(category_produit_id=filters['category_id'])
+    if filters['boutique_id'] is not None:
+        queryset = queryset.filter(boutique_id=filters['boutique_id'])
+    if filters['couleur']:
+        queryset = queryset.filter(couleur__iexact=filters['couleur'])
+    if filters['taille']:
+        queryset = queryset.filter(taille__iexact=filters['taille'])
+    if filters['prix_min'] is not None:
+        queryset = queryset.filter(prix_effectif__gte=filters['prix_min'])
+    if filters['prix_max'] is not None:
+        queryset = queryset.filter(prix_effectif__lte=filters['prix_max'])
+    if filters['promo'] is not None:
+        queryset = queryset.filter(prix_reduit__isnull=not filters['promo'])
+    if filters['en_stock'] is not None:
+        queryset = queryset.filter(en_stock=filters['en_stock'])
+    return queryset
+
+
+def match_products(queryset, query):
+    """(queryset restreint à ``query`` et annoté de ``rank``, mode utilisé)."""
+    substring = queryset.filter(Q(nom__icontains=query) | Q(description__icontains=query))
+    if connection.vendor != 'postgresql':
+        # Sans plein texte : un produit dont le nom correspond passe avant ceux trouvés par la description
+        rank = Case(When(nom__icontains=query, then=Value(2.0)), default=Value(1.0), output_field=FloatField())
+        return substring.annotate(rank=rank), SUBSTRING
+
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+    search_query = SearchQuery(query, config=TS_CONFIG, search_type='websearch')
+    matched = queryset.annotate(document=search_vector()).filter(document=search_query)
+    if matched.exists():
+        # float8 : le rang relu depuis le curseur doit être égal, au bit près, à celui recalculé
+        return matched.annotate(rank=Cast(SearchRank(F('document'), search_query), FloatField())), FULL_TEXT
+    return substring.annotate(rank=Cast(TrigramSimilarity('nom', query), FloatField())), SUBSTRING
+
+
+def _price_ranges():
+    bounds = [0, *settings.CATALOG_SEARCH_PRICE_BUCKETS]
+    return [
+        {'min': low, 'max': high}
+        for low, high in zip(bounds, bounds[1:] + [None])
+    ]
+
+
+def facet_counts(queryset):
+    """Compteurs de chaque facette pour les produits de ``queryset``, en une requête."""
+    base = queryset.order_by().values(*FACET_COLUMNS, price=Coalesce('prix_reduit', 'prix'))
+    sql, params = base.query.sql_with_params()
+    branches = [
+        f"SELECT '{column}', CAST({column} AS VARCHAR(255)), COUNT(*) FROM matched "
+        f"WHERE {column} IS NOT NULL GROUP BY {column}"
+        for column in FACET_COLUMNS
+    ]
+    bounds = settings.CATALOG_SEARCH_PRICE_BUCKETS
+    bucket = ' '.join(f"WHEN price < %s THEN {index}" for index in range(len(bounds)))
+    branches.append(
+        f"SELECT 'price', CAST(CASE {bucket} ELSE {len(bounds)} END AS VARCHAR(255)), COUNT(*) FROM matched GROUP BY 2"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH matched ({', '.join(FACET_COLUMNS)}, price) AS MATERIALIZED ({sql}) "
+            + " UNION ALL ".join(branches),
+            [*params, *bounds],
+        )
+        rows = cursor.fetchall()
+
+    counts = {column: {} for column in (*FACET_COLUMNS, 'price')}
+    for facet, value, count in rows:
+        counts[facet][value] = count
+    limit = settings.CATALOG_SEARCH_FACET_LIMIT
+
+    def top(values):
+        return sorted(values.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    categories = top(counts['category_produit_id'])
+    boutiques = top(counts['boutique_id'])
+    category_names = dict(
+        CategoryProduit.objects.filter(pk__in=[int(pk) for pk, _ in categories]).values_list('pk', 'nom')
+    )
+    boutique_names = dict(Boutique.objects.filter(pk__in=[int(pk) for pk, _ in boutiques]).values_list('pk', 'nom'))
+    in_stock = {value in ('1', 'true', 't'): count for value, count in counts['en_stock'].items()}
+    return {
+        'categories': [
+            {'id': int(pk), 'nom': category_names.get(int(pk)), 'count': count} for pk, count in categories
+        ],
+        'boutiques': [{'id': int(pk), 'nom': boutique_names.get(int(pk)), 'count': count} for pk, count in boutiques],
+        'couleurs': [{'value': value, 'count': count} for value, count in top(counts['couleur'])],
+        'tailles': [{'value': value, 'count': count} for value, count in top(counts['taille'])],
+        'prix': [
+            {**price_range, 'count': counts['price'].get(str(index), 0)}
+            for index, price_range in enumerate(_price_ranges())
+        ],
+        'en_stock': {'true': in_stock.get(True, 0), 'false': in_stock.get(False, 0)},
+    }
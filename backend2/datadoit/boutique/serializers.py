@@ -18,9 +18,8 @@ class CategoryBoutiqueSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_image(self, obj):
-        # Refresh from database to ensure latest state
-        obj.refresh_from_db()
-        logger.debug(f"CategoryBoutique {obj.nom} (id: {obj.id}) refreshed, image: {obj.image}")
+        # Pas de refresh_from_db ici : create/update rechargent déjà l'instance,
+        # et un refresh par objet coûterait une requête par ligne dans les listes
         if not obj.image:
             logger.debug(f"CategoryBoutique {obj.nom} (id: {obj.id}) has no image, raw value: {obj.image}")
             return None
@@ -138,6 +137,8 @@ class BoutiqueSerializer(serializers.ModelSerializer):
             'image', 'image_input', 'category_boutique', 'marchand', 'created_at', 'updated_at'
         ]
         read_only_fields = ['marchand', 'created_at', 'updated_at']
+        # Marchand.__str__ lit marchand.user (voir boutique/query_planner.py)
+        related_hints = ('marchand__user',)
 
     def get_logo(self, obj):
         if not obj.logo:
@@ -530,9 +531,8 @@ class RatingSerializer(serializers.ModelSerializer):
                     user=request.user,
                     value=validated_data['value']
                 )
-                # Update product's average_rating
-                produit.calculate_average_rating()
-                logger.info(f"Note créée: produit_id={produit_id}, user={request.user.nom}, value={rating.value}, new_average={produit.average_rating}")
+                # Compteurs et average_rating mis à jour par Rating.save
+                logger.info(f"Note créée: produit_id={produit_id}, user={request.user.nom}, value={rating.value}")
             return rating
         except Exception as e:
             logger.error(f"Erreur lors de la création de la note pour produit_id={produit_id}: {str(e)}")
@@ -587,6 +587,7 @@ class DashboardOverviewSerializer(serializers.Serializer):
 
 class MonthlySalesSerializer(serializers.Serializer):
     month = serializers.CharField()
+    period = serializers.DateField()
     sales = serializers.DecimalField(max_digits=10, decimal_places=2)
 
 class ProductsByCategorySerializer(serializers.Serializer):
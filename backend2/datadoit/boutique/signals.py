@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import BOUTIQUES_SCOPE, CATEGORIES_SCOPE, PRODUCTS_SCOPE, bump_boutiques, bump_catalog_version
+from .models import Boutique, CategoryBoutique, CategoryProduit, Produit, Rating
+from .popularity import record_rating
+from .ratings import apply_rating_delta
+
+# Colonnes absentes des réponses du catalogue : les écrire n'invalide rien
+UNCACHED_PRODUIT_FIELDS = {'popularity_score', 'popularity_updated_at', 'rating_count', 'rating_sum'}
+
+
+def _on_commit_bump(boutique_ids, *scopes):
+    # Portées calculées tout de suite : après un delete, instance.pk vaut None au commit
+    boutique_ids = list(boutique_ids)
+    transaction.on_commit(lambda: bump_boutiques(boutique_ids, *scopes))
+
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+@receiver(post_save, sender=CategoryProduit)
+@receiver(post_delete, sender=CategoryProduit)
+def invalidate_boutique_catalog(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= UNCACHED_PRODUIT_FIELDS:
+        return
+    _on_commit_bump([instance.boutique_id], PRODUCTS_SCOPE)
+
+
+@receiver(post_save, sender=Boutique)
+@receiver(post_delete, sender=Boutique)
+def invalidate_boutique(sender, instance, **kwargs):
+    # Les produits embarquent boutique_details : les listes de produits sont aussi touchées
+    _on_commit_bump([instance.pk], BOUTIQUES_SCOPE, PRODUCTS_SCOPE)
+
+
+@receiver(post_save, sender=CategoryBoutique)
+@receiver(post_delete, sender=CategoryBoutique)
+def invalidate_boutique_categories(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_catalog_version(CATEGORIES_SCOPE, BOUTIQUES_SCOPE))
+
+
+@receiver(post_delete, sender=Rating)
+def decrement_rating_counters(sender, instance, **kwargs):
+    apply_rating_delta(instance.produit_id, -instance.value, -1)
+    record_rating(instance.produit_id, -instance.value, instance.created_at)
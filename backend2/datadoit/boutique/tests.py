@@ -1,3 +1,343 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.services import place_order
+from users.models import Client, Marchand, User
+from .models import Boutique, BoutiqueCustomerStats, BoutiqueDailyStats, CategoryBoutique, CategoryProduit, Produit, ProduitDailyStats
+from .popularity import NO_SCORE, current_score, record_sales, refresh_popularity
+from .rollups import rebuild_stats
+
+SHIPPING = {'firstName': 'a', 'lastName': 'b', 'email': 'a@b.c', 'telephone': '1', 'adresse': 'x'}
+
+
+def make_marchand(email='marchand@example.com'):
+    user = User.objects.create_user(email=email, password=None, nom='Nom', prenom='Prenom', telephone='1', role='marchand')
+    return Marchand.objects.select_related('user').get(user=user)
+
+
+def make_client(email='client@example.com'):
+    user = User.objects.create_user(email=email, password=None, nom='Nom', prenom='Prenom', telephone='1', role='client')
+    return Client.objects.get(user=user)
+
+
+def make_catalog(boutiques, produits, categorie=None, approved=True):
+    """``boutiques`` boutiques de ``produits`` produits chacune, avec leur marchand et une catégorie produit."""
+    categorie = categorie or CategoryBoutique.objects.create(nom='Mode')
+    created = []
+    for index in range(boutiques):
+        marchand = make_marchand(f'marchand{Boutique.objects.count()}-{index}@example.com')
+        boutique = Boutique.objects.create(
+            nom=f'Boutique {index}', marchand=marchand, category_boutique=categorie, is_approved=approved
+        )
+        category_produit = CategoryProduit.objects.create(nom='Robes', boutique=boutique)
+        Produit.objects.bulk_create(
+            Produit(nom=f'Produit {n}', prix=10, stock=5, boutique=boutique, category_produit=category_produit, marchand=marchand)
+            for n in range(produits)
+        )
+        created.append(boutique)
+    return created
+
+
+class AllBoutiquesPaginationTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+
+    def test_page_number_response(self):
+        boutiques = make_catalog(12, 0)
+        make_catalog(3, 0, approved=False)
+        response = self.api.get('/boutique/boutiquesall/', {'page': 2, 'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(response.data['total_pages'], 3)
+        self.assertEqual(response.data['current_page'], 2)
+        expected = [boutique.id for boutique in reversed(boutiques)][5:10]
+        self.assertEqual([boutique['id'] for boutique in response.data['boutiques']], expected)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.boutique, self.other = make_catalog(2, 2)
+
+    def get_details(self, boutique):
+        return self.api.get(f'/boutique/boutiques/{boutique.id}/details/')
+
+    def assertCached(self, boutique):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_details(boutique).status_code, 200)
+
+    def test_product_change_invalidates_only_its_boutique(self):
+        self.get_details(self.boutique)
+        self.get_details(self.other)
+        produit = self.boutique.produits.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.nom = 'Renommé'
+            produit.save()
+        self.assertIn('Renommé', [p['nom'] for p in self.get_details(self.boutique).data['products']])
+        self.assertCached(self.other)
+
+    def test_deleted_product_invalidates_its_boutique(self):
+        self.get_details(self.boutique)
+        produit = self.boutique.produits.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.delete()
+        self.assertNotIn(produit.id, [p['id'] for p in self.get_details(self.boutique).data['products']])
+
+    def test_checkout_invalidates_only_the_sold_boutique(self):
+        self.get_details(self.boutique)
+        self.get_details(self.other)
+        self.api.get('/boutique/produits/new/')
+        produit = self.boutique.produits.first()
+        client = make_client()
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(client, SHIPPING, [{'produit_id': produit.id, 'quantite': 1, 'prix': '10'}], '10')
+        stocks = {p['id']: p['stock'] for p in self.get_details(self.boutique).data['products']}
+        self.assertEqual(stocks[produit.id], 4)
+        self.assertCached(self.other)
+        with self.assertNumQueries(0):
+            self.api.get('/boutique/produits/new/')
+
+    def test_uncached_counters_do_not_invalidate(self):
+        self.get_details(self.boutique)
+        produit = self.boutique.produits.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.popularity_score = 3.0
+            produit.save(update_fields=['popularity_score'])
+        self.assertCached(self.boutique)
+
+    def test_not_modified_with_etag(self):
+        etag = self.get_details(self.boutique)['ETag']
+        response = self.api.get(f'/boutique/boutiques/{self.boutique.id}/details/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class QueryPlanTests(TestCase):
+    """Le nombre de requêtes des listes ne dépend pas de la taille du catalogue (boutique/query_planner.py)."""
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.categorie = CategoryBoutique.objects.create(nom='Mode')
+
+    def assertConstantQueries(self, get):
+        """Compte les requêtes de ``get`` sur un petit catalogue, puis exige le même compte sur un catalogue 5x plus grand."""
+        boutique = make_catalog(1, 2, categorie=self.categorie)[0]
+        with CaptureQueriesContext(connection) as small:
+            response = get(boutique)
+        self.assertEqual(response.status_code, 200, response.data)
+        make_catalog(4, 10, categorie=self.categorie)
+        Produit.objects.bulk_create(
+            Produit(nom='Produit', prix=10, boutique=boutique, category_produit=boutique.categories_produits.first(), marchand=boutique.marchand)
+            for _ in range(10)
+        )
+        CategoryBoutique.objects.bulk_create(CategoryBoutique(nom=f'Catégorie {n}') for n in range(5))
+        CategoryProduit.objects.bulk_create(CategoryProduit(nom=f'Catégorie {n}', boutique=boutique) for n in range(5))
+        cache.clear()
+        with self.assertNumQueries(len(small)):
+            response = get(boutique)
+        self.assertEqual(response.status_code, 200)
+
+    def test_all_boutiques(self):
+        self.assertConstantQueries(lambda boutique: self.api.get('/boutique/boutiquesall/', {'page_size': 100}))
+
+    def test_all_boutiques_page_number(self):
+        self.assertConstantQueries(lambda boutique: self.api.get('/boutique/boutiquesall/', {'page': 1, 'page_size': 100}))
+
+    def test_category_boutique_list(self):
+        self.assertConstantQueries(lambda boutique: self.api.get('/boutique/category_boutiques/'))
+
+    def test_boutiques_by_category(self):
+        self.assertConstantQueries(
+            lambda boutique: self.api.get(f'/boutique/category_boutiques/{self.categorie.id}/boutiques/')
+        )
+
+    def test_boutique_detail_public(self):
+        self.assertConstantQueries(lambda boutique: self.api.get(f'/boutique/boutiques/{boutique.id}/details/'))
+
+    def test_category_produit_list(self):
+        def get(boutique):
+            self.api.force_authenticate(boutique.marchand.user)
+            return self.api.get('/boutique/category-produits/', {'boutique_id': boutique.id})
+        self.assertConstantQueries(get)
+
+
+class DashboardRollupTests(TestCase):
+    """Les agrégats incrémentaux (boutique/rollups.py) restent égaux à un recalcul complet."""
+
+    def setUp(self):
+        self.boutique, self.other = make_catalog(2, 2)
+        self.clients = [make_client(f'client{n}@example.com') for n in range(2)]
+
+    def order(self, client, lines):
+        return place_order(
+            client, SHIPPING,
+            [{'produit_id': produit.id, 'quantite': quantite, 'prix': str(produit.prix)} for produit, quantite in lines],
+            sum(produit.prix * quantite for produit, quantite in lines),
+        )
+
+    def snapshot(self):
+        return (
+            sorted(BoutiqueDailyStats.objects.values_list('boutique_id', 'date', 'revenue', 'order_count', 'customer_count', 'units_sold')),
+            sorted(ProduitDailyStats.objects.values_list('produit_id', 'date', 'units_sold', 'revenue')),
+            sorted(BoutiqueCustomerStats.objects.filter(order_count__gt=0).values_list('boutique_id', 'client_id', 'order_count', 'total_spent')),
+        )
+
+    def test_incremental_stats_match_rebuild(self):
+        a1, a2 = self.boutique.produits.all()
+        b1 = self.other.produits.first()
+        self.order(self.clients[0], [(a1, 2), (b1, 1)])
+        self.order(self.clients[0], [(a2, 1)])
+        cancelled = self.order(self.clients[1], [(a1, 1)])
+        api = APIClient()
+        self.assertEqual(api.patch(f'/cart/orders/{cancelled.id}/', {'status': 'cancelled'}, format='json').status_code, 200)
+
+        daily = BoutiqueDailyStats.objects.get(boutique=self.boutique)
+        self.assertEqual((daily.order_count, daily.customer_count, daily.units_sold, daily.revenue), (2, 1, 3, Decimal('30.00')))
+        incremental = self.snapshot()
+        rebuild_stats()
+        self.assertEqual(self.snapshot(), incremental)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        self.boutique = make_catalog(1, 3)[0]
+        self.produits = list(self.boutique.produits.order_by('pk'))
+
+    def popular_ids(self):
+        return [p['id'] for p in APIClient().get('/boutique/products/popular/', {'boutique_id': self.boutique.id}).data]
+
+    def test_idle_products_decay_without_refresh(self):
+        ancien, recent, _ = self.produits
+        past = timezone.now() - timedelta(days=60)
+        with mock.patch('boutique.popularity.timezone.now', return_value=past):
+            record_sales({ancien.id: 10}, past)
+        record_sales({recent.id: 1}, timezone.now())
+        # 10 articles il y a 60 jours (~4 demi-vies) pèsent moins qu'un article aujourd'hui
+        self.assertEqual(self.popular_ids()[:2], [recent.id, ancien.id])
+
+    def test_score_round_trip_and_cancellation(self):
+        produit = self.produits[0]
+        now = timezone.now()
+        record_sales({produit.id: 5}, now)
+        produit.refresh_from_db()
+        self.assertAlmostEqual(current_score(produit.popularity_score, timezone.now()), 5 * settings.POPULARITY_ORDER_WEIGHT, places=4)
+        record_sales({produit.id: -5}, now)
+        produit.refresh_from_db()
+        self.assertEqual(produit.popularity_score, NO_SCORE)
+
+    def test_refresh_matches_incremental_scores(self):
+        ordered = make_client()
+        place_order(ordered, SHIPPING, [{'produit_id': self.produits[1].id, 'quantite': 3, 'prix': '10'}], '30')
+        incremental = Produit.objects.get(pk=self.produits[1].id).popularity_score
+        refresh_popularity()
+        self.assertAlmostEqual(Produit.objects.get(pk=self.produits[1].id).popularity_score, incremental, places=4)
+        self.assertEqual(self.popular_ids()[0], self.produits[1].id)
+
+
+class CatalogSearchTests(TestCase):
+    # Prix effectif (prix_reduit, sinon prix) : 10, 30, 60, 15, 300, 700, 10, 30, 60, 15, 300, 700
+    PRIX = [10, 30, 60, 150, 300, 700] * 2
+    PROMO = {3: 15, 9: 15}
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(2, 6)
+        cls.produits = list(Produit.objects.order_by('pk'))
+        start = timezone.now() - timedelta(days=1)
+        for index, produit in enumerate(cls.produits):
+            values = {
+                'nom': f'Robe rouge {index}' if index % 2 == 0 else f'Chemise {index}',
+                'description': 'robe légère' if index == 1 else '',
+                'prix': Decimal(cls.PRIX[index]),
+                'prix_reduit': Decimal(cls.PROMO[index]) if index in cls.PROMO else None,
+                'couleur': 'Rouge' if index % 2 == 0 else 'Bleu',
+                'taille': 'M' if index < 4 else None,
+                'en_stock': index != 11,
+                # Égalités voulues : la clé de pagination départage par id
+                'popularity_score': float(index % 3),
+                'created_at': start + timedelta(minutes=index // 2),
+            }
+            Produit.objects.filter(pk=produit.pk).update(**values)
+            for field, value in values.items():
+                setattr(produit, field, value)
+
+    def setUp(self):
+        self.api = APIClient()
+
+    def search(self, **params):
+        response = self.api.get('/boutique/search/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, data):
+        return [produit['id'] for produit in data['produits']]
+
+    def effective(self, produit):
+        return produit.prix_reduit if produit.prix_reduit is not None else produit.prix
+
+    def test_facet_counts(self):
+        facets = self.search()['facets']
+        self.assertEqual(sorted(c['count'] for c in facets['categories']), [6, 6])
+        self.assertEqual(sorted(b['count'] for b in facets['boutiques']), [6, 6])
+        self.assertEqual(facets['couleurs'], [{'value': 'Bleu', 'count': 6}, {'value': 'Rouge', 'count': 6}])
+        self.assertEqual(facets['tailles'], [{'value': 'M', 'count': 4}])
+        self.assertEqual([bucket['count'] for bucket in facets['prix']], [4, 2, 2, 0, 2, 2])
+        self.assertEqual(facets['en_stock'], {'true': 11, 'false': 1})
+
+    def test_facets_follow_filters(self):
+        facets = self.search(couleur='rouge', en_stock=1)['facets']
+        self.assertEqual(facets['couleurs'], [{'value': 'Rouge', 'count': 6}])
+        self.assertEqual(facets['en_stock'], {'true': 6, 'false': 0})
+
+    def test_price_filters_use_reduced_price(self):
+        produits = self.produits
+        data = self.search(prix_min=15, prix_max=30, page_size=50)
+        self.assertEqual(sorted(self.ids(data)), [produits[i].pk for i in (1, 3, 7, 9)])
+        data = self.search(prix_min=100, page_size=50)
+        self.assertEqual(sorted(self.ids(data)), [produits[i].pk for i in (4, 5, 10, 11)])
+        data = self.search(promo=1, page_size=50)
+        self.assertEqual(sorted(self.ids(data)), [produits[3].pk, produits[9].pk])
+
+    def expected_order(self, sort):
+        produits = self.produits
+        if sort == 'relevance':
+            matched = [p for p in produits if 'robe' in p.nom.lower() or 'robe' in p.description]
+            return [p.pk for p in sorted(matched, key=lambda p: ('robe' in p.nom.lower(), p.pk), reverse=True)]
+        if sort == 'price_asc':
+            return [p.pk for p in sorted(produits, key=lambda p: (self.effective(p), p.pk))]
+        key = {
+            'popularity': lambda p: (p.popularity_score, p.pk),
+            'newest': lambda p: (p.created_at, p.pk),
+            'price_desc': lambda p: (self.effective(p), p.pk),
+        }[sort]
+        return [p.pk for p in sorted(produits, key=key, reverse=True)]
+
+    def test_cursor_walk_for_each_sort(self):
+        for sort in ('relevance', 'popularity', 'newest', 'price_asc', 'price_desc'):
+            with self.subTest(sort=sort):
+                params = {'sort': sort, 'page_size': 5, **({'q': 'robe'} if sort == 'relevance' else {})}
+                data = self.search(**params)
+                self.assertIsNotNone(data['facets'])
+                seen = self.ids(data)
+                while data['next']:
+                    data = self.search(**params, cursor=data['next'])
+                    self.assertIsNone(data['facets'])
+                    seen += self.ids(data)
+                self.assertEqual(seen, self.expected_order(sort))
 
-# Create your tests here.
+    def test_invalid_parameters(self):
+        for params in ({'prix_min': 'abc'}, {'sort': 'cheapest'}, {'category_id': 'x'}, {'cursor': 'not-a-cursor'}):
+            with self.subTest(**params):
+                response = self.api.get('/boutique/search/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.data['success'])
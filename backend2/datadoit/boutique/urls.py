@@ -38,6 +38,7 @@ urlpatterns = [
     path('wishlist/remove/<int:produit_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
     path('wishlist/clear/', views.clear_wishlist, name='clear_wishlist'),
       path('products/popular/', views.get_popular_products, name='popular-products'),
+    path('search/', views.search_products, name='search-products'),
     path('produits/<int:produit_id>/rating/', views.submit_rating, name='submit_product_rating'),
     path('produits/new/', views.get_new_products, name='get_new_products'),
 
@@ -1,4 +1,3 @@
-import calendar
 from datetime import datetime, timedelta, timezone
 import logging
 import os
@@ -8,13 +7,19 @@ from rest_framework.decorators import api_view, permission_classes,authenticatio
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from datadoit.pagination import InvalidCursor, paginate_keyset, paginate_page_number, wants_page_number, wants_pagination
 from cart.models import Order
 from cart.serializers import BoutiqueSerializerCart, ProduitSerializerCart
 from users.models import Client, Marchand
-from .models import Boutique, CategoryBoutique, CategoryProduit, Produit, Rating, Wishlist, WishlistItem
+from .models import Boutique, BoutiqueCustomerStats, BoutiqueDailyStats, CategoryBoutique, CategoryProduit, Produit, Rating, Wishlist, WishlistItem
+from .analytics import boutique_sales_series, parse_period
+from .cache import BOUTIQUES_SCOPE, CATEGORIES_SCOPE, PRODUCTS_SCOPE, cached_catalog_response
+from .query_planner import plan_queryset
+from .search import SORTS, facet_counts, filter_products, match_products, parse_filters
 from .serializers import BoutiqueSerializer, BoutiqueSerializerall, CategoryBoutiqueSerializer, CategoryProduitSerializer, DashboardOverviewSerializer, MonthlySalesSerializer, OutOfStockSerializer, ProductsByCategorySerializer, ProduitSerializer, RatingSerializer, TopSellingProductSerializer, WishlistItemSerializer, WishlistSerializer
 from rest_framework.permissions import AllowAny 
 from django.db.models import Sum, Count
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 
@@ -23,17 +28,16 @@ logger = logging.getLogger(__name__)
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny])
+@cached_catalog_response(CATEGORIES_SCOPE, BOUTIQUES_SCOPE)
 def boutiques_by_category(request, pk):
     """
     Retrieve all boutiques associated with a specific CategoryBoutique.
     """
     try:
         category_boutique = get_object_or_404(CategoryBoutique, pk=pk)
-        boutiques = Boutique.objects.filter(category_boutique=category_boutique)
+        boutiques = plan_queryset(Boutique.objects.filter(category_boutique=category_boutique), BoutiqueSerializer)
         serializer = BoutiqueSerializer(boutiques, many=True, context={'request': request})
-        response = Response(serializer.data)
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        return response
+        return Response(serializer.data)
     except Exception as e:
         logger.error(f"Error fetching boutiques by category {pk}: {str(e)}")
         return Response({'error': 'Une erreur est survenue'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -58,14 +62,14 @@ def boutique_list_createchat(request):
                     return Response({'error': 'Accès non autorisé'}, status=403)
             elif marchand:
                 if request.user.role.lower() == 'marchand':
-                    boutiques = Boutique.objects.filter(marchand__user=request.user)
+                    boutiques = plan_queryset(Boutique.objects.filter(marchand__user=request.user), BoutiqueSerializer)
                     serializer = BoutiqueSerializer(boutiques, many=True, context={'request': request})
                     return Response(serializer.data)
                 else:
                     return Response({'error': 'Accès non autorisé'}, status=403)
             else:
                 if request.user.role.lower() == 'marchand':
-                    boutiques = Boutique.objects.filter(marchand__user=request.user)
+                    boutiques = plan_queryset(Boutique.objects.filter(marchand__user=request.user), BoutiqueSerializer)
                     serializer = BoutiqueSerializer(boutiques, many=True, context={'request': request})
                     return Response(serializer.data)
                 else:
@@ -84,6 +88,7 @@ def boutique_list_create(request):
             boutiques = Boutique.objects.filter(marchand__id=marchand, marchand__user=request.user)
         else:
             boutiques = Boutique.objects.filter(marchand__user=request.user)
+        boutiques = plan_queryset(boutiques, BoutiqueSerializer)
         serializer = BoutiqueSerializer(boutiques, many=True, context={'request': request})
         response = Response(serializer.data)
         response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
@@ -199,8 +204,17 @@ def produit_list_create(request):
             )
         else:
             produits = Produit.objects.filter(boutique__marchand=marchand)
-        serializer = ProduitSerializer(produits, many=True, context={'request': request})
-        response = Response(serializer.data)
+        produits = plan_queryset(produits, ProduitSerializer)
+        if wants_pagination(request):
+            try:
+                produits, meta = paginate_keyset(produits, request)
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            serializer = ProduitSerializer(produits, many=True, context={'request': request})
+            response = Response({**meta, 'results': serializer.data})
+        else:
+            serializer = ProduitSerializer(produits, many=True, context={'request': request})
+            response = Response(serializer.data)
         response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         return response
 
@@ -319,6 +333,7 @@ def produit_detail(request, pk):
 @api_view(['GET', 'POST'])
 @authentication_classes([])
 @permission_classes([AllowAny])
+@cached_catalog_response(CATEGORIES_SCOPE)
 def category_boutique_list_create(request):
     if request.method == 'GET':
         categories_boutique = CategoryBoutique.objects.all()
@@ -328,9 +343,7 @@ def category_boutique_list_create(request):
         for category in categories_boutique:
             image_path = category.image.path if category.image else None
             logger.debug(f"CategoryBoutique {category.nom} (id: {category.id}): image={category.image}, file_exists={os.path.exists(image_path) if image_path else False}")
-        response = Response(response_data)
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        return response
+        return Response(response_data)
 
     elif request.method == 'POST':
         data = request.data.copy()
@@ -403,6 +416,7 @@ def category_produit_list_create(request):
             categories_produit = CategoryProduit.objects.filter(boutique__id=boutique_id, boutique__marchand=marchand)
         else:
             categories_produit = CategoryProduit.objects.filter(boutique__marchand=marchand)
+        categories_produit = plan_queryset(categories_produit, CategoryProduitSerializer)
         serializer = CategoryProduitSerializer(categories_produit, many=True, context={'request': request})
         logger.debug(f"GET CategoryProduit response data: {serializer.data}")
         response = Response(serializer.data)
@@ -485,10 +499,10 @@ def category_produit_retrieve_update_destroy(request, pk):
 @permission_classes([AllowAny])
 def boutique_categories_produits(request, boutique_id):
     try:
-        boutique = get_object_or_404(Boutique, pk=boutique_id)
-        categories = CategoryProduit.objects.filter(boutique=boutique)
+        boutique = get_object_or_404(plan_queryset(Boutique.objects.all(), BoutiqueSerializer), pk=boutique_id)
+        categories = plan_queryset(CategoryProduit.objects.filter(boutique=boutique), CategoryProduitSerializer)
         categories_serializer = CategoryProduitSerializer(categories, many=True, context={'request': request})
-        produits = Produit.objects.filter(boutique=boutique)
+        produits = plan_queryset(Produit.objects.filter(boutique=boutique), ProduitSerializer)
         produits_serializer = ProduitSerializer(produits, many=True, context={'request': request})
         
         response_data = {
@@ -507,7 +521,7 @@ def boutique_produits_by_category(request, boutique_id, category_id):
     try:
         boutique = get_object_or_404(Boutique, pk=boutique_id)
         category = get_object_or_404(CategoryProduit, pk=category_id, boutique=boutique)
-        produits = Produit.objects.filter(boutique=boutique, category_produit=category)
+        produits = plan_queryset(Produit.objects.filter(boutique=boutique, category_produit=category), ProduitSerializer)
         serializer = ProduitSerializer(produits, many=True, context={'request': request})
         return Response(serializer.data)
     except Exception as e:
@@ -517,12 +531,13 @@ def boutique_produits_by_category(request, boutique_id, category_id):
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny])
+@cached_catalog_response('boutique:{boutique_id}')
 def boutique_detail_public(request, boutique_id):
     try:
-        boutique = get_object_or_404(Boutique, pk=boutique_id)
-        categories = CategoryProduit.objects.filter(boutique=boutique)
+        boutique = get_object_or_404(plan_queryset(Boutique.objects.all(), BoutiqueSerializer), pk=boutique_id)
+        categories = plan_queryset(CategoryProduit.objects.filter(boutique=boutique), CategoryProduitSerializer)
         categories_serializer = CategoryProduitSerializer(categories, many=True, context={'request': request})
-        products = Produit.objects.filter(boutique=boutique)
+        products = plan_queryset(Produit.objects.filter(boutique=boutique), ProduitSerializer)
         products_serializer = ProduitSerializer(products, many=True, context={'request': request})
         
         response_data = {
@@ -538,27 +553,23 @@ def boutique_detail_public(request, boutique_id):
 @api_view(['GET'])
 def all_boutiques(request):
     try:
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 10))
-        
-        boutiques = Boutique.objects.filter(status='approved').select_related('marchand', 'category_boutique')
-        
-        # Pagination
-        total_count = boutiques.count()
-        total_pages = (total_count + page_size - 1) // page_size
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_boutiques = boutiques[start_index:end_index]
-        
+        boutiques = plan_queryset(Boutique.objects.filter(is_approved=True), BoutiqueSerializer)
+
+        # Pagination par numéro (?page=, ?page_size=) ou par curseur (?cursor=, ?count=exact|estimate)
+        if wants_page_number(request):
+            paginated_boutiques, meta = paginate_page_number(boutiques, request, ('-created_at', '-pk'))
+        else:
+            paginated_boutiques, meta = paginate_keyset(boutiques, request)
+
         serializer = BoutiqueSerializer(paginated_boutiques, many=True, context={'request': request})
         
         return Response({
             "success": True,
-            "count": total_count,
-            "total_pages": total_pages,
-            "current_page": page,
+            **meta,
             "boutiques": serializer.data
         })
+    except InvalidCursor as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         logger.error(f"Error fetching all boutiques: {str(e)}")
         return Response(
@@ -614,7 +625,7 @@ def delete_boutique(request, pk):
 def list_boutiques(request):
   
     try:
-        boutiques = Boutique.objects.all()
+        boutiques = plan_queryset(Boutique.objects.all(), BoutiqueSerializerall)
         serializer = BoutiqueSerializerall(boutiques, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
@@ -634,9 +645,10 @@ def get_boutique_details(request, boutique_id):
         return Response({"error": "Boutique not found"}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['GET'])
+@cached_catalog_response('boutique:{boutique_id}')
 def get_boutique_products(request, boutique_id):
     try:
-        produits = Produit.objects.filter(boutique_id=boutique_id)
+        produits = plan_queryset(Produit.objects.filter(boutique_id=boutique_id), ProduitSerializerCart)
         serializer = ProduitSerializerCart(produits, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Boutique.DoesNotExist:
@@ -781,6 +793,7 @@ def submit_rating(request, produit_id):
     try:
         if serializer.is_valid():
             rating = serializer.save()
+            produit.refresh_from_db(fields=['average_rating'])
             logger.info(f"Note soumise avec succès: produit_id={produit_id}, user={request.user.nom}, value={rating.value}")
             return Response(
                 {
@@ -804,28 +817,88 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .models import Produit
 from .serializers import ProduitSerializer  # 👈 Assure-toi que c'est importé
-from django.db.models import Avg, Count, F, ExpressionWrapper, FloatField
+from .popularity import top_product_ids
+
+POPULAR_PRODUCTS_LIMIT = 8
+
 
 @api_view(['GET'])
 def get_popular_products(request):
-    products = Produit.objects.annotate(
-        avg_rating=Avg('ratings__value'),
-        sales_count=Count('order_items')
-    ).filter(en_stock=True).annotate(
-        popularity_score=ExpressionWrapper(
-            0.6 * F('avg_rating') + 0.4 * F('sales_count'),
-            output_field=FloatField()
+    """
+    Produits en stock triés par ``popularity_score`` (précalculé, voir popularity.py).
+    Filtres optionnels : ?boutique_id= et ?category_id= (catégorie de produit).
+    """
+    boutique_id = request.query_params.get('boutique_id')
+    category_id = request.query_params.get('category_id')
+    if (boutique_id and not boutique_id.isdigit()) or (category_id and not category_id.isdigit()):
+        return Response({'error': 'boutique_id et category_id doivent être des entiers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    products = Produit.objects.filter(en_stock=True)
+    if boutique_id:
+        products = products.filter(boutique_id=boutique_id)
+    if category_id:
+        products = products.filter(category_produit_id=category_id)
+
+    ranked_ids = None
+    if bool(boutique_id) != bool(category_id):
+        # Classement Redis (si activé) : on lit large pour absorber les produits hors stock
+        ranked_ids = top_product_ids(
+            boutique_id=boutique_id, category_produit_id=category_id, limit=POPULAR_PRODUCTS_LIMIT * 3
         )
-    ).order_by('-popularity_score')[:8]
+
+    if ranked_ids:
+        by_id = plan_queryset(products.filter(pk__in=ranked_ids), ProduitSerializer).in_bulk()
+        products = [by_id[pk] for pk in ranked_ids if pk in by_id][:POPULAR_PRODUCTS_LIMIT]
+    else:
+        products = plan_queryset(
+            products.order_by('-popularity_score', '-id'), ProduitSerializer
+        )[:POPULAR_PRODUCTS_LIMIT]
 
     serializer = ProduitSerializer(products, many=True , context={'request': request})
     return Response(serializer.data)
 
 @api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+@cached_catalog_response(PRODUCTS_SCOPE)
+def search_products(request):
+    """
+    Recherche dans le catalogue (voir search.py) : ?q=, filtres ?category_id=,
+    ?boutique_id=, ?couleur=, ?taille=, ?prix_min=, ?prix_max=, ?promo=1,
+    ?en_stock=1, tri ?sort=relevance|popularity|newest|price_asc|price_desc.
+    Pagination par curseur ; les facettes accompagnent la première page.
+    """
+    try:
+        filters = parse_filters(request.query_params)
+        produits = filter_products(Produit.objects.all(), filters)
+        mode = None
+        if filters['q']:
+            produits, mode = match_products(produits, filters['q'])
+        facets = None if request.query_params.get('cursor') else facet_counts(produits)
+
+        sort_field, descending = SORTS[filters['sort']]
+        produits = plan_queryset(produits, ProduitSerializer)
+        page, meta = paginate_keyset(produits, request, sort_field=sort_field, descending=descending)
+        serializer = ProduitSerializer(page, many=True, context={'request': request})
+        return Response({
+            "success": True,
+            **meta,
+            "mode": mode,
+            "facets": facets,
+            "produits": serializer.data,
+        })
+    except (InvalidCursor, ValueError) as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error searching products: {str(e)}")
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@cached_catalog_response(PRODUCTS_SCOPE)
 def get_new_products(request):
     try:
         # Option 1 : Filtrer par est_nouveau
-        new_products = Produit.objects.filter(est_nouveau=True)
+        new_products = plan_queryset(Produit.objects.filter(est_nouveau=True), ProduitSerializer)
 
         # Option 2 : Filtrer dynamiquement par created_at (moins de 30 jours)
         # new_products = Produit.objects.filter(created_at__gte=timezone.now() - timedelta(days=30))
@@ -844,13 +917,14 @@ def get_new_products(request):
 def dashboard_overview(request, boutique_id):
     try:
         boutique = Boutique.objects.get(id=boutique_id)
-        # Filter orders where at least one item belongs to the boutique
-        orders = Order.objects.filter(items__produit__boutique=boutique).distinct()
-        
-        total_sales = orders.aggregate(total=Sum('total'))['total'] or 0
-        total_orders = orders.count()
+        # Lu dans les agrégats (boutique/rollups.py) : O(jours) au lieu de O(commandes)
+        totals = BoutiqueDailyStats.objects.filter(boutique=boutique).aggregate(
+            total_sales=Sum('revenue'), total_orders=Sum('order_count')
+        )
+        total_sales = totals['total_sales'] or 0
+        total_orders = totals['total_orders'] or 0
         total_products = Produit.objects.filter(boutique=boutique).count()
-        active_customers = orders.values('client').distinct().count()
+        active_customers = BoutiqueCustomerStats.objects.filter(boutique=boutique, order_count__gt=0).count()
 
         data = {
             'total_sales': total_sales,
@@ -866,37 +940,23 @@ def dashboard_overview(request, boutique_id):
 def monthly_sales(request, boutique_id):
     try:
         boutique = Boutique.objects.get(id=boutique_id)
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=365)
-
-        sales_data = []
-        current_date = start_date.replace(day=1)
-        while current_date <= end_date:
-            year = current_date.year
-            month = current_date.month
-            # Get the last day of the month
-            last_day = calendar.monthrange(year, month)[1]
-            month_start = datetime(year, month, 1, tzinfo=timezone.get_current_timezone())
-            month_end = datetime(year, month, last_day, 23, 59, 59, tzinfo=timezone.get_current_timezone())
-            
-            sales = Order.objects.filter(
-                items__produit__boutique=boutique,
-                created_at__range=[month_start, month_end]
-            ).aggregate(total=Sum('total'))['total'] or 0
-            sales_data.append({
-                'month': month_start.strftime('%b %Y'),
-                'sales': sales
-            })
-            
-            # Increment to the first day of the next month
-            month += 1
-            if month > 12:
-                month = 1
-                year += 1
-            current_date = datetime(year, month, 1, tzinfo=timezone.get_current_timezone())
+        # Par défaut : les 12 derniers mois ; ?start=&end=&granularity=day|week|month
+        start, end, granularity = parse_period(request)
+
+        label_format = '%b %Y' if granularity == 'month' else '%d %b %Y'
+        sales_data = [
+            {
+                'month': period.strftime(label_format),
+                'period': period,
+                'sales': sales,
+            }
+            for period, sales in boutique_sales_series(boutique, start, end, granularity)
+        ]
 
         serializer = MonthlySalesSerializer(sales_data, many=True)
         return Response(serializer.data)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Boutique.DoesNotExist:
         return Response({"error": "Boutique not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -919,9 +979,9 @@ def top_selling_products(request, boutique_id):
         boutique = Boutique.objects.get(id=boutique_id)
         top_products = Produit.objects.filter(
             boutique=boutique
-        ).annotate(
-            total_sold=Sum('order_items__quantite')
-        ).order_by('-total_sold')[:5]
+        ).select_related('category_produit').annotate(
+            total_sold=Coalesce(Sum('daily_stats__units_sold'), 0)
+        ).order_by('-total_sold', 'id')[:5]
 
         serializer = TopSellingProductSerializer(top_products, many=True)
         return Response(serializer.data)
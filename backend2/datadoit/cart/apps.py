@@ -3,6 +3,3 @@ from django.apps import AppConfig
 class YourAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
-
-    def ready(self):
-        import cart.signals
\ No newline at end of file
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 00:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0012_notificationmarchand'),
+        ('users', '0008_comment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationmarchand',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notif_march_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='orders_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total', 'id'], name='orders_total_id_idx'),
+        ),
+    ]
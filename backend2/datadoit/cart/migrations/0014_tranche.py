@@ -0,0 +1,140 @@
+# Generated by Django 5.2 on 2026-10-18 14:05
+
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 500
+CENT = Decimal('0.01')
+# Copie figée de cart/tranches.py : une migration ne doit pas dépendre du code courant
+DURATION_UNITS = {'jour': 1, 'day': 1, 'mois': 30, 'month': 30, 'année': 360, 'an': 360, 'year': 360}
+
+
+def _duration_days(duration_str):
+    match = re.match(r'\s*(\d+)\s*([^\W\d_]+)', (duration_str or '').lower())
+    if not match:
+        return 0
+    value, unit = int(match.group(1)), match.group(2)
+    for prefix, days in DURATION_UNITS.items():
+        if unit.startswith(prefix):
+            return value * days
+    return 0
+
+
+def _split(amount, count):
+    amount = amount.quantize(CENT)
+    part = (amount / count).quantize(CENT, rounding=ROUND_DOWN)
+    return [part] * (count - 1) + [amount - part * (count - 1)]
+
+
+def backfill_tranches(apps, schema_editor):
+    """
+    Une ligne ``tranches`` par tranche du plan de la boutique du premier article ;
+    statut repris des clés ``order-<id>-<n>`` de paid_tranches (les seules
+    écrites par les paiements), date de paiement approchée par updated_at.
+    """
+    Order = apps.get_model('cart', 'Order')
+    OrderItem = apps.get_model('cart', 'OrderItem')
+    RemiseType = apps.get_model('config', 'RemiseType')
+    Tranche = apps.get_model('cart', 'Tranche')
+
+    plans = {}
+    orders = Order.objects.only('id', 'created_at', 'updated_at', 'paid_tranches').order_by('pk')
+    for start in range(0, orders.count(), BATCH_SIZE):
+        batch = list(orders[start:start + BATCH_SIZE])
+        lines = {}
+        for order_id, boutique_id, prix, quantite in (
+            OrderItem.objects.filter(order_id__in=[order.pk for order in batch]).order_by('pk')
+            .values_list('order_id', 'produit__boutique_id', 'prix', 'quantite')
+        ):
+            lines.setdefault(order_id, []).append((boutique_id, prix, quantite))
+
+        tranches = []
+        for order in batch:
+            if order.pk not in lines:
+                continue
+            boutique_id = lines[order.pk][0][0]
+            if boutique_id not in plans:
+                plans[boutique_id] = RemiseType.objects.filter(boutique_id=boutique_id).order_by('-date_creation').first()
+            plan = plans[boutique_id]
+            if plan is None:
+                continue
+
+            total_initial = sum((prix * quantite for _, prix, quantite in lines[order.pk]), Decimal('0'))
+            nombre_tranches = plan.nombre_tranches or 1
+            remise_totale = total_initial * plan.pourcentage_remise / Decimal('100')
+            if plan.montant_max_remise and remise_totale > plan.montant_max_remise:
+                remise_totale = plan.montant_max_remise
+            step = timedelta(days=_duration_days(plan.duree_plan_paiement) / nombre_tranches)
+            paid = order.paid_tranches or {}
+            for numero, (montant, remise) in enumerate(
+                zip(_split(total_initial - remise_totale, nombre_tranches), _split(remise_totale, nombre_tranches)),
+                start=1,
+            ):
+                payee = paid.get(f"order-{order.pk}-{numero}") == 'payée'
+                tranches.append(Tranche(
+                    order_id=order.pk,
+                    numero=numero,
+                    montant=montant,
+                    remise=remise,
+                    date_echeance=order.created_at + (numero - 1) * step,
+                    statut='payée' if payee else 'en_attente',
+                    paid_at=order.updated_at if payee else None,
+                    remise_type_id=plan.pk,
+                ))
+        Tranche.objects.bulk_create(tranches, ignore_conflicts=True)
+
+
+def restore_paid_tranches(apps, schema_editor):
+    Order = apps.get_model('cart', 'Order')
+    Tranche = apps.get_model('cart', 'Tranche')
+
+    paid = {}
+    for order_id, numero, statut in Tranche.objects.values_list('order_id', 'numero', 'statut'):
+        paid.setdefault(order_id, {})[f"order-{order_id}-{numero}"] = statut
+    orders = []
+    for order in Order.objects.filter(pk__in=list(paid)).only('id'):
+        order.paid_tranches = paid[order.pk]
+        orders.append(order)
+    Order.objects.bulk_update(orders, ['paid_tranches'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0013_notificationmarchand_notif_march_user_created_idx_and_more'),
+        ('config', '0012_rename_referralscount_referralrule_referrals_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tranche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField(verbose_name='Numéro')),
+                ('montant', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Montant')),
+                ('remise', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Remise')),
+                ('date_echeance', models.DateTimeField(verbose_name="Date d'échéance")),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('payée', 'Payée')], default='en_attente', max_length=20, verbose_name='Statut')),
+                ('paid_at', models.DateTimeField(blank=True, null=True, verbose_name='Payée le')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tranches', to='cart.order')),
+                ('remise_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='config.remisetype')),
+            ],
+            options={
+                'verbose_name': 'Tranche',
+                'verbose_name_plural': 'Tranches',
+                'db_table': 'tranches',
+                'ordering': ['order', 'numero'],
+                'indexes': [models.Index(fields=['statut', 'date_echeance'], name='tranches_statut_echeance_idx'), models.Index(fields=['paid_at'], name='tranches_paid_at_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'numero'), name='tranches_order_numero_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_tranches, restore_paid_tranches),
+        migrations.RemoveField(
+            model_name='order',
+            name='paid_tranches',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0014_tranche'),
+        ('users', '0009_marchand_rating_count_marchand_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', 'created_at', 'id'], name='orders_client_created_idx'),
+        ),
+    ]
@@ -16,7 +16,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.urls import path
-from django.db.models import JSONField
+from django.db.models import Count, Q
 
 
 class Panier(models.Model):
@@ -67,75 +67,36 @@ class Order(models.Model):
         default='pending',
         verbose_name=_("Statut")
     )
-    paid_tranches = JSONField(default=dict, blank=True)  # Ex: {"123-1": "payée", "123-2": "en_attente"}
 
     class Meta:
         verbose_name = _("Commande")
         verbose_name_plural = _("Commandes")
         db_table = 'orders'
+        indexes = [
+            # Pagination par curseur (tri created_at / total, départage par id)
+            models.Index(fields=['created_at', 'id'], name='orders_created_id_idx'),
+            models.Index(fields=['total', 'id'], name='orders_total_id_idx'),
+            # Échéanciers d'un client (config/payments/<client_id>/), du plus récent au plus ancien
+            models.Index(fields=['client', 'created_at', 'id'], name='orders_client_created_idx'),
+        ]
 
     def __str__(self):
         return f"Commande {self.id} de {self.client.user.prenom} {self.client.user.nom}"
 
-    def initialize_paid_tranches(self):
-        """
-        Initialise paid_tranches avec toutes les tranches possibles en statut 'en_attente'.
-        """
-        paid_tranches = {}
-        order_items = self.items.select_related('produit__boutique').all()
-        if not order_items.exists():
-            logger.warning(f"No order items found for order {self.id} during paid_tranches initialization")
-            return
-
-        for order_item in order_items:
-            boutique_id = order_item.produit.boutique_id
-            remise_type = RemiseType.objects.filter(boutique_id=boutique_id).first()
-            nombre_tranches = remise_type.nombre_tranches or 1 if remise_type else 1
-            for i in range(1, nombre_tranches + 1):
-                tranche_key = f"{order_item.id}-{i}"
-                paid_tranches[tranche_key] = 'en_attente'
-        self.paid_tranches = paid_tranches
-        logger.info(f"Initialized paid_tranches for order {self.id}: {paid_tranches}")
-        self.save()
-
     def update_status_based_on_payments(self):
         """
-        Met à jour le statut de la commande en fonction des tranches payées.
+        Met à jour le statut de la commande en fonction des tranches payées (une requête d'agrégat).
         """
-        logger.info(f"Updating status for order {self.id}, paid_tranches={self.paid_tranches}")
-        order_items = self.items.select_related('produit__boutique').all()
-        total_tranches = 0
-        paid_tranches = 0
-        inconsistent_tranches = []
-
-        for order_item in order_items:
-            boutique_id = order_item.produit.boutique_id
-            remise_type = RemiseType.objects.filter(boutique_id=boutique_id).first()
-            nombre_tranches = remise_type.nombre_tranches or 1 if remise_type else 1
-            total_tranches += nombre_tranches
-            for i in range(1, nombre_tranches + 1):
-                tranche_key = f"{order_item.id}-{i}"
-                status = self.paid_tranches.get(tranche_key)
-                if status not in ['payée', 'en_attente', None]:
-                    inconsistent_tranches.append(tranche_key)
-                if status == 'payée':
-                    paid_tranches += 1
-
-        if inconsistent_tranches:
-            logger.error(f"Inconsistent tranche statuses in order {self.id}: {inconsistent_tranches}")
-            # Optionnel : Réinitialiser paid_tranches en cas d'incohérence
-            self.initialize_paid_tranches()
-            paid_tranches = 0
-            total_tranches = sum(
-                (RemiseType.objects.filter(boutique_id=oi.produit.boutique_id).first().nombre_tranches or 1)
-                if RemiseType.objects.filter(boutique_id=oi.produit.boutique_id).exists() else 1
-                for oi in order_items
-            )
+        counts = self.tranches.aggregate(
+            total=Count('id'),
+            paid=Count('id', filter=Q(statut=Tranche.STATUT_PAYEE)),
+        )
+        total_tranches, paid_tranches = counts['total'], counts['paid']
 
         if total_tranches == 0:
             self.status = 'pending'
             logger.info(f"Order {self.id} status set to 'pending' (no tranches)")
-        elif paid_tranches == total_tranches and total_tranches > 0:
+        elif paid_tranches == total_tranches:
             self.status = 'payée'
             logger.info(f"Order {self.id} status set to 'payée' (all {total_tranches} tranches paid)")
         elif paid_tranches > 0:
@@ -144,7 +105,7 @@ class Order(models.Model):
         else:
             self.status = 'pending'
             logger.info(f"Order {self.id} status set to 'pending' (no tranches paid)")
-        self.save()
+        self.save(update_fields=['status', 'updated_at'])
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='order_items')
@@ -159,6 +120,49 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantite} x {self.produit.nom} (Commande ID: {self.order.id})"
 
+
+class Tranche(models.Model):
+    """Échéance d'une commande payée en plusieurs fois (voir cart/tranches.py)."""
+    STATUT_EN_ATTENTE = 'en_attente'
+    STATUT_PAYEE = 'payée'
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='tranches')
+    numero = models.PositiveIntegerField(verbose_name=_("Numéro"))
+    # Montant dû après remise ; ``remise`` est la part de remise accordée sur cette tranche
+    montant = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Montant"))
+    remise = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name=_("Remise"))
+    date_echeance = models.DateTimeField(verbose_name=_("Date d'échéance"))
+    statut = models.CharField(
+        max_length=20,
+        choices=[
+            (STATUT_EN_ATTENTE, 'En attente'),
+            (STATUT_PAYEE, 'Payée'),
+        ],
+        default=STATUT_EN_ATTENTE,
+        verbose_name=_("Statut")
+    )
+    paid_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Payée le"))
+    # Plan de paiement qui a servi au calcul (affichage du type de remise et de la durée)
+    remise_type = models.ForeignKey(RemiseType, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        verbose_name = _("Tranche")
+        verbose_name_plural = _("Tranches")
+        db_table = 'tranches'
+        ordering = ['order', 'numero']
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'numero'], name='tranches_order_numero_uniq'),
+        ]
+        indexes = [
+            # Tranches en retard : statut = 'en_attente' AND date_echeance < now()
+            models.Index(fields=['statut', 'date_echeance'], name='tranches_statut_echeance_idx'),
+            # Montants encaissés sur une période
+            models.Index(fields=['paid_at'], name='tranches_paid_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tranche {self.numero} de la commande {self.order_id} ({self.statut})"
+
 class NotificationMarchand(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_notifications')
     message = models.TextField()
@@ -170,4 +174,7 @@ class NotificationMarchand(models.Model):
         return f"Notification for {self.user}: {self.message}"
 
     class Meta:
-        ordering = ['-created_at']    
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notif_march_user_created_idx'),
+        ]    
\ No newline at end of file
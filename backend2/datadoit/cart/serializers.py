@@ -3,6 +3,7 @@ from rest_framework import serializers
 from boutique.models import Boutique, CategoryProduit, Produit
 from cart.models import LignePanier, NotificationMarchand, Order, OrderItem, Panier
 from users.models import Client, User
+from .services import CheckoutError, place_order
 import logging
 
 from django.core.files.base import ContentFile
@@ -19,7 +20,7 @@ class ClientSerializerCart(serializers.ModelSerializer):
 
     class Meta:
         model = Client
-        fields = ['user', 'solde_points', 'historique_achats']
+        fields = ['user', 'solde_points']
 
 class CategoryProduitSerializerCart(serializers.ModelSerializer):
     class Meta:
@@ -77,7 +78,7 @@ class ReadProduitSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'nom', 'description', 'prix', 'prix_reduit', 'stock', 'image', 'couleur', 'taille',
             'category_produit', 'category_produit_details', 'boutique', 'boutique_details',
-            'note', 'en_stock', 'est_nouveau', 'est_mis_en_avant', 'created_at', 'updated_at'
+            'average_rating', 'en_stock', 'est_nouveau', 'est_mis_en_avant', 'created_at', 'updated_at'
         ]
 
     def get_image(self, obj):
@@ -185,27 +186,18 @@ class WriteOrderSerializer(serializers.ModelSerializer):
         except Client.DoesNotExist:
             raise serializers.ValidationError({"client_id": "Client non trouvé"})
 
-        order = Order.objects.create(
-            client=client,
-            first_name=shipping_info['firstName'],
-            last_name=shipping_info['lastName'],
-            email=shipping_info['email'],
-            telephone=shipping_info['telephone'],
-            adresse=shipping_info['adresse'],
-            total=validated_data['total'],
-            status=validated_data.get('status', 'pending')
-        )
-
-        for item_data in items_data:
-            produit = Produit.objects.get(id=item_data['produit_id'])
-            OrderItem.objects.create(
-                order=order,
-                produit=produit,
-                quantite=item_data['quantite'],
-                prix=item_data['prix']
+        try:
+            order = place_order(
+                client,
+                shipping_info,
+                items_data,
+                validated_data['total'],
+                status=validated_data.get('status', 'pending'),
             )
-            produit.stock -= item_data['quantite']
-            produit.save()
+        except Produit.DoesNotExist:
+            raise serializers.ValidationError({"items": "Produit non trouvé"})
+        except CheckoutError as e:
+            raise serializers.ValidationError({"items": str(e)})
 
         return order
 
@@ -231,7 +223,7 @@ class UserSerializer(serializers.Serializer):
     date = serializers.CharField()  # ISO format string
     status = serializers.CharField()
 
-class OrderSerializer(serializers.Serializer):
+class RecentOrderSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     order = serializers.CharField()
     amount = serializers.CharField()
@@ -252,7 +244,7 @@ class OrderSerializerNotification(serializers.ModelSerializer):
         fields = ['id',  'created_at', 'status']
 
 class NotificationSerializer(serializers.ModelSerializer):
-    order = OrderSerializer(read_only=True)
+    order = OrderSerializerNotification(read_only=True)
 
     class Meta:
         model = NotificationMarchand
@@ -0,0 +1,132 @@
+# cart/services.py
+"""
+Création de commande en un nombre constant d'aller-retours base de données.
+
+Les produits sont chargés en un seul ``in_bulk``, le stock est décrémenté par
+un seul UPDATE conditionnel (``stock >= quantité`` pour chaque ligne) et les
+lignes et l'échéancier (cart/tranches.py) sont insérés par ``bulk_create``,
+le tout dans ``transaction.atomic`` : si un seul produit manque de stock, rien
+n'est écrit et aucune commande concurrente ne peut faire passer le stock sous
+zéro.
+"""
+from collections import defaultdict
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from boutique.cache import PRODUCTS_SCOPE, bump_boutiques
+from boutique.models import Boutique, Produit
+from boutique.rollups import record_order
+from .models import NotificationMarchand, Order, OrderItem
+from .tranches import NoPaymentPlan, create_tranches
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, produit):
+        self.produit = produit
+        super().__init__(f"Stock insuffisant pour {produit.nom} (stock disponible: {produit.stock})")
+
+
+def _quantity_case(quantities):
+    return Case(
+        *[When(pk=produit_id, then=Value(quantite)) for produit_id, quantite in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _decrement_stock(quantities):
+    """
+    Un seul UPDATE : ne touche aucune ligne si l'un des produits n'a pas assez de stock.
+    Retourne le nombre de produits passés en rupture.
+    """
+    needed = _quantity_case(quantities)
+    updated = Produit.objects.filter(pk__in=quantities.keys(), stock__gte=needed).update(
+        stock=F('stock') - needed
+    )
+    if updated != len(quantities):
+        # Chemin d'erreur uniquement : retrouver le produit fautif pour le message
+        for produit in Produit.objects.filter(pk__in=quantities.keys()).only('id', 'nom', 'stock'):
+            if produit.stock < quantities[produit.pk]:
+                raise InsufficientStock(produit)
+        raise CheckoutError("Stock modifié pendant la commande, veuillez réessayer")
+    return Produit.objects.filter(pk__in=quantities.keys(), stock=0, en_stock=True).update(en_stock=False)
+
+
+def notify_merchants(order, boutique_ids):
+    """Une notification par marchand concerné par la commande."""
+    merchant_user_ids = set(
+        Boutique.objects.filter(pk__in=boutique_ids).values_list('marchand__user_id', flat=True)
+    )
+    NotificationMarchand.objects.bulk_create([
+        NotificationMarchand(user_id=user_id, message=f"Nouvelle commande reçue - #{order.id}", order=order)
+        for user_id in merchant_user_ids
+    ])
+
+
+def place_order(client, shipping_info, items, total, status='pending'):
+    """
+    Crée la commande ``items`` (liste de dicts produit_id / quantite / prix) pour ``client``.
+    Lève Produit.DoesNotExist pour un produit inconnu, InsufficientStock si le stock manque.
+    """
+    quantities = defaultdict(int)
+    for item in items:
+        quantite = int(item['quantite'])
+        if quantite <= 0:
+            raise CheckoutError("La quantité doit être positive")
+        quantities[int(item['produit_id'])] += quantite
+
+    with transaction.atomic():
+        produits = Produit.objects.only('id', 'boutique_id').in_bulk(list(quantities))
+        missing = set(quantities) - set(produits)
+        if missing:
+            raise Produit.DoesNotExist(f"Produits introuvables: {sorted(missing)}")
+
+        sold_out = _decrement_stock(quantities)
+
+        order = Order.objects.create(
+            client=client,
+            total=Decimal(str(total)),
+            first_name=shipping_info['firstName'],
+            last_name=shipping_info['lastName'],
+            email=shipping_info['email'],
+            telephone=shipping_info['telephone'],
+            adresse=shipping_info['adresse'],
+            status=status,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                produit=produits[int(item['produit_id'])],
+                quantite=int(item['quantite']),
+                prix=Decimal(str(item['prix'])),
+            )
+            for item in items
+        ])
+
+        try:
+            create_tranches(order, [
+                (produits[int(item['produit_id'])].boutique_id, Decimal(str(item['prix'])), int(item['quantite']))
+                for item in items
+            ])
+        except NoPaymentPlan:
+            # Sans plan de paiement, l'échéancier sera créé à la première consultation
+            pass
+
+        notify_merchants(order, {produit.boutique_id for produit in produits.values()})
+        record_order(order)
+        # Les UPDATE de stock ne déclenchent pas les signaux du catalogue : seules les pages des
+        # boutiques concernées affichent le stock, les listes transverses filtrent sur en_stock
+        boutique_ids = {produit.boutique_id for produit in produits.values()}
+        scopes = (PRODUCTS_SCOPE,) if sold_out else ()
+        transaction.on_commit(lambda: bump_boutiques(boutique_ids, *scopes))
+
+    logger.info(f"Order {order.id} placed for client {client.user_id} ({len(items)} lines)")
+    return order
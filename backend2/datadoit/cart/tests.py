@@ -1,3 +1,147 @@
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from boutique.models import Produit
+from boutique.tests import SHIPPING, make_catalog, make_client
+from datadoit.pagination import encode_cursor
+from config.models import RemiseType
+from config.payment_plans import _local as plan_local
+from .models import Order, OrderItem, Tranche
+from .tranches import TrancheAlreadyPaid, create_tranches, pay_tranches
+
+
+def make_order(client, total='10.00', **fields):
+    return Order.objects.create(
+        client=client, first_name='a', last_name='b', email='a@b.c', telephone='1', adresse='x',
+        total=Decimal(total), **fields
+    )
+
+
+class ListOrdersPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client = make_client()
+        cls.orders = [make_order(client, total=f'{i}.00') for i in range(1, 24)]
+
+    def setUp(self):
+        self.api = APIClient()
+
+    def test_page_number_keeps_page_response(self):
+        response = self.api.get('/cart/orders/', {'page': 2, 'sort_by': 'total', 'sort_order': 'asc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 23)
+        self.assertEqual(response.data['total_pages'], 3)
+        self.assertEqual(response.data['current_page'], 2)
+        self.assertEqual([order['id'] for order in response.data['results']], [o.id for o in self.orders[10:20]])
+
+    def test_page_number_count_is_exact_for_filters(self):
+        response = self.api.get('/cart/orders/', {'page': 9, 'amount_min': 20})
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['current_page'], 1)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_cursor_pages_cover_every_order_once(self):
+        seen, params = [], {'page_size': 10}
+        while True:
+            response = self.api.get('/cart/orders/', params)
+            self.assertEqual(response.status_code, 200)
+            seen += [order['id'] for order in response.data['results']]
+            if not response.data['next']:
+                break
+            params = {'page_size': 10, 'cursor': response.data['next']}
+        self.assertEqual(sorted(seen), sorted(o.id for o in self.orders))
+
+    def test_mistyped_cursor_is_rejected(self):
+        for cursor in (encode_cursor('x', 1), encode_cursor(self.orders[0].created_at, 'x'), encode_cursor(None, 1)):
+            response = self.api.get('/cart/orders/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+        response = self.api.get('/cart/orders/', {'cursor': encode_cursor('abc', 1), 'sort_by': 'total'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.boutique = make_catalog(1, 2)[0]
+        self.produit, self.autre = self.boutique.produits.order_by('pk')
+        self.client_profile = make_client()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_profile.user)
+
+    def checkout(self, *lines):
+        return self.api.post('/cart/panier/checkout/', {
+            'shipping_info': SHIPPING,
+            'items': [{'produit_id': produit.id, 'quantite': quantite, 'prix': '10'} for produit, quantite in lines],
+            'total': str(10 * sum(quantite for _, quantite in lines)),
+        }, format='json')
+
+    def test_checkout_decrements_stock(self):
+        response = self.checkout((self.produit, 2), (self.autre, 5))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.produit.refresh_from_db()
+        self.autre.refresh_from_db()
+        self.assertEqual((self.produit.stock, self.produit.en_stock), (3, True))
+        self.assertEqual((self.autre.stock, self.autre.en_stock), (0, False))
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(sorted(order.items.values_list('produit_id', 'quantite')), [(self.produit.id, 2), (self.autre.id, 5)])
+
+    def test_insufficient_stock_writes_nothing(self):
+        response = self.checkout((self.produit, 1), (self.autre, 6))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(self.autre.nom, response.data['detail'])
+        self.assertEqual(sorted(Produit.objects.values_list('stock', flat=True)), [5, 5])
+        self.assertFalse(Order.objects.exists())
+
+    def test_duplicate_lines_are_summed_against_stock(self):
+        response = self.checkout((self.produit, 3), (self.produit, 3))
+        self.assertEqual(response.status_code, 400)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.stock, 5)
+
+    def test_unknown_product(self):
+        response = self.api.post('/cart/panier/checkout/', {
+            'shipping_info': SHIPPING, 'items': [{'produit_id': 999999, 'quantite': 1, 'prix': '10'}], 'total': '10',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class TrancheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        plan_local.clear()
+        boutique = make_catalog(1, 1)[0]
+        RemiseType.objects.create(
+            boutique=boutique, duree_plan_paiement='3 mois', type_remise='tranches',
+            nombre_tranches=3, pourcentage_remise=Decimal('10'),
+        )
+        self.order = make_order(make_client(), total='100.00')
+        OrderItem.objects.create(order=self.order, produit=boutique.produits.get(), quantite=1, prix=Decimal('100.00'))
+        create_tranches(self.order)
+
+    def test_schedule_sums_to_discounted_total(self):
+        tranches = list(self.order.tranches.order_by('numero'))
+        self.assertEqual([tranche.numero for tranche in tranches], [1, 2, 3])
+        self.assertEqual(sum(tranche.montant for tranche in tranches), Decimal('90.00'))
+        self.assertEqual(sum(tranche.remise for tranche in tranches), Decimal('10.00'))
+
+    def test_tranche_is_paid_once(self):
+        _, settled = pay_tranches(self.order, [1])
+        self.assertFalse(settled)
+        # Même instance (périmée) de la commande : le second paiement relit les tranches sous verrou
+        with self.assertRaises(TrancheAlreadyPaid):
+            pay_tranches(self.order, [1])
+        with self.assertRaises(TrancheAlreadyPaid):
+            pay_tranches(self.order, [1, 2])
+        self.assertEqual(self.order.tranches.filter(statut=Tranche.STATUT_PAYEE).count(), 1)
 
-# Create your tests here.
+    def test_last_tranche_settles_order(self):
+        pay_tranches(self.order, [1, 2])
+        _, settled = pay_tranches(self.order)
+        self.assertTrue(settled)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'payée')
+        with self.assertRaises(TrancheAlreadyPaid):
+            pay_tranches(self.order)
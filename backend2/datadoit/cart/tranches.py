@@ -0,0 +1,201 @@
+# cart/tranches.py
+"""
+Échéancier des commandes payées en plusieurs fois (table ``tranches``).
+
+Chaque tranche est une ligne (commande, numéro, montant, remise, échéance,
+statut, date de paiement) indexée par (statut, échéance) et par date de
+paiement : « tranches en retard » ou « encaissé ce mois-ci » sont des
+requêtes indexées, sans relire chaque commande.
+
+L'échéancier est créé avec la commande (cart/services.py) d'après le plan de
+paiement de la boutique du premier article (config/payment_plans.py, en
+cache), ou à la première consultation si la boutique n'en avait pas encore.
+Le paiement verrouille la commande (``select_for_update``) puis ses
+tranches : deux tranches payées en même temps ne peuvent ni être encaissées
+deux fois ni laisser une commande entièrement réglée sans le statut « payée ».
+
+Les échéanciers de toutes les commandes d'un client se lisent en lot
+(``ensure_schedules``, ``filter_by_schedule``, ``get_tranches_by_order``) :
+un nombre constant de requêtes, quel que soit le nombre de commandes.
+"""
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from config.payment_plans import compute_schedule, resolve_plan, resolve_plans
+from .models import Order, OrderItem, Tranche
+
+logger = logging.getLogger(__name__)
+
+# Filtres d'échéancier (?status=) : reste à payer sans retard, au moins une tranche en retard, soldé.
+# Une tranche est en retard le lendemain de son échéance (la 1ère est due le jour de la commande).
+SCHEDULE_PENDING = 'pending'
+SCHEDULE_OVERDUE = 'overdue'
+SCHEDULE_PAID = 'paid'
+SCHEDULE_STATUSES = (SCHEDULE_PENDING, SCHEDULE_OVERDUE, SCHEDULE_PAID)
+
+
+class TrancheError(Exception):
+    pass
+
+
+class NoPaymentPlan(TrancheError):
+    pass
+
+
+class TrancheAlreadyPaid(TrancheError):
+    pass
+
+
+def build_tranches(order, plan, total_initial):
+    """Tranches (non enregistrées) de ``order`` pour un montant avant remise ``total_initial``."""
+    return [
+        Tranche(order=order, remise_type_id=plan['id'], **tranche)
+        for tranche in compute_schedule(total_initial, plan, order.created_at)
+    ]
+
+
+def _total_initial(lines):
+    return sum((Decimal(str(prix)) * quantite for _, prix, quantite in lines), Decimal('0'))
+
+
+def create_tranches(order, lines=None):
+    """
+    Crée l'échéancier de ``order`` ; ``lines`` : (boutique_id, prix, quantite)
+    des articles, relus en base si absent. Lève NoPaymentPlan si la commande
+    n'a pas d'article ou si la boutique n'a pas de RemiseType.
+    """
+    if lines is None:
+        lines = list(
+            OrderItem.objects.filter(order=order).order_by('pk')
+            .values_list('produit__boutique_id', 'prix', 'quantite')
+        )
+    if not lines:
+        raise NoPaymentPlan('No order items found for the specified order')
+    plan = resolve_plan(lines[0][0])
+    if plan is None:
+        raise NoPaymentPlan('No discount type found for the boutique')
+
+    total_initial = _total_initial(lines)
+    # ignore_conflicts : deux premières consultations simultanées ne créent pas deux échéanciers
+    Tranche.objects.bulk_create(build_tranches(order, plan, total_initial), ignore_conflicts=True)
+    logger.info(f"Created {plan['nombre_tranches']} tranches for order {order.id}")
+
+
+def ensure_schedules(orders):
+    """
+    Crée en lot les échéanciers manquants parmi ``orders`` (queryset) : une
+    requête pour les commandes, une pour leurs articles, les plans viennent
+    du cache. Les commandes dont la boutique n'a pas de plan restent sans
+    échéancier. Une seule requête quand rien ne manque.
+    """
+    missing = list(orders.filter(~Exists(Tranche.objects.filter(order=OuterRef('pk')))).only('id', 'created_at'))
+    if not missing:
+        return 0
+    lines = {}
+    for order_id, *line in (
+        OrderItem.objects.filter(order__in=[order.pk for order in missing]).order_by('pk')
+        .values_list('order_id', 'produit__boutique_id', 'prix', 'quantite')
+    ):
+        lines.setdefault(order_id, []).append(line)
+    plans = resolve_plans({order_lines[0][0] for order_lines in lines.values()})
+
+    tranches, scheduled = [], 0
+    for order in missing:
+        plan = plans.get(lines[order.pk][0][0]) if order.pk in lines else None
+        if plan is None:
+            continue
+        tranches += build_tranches(order, plan, _total_initial(lines[order.pk]))
+        scheduled += 1
+    Tranche.objects.bulk_create(tranches, ignore_conflicts=True)
+    if scheduled:
+        logger.info(f"Created tranches for {scheduled} orders")
+    return scheduled
+
+
+def overdue_before(now=None):
+    """Début du jour courant : les tranches non payées échues avant sont en retard."""
+    return timezone.localtime(now or timezone.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def filter_by_schedule(orders, statut=None, now=None):
+    """Commandes de ``orders`` ayant un échéancier, restreintes à ``statut`` (SCHEDULE_STATUSES) s'il est donné."""
+    unpaid = Tranche.objects.filter(order=OuterRef('pk'), statut=Tranche.STATUT_EN_ATTENTE)
+    late = unpaid.filter(date_echeance__lt=overdue_before(now))
+    orders = orders.filter(Exists(Tranche.objects.filter(order=OuterRef('pk'))))
+    if statut == SCHEDULE_PAID:
+        return orders.filter(~Exists(unpaid))
+    if statut == SCHEDULE_OVERDUE:
+        return orders.filter(Exists(late))
+    if statut == SCHEDULE_PENDING:
+        return orders.filter(Exists(unpaid), ~Exists(late))
+    return orders
+
+
+def schedule_status(tranches, now=None):
+    """SCHEDULE_PENDING, SCHEDULE_OVERDUE ou SCHEDULE_PAID pour les tranches d'une commande."""
+    unpaid = [tranche for tranche in tranches if tranche.statut != Tranche.STATUT_PAYEE]
+    if not unpaid:
+        return SCHEDULE_PAID
+    limit = overdue_before(now)
+    if any(tranche.date_echeance < limit for tranche in unpaid):
+        return SCHEDULE_OVERDUE
+    return SCHEDULE_PENDING
+
+
+def get_tranches_by_order(order_ids):
+    """``{order_id: [tranches]}`` pour plusieurs commandes, avec commande et plan (une requête)."""
+    by_order = {}
+    for tranche in (
+        Tranche.objects.filter(order_id__in=order_ids)
+        .select_related('order', 'remise_type').order_by('order_id', 'numero')
+    ):
+        by_order.setdefault(tranche.order_id, []).append(tranche)
+    return by_order
+
+
+def get_tranches(order_id, client_id):
+    """Tranches de la commande ``order_id`` du client ``client_id``, avec commande et plan (une requête)."""
+    return list(
+        Tranche.objects.filter(order_id=order_id, order__client_id=client_id)
+        .select_related('order', 'remise_type').order_by('numero')
+    )
+
+
+def pay_tranches(order, numeros=None):
+    """
+    Marque payées les tranches ``numeros`` de ``order`` (toutes les restantes si
+    None). Retourne (tranches de la commande, True si la commande vient d'être
+    soldée). Lève TrancheAlreadyPaid si une tranche demandée l'est déjà, ou si
+    tout est déjà réglé.
+    """
+    with transaction.atomic():
+        # Verrou sur la commande : les paiements d'une même commande sont sérialisés
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        tranches = list(
+            order.tranches.select_for_update(of=('self',)).select_related('remise_type').order_by('numero')
+        )
+        to_pay = [
+            tranche for tranche in tranches
+            if tranche.statut != Tranche.STATUT_PAYEE and (numeros is None or tranche.numero in numeros)
+        ]
+        requested = len(numeros) if numeros is not None else None
+        if not to_pay or (requested is not None and len(to_pay) != requested):
+            raise TrancheAlreadyPaid('Tranche already paid' if numeros is not None else 'Order already fully paid')
+
+        now = timezone.now()
+        Tranche.objects.filter(pk__in=[tranche.pk for tranche in to_pay]).update(
+            statut=Tranche.STATUT_PAYEE, paid_at=now
+        )
+        for tranche in to_pay:
+            tranche.statut, tranche.paid_at = Tranche.STATUT_PAYEE, now
+
+        settled = all(tranche.statut == Tranche.STATUT_PAYEE for tranche in tranches)
+        if settled:
+            order.status = 'payée'
+            order.save(update_fields=['status', 'updated_at'])
+    logger.info(f"Paid tranches {[tranche.numero for tranche in to_pay]} of order {order.id} (settled={settled})")
+    return tranches, settled
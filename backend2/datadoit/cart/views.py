@@ -6,13 +6,17 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.paginator import Paginator
+from datadoit.pagination import InvalidCursor, paginate_keyset, paginate_page_number, wants_page_number, wants_pagination
 from users.authentication import JWTBearerAuthentication
 from boutique.models import  Produit
+from boutique.analytics import period_starts, sales_series, signup_series
+from boutique.query_planner import plan_queryset
+from boutique.rollups import record_status_change
 from cart.models import  LignePanier, Order, OrderItem, Panier
 from users.models import Client, User
-from .serializers import NotificationSerializer, OrderSerializer, PanierSerializer, LignePanierSerializer, RevenueOverviewSerializer, StatsSerializer, UserGrowthSerializer, UserSerializer, WriteOrderSerializer
-from django.db.models import Q
+from .serializers import NotificationSerializer, OrderSerializer, PanierSerializer, RecentOrderSerializer, LignePanierSerializer, RevenueOverviewSerializer, StatsSerializer, UserGrowthSerializer, UserSerializer, WriteOrderSerializer
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated,AllowAny
 from rest_framework.response import Response
@@ -160,6 +164,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from .models import NotificationMarchand, Order, Client, Produit, OrderItem
+from .services import CheckoutError, place_order
 from decimal import Decimal
 import logging
 
@@ -201,26 +206,8 @@ def checkout(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Create order with Client instance
-        order = Order.objects.create(
-            client=client,  # Use Client instance
-            total=Decimal(data['total']),
-            first_name=shipping_info['firstName'],
-            last_name=shipping_info['lastName'],
-            email=shipping_info['email'],
-            telephone=shipping_info['telephone'],
-            adresse=shipping_info['adresse'],
-        )
-
-        # Create order items
-        for item in data['items']:
-            product = Produit.objects.get(id=item['produit_id'])
-            OrderItem.objects.create(
-                order=order,
-                produit=product,  # Use 'produit' instead of 'product'
-                quantite=item['quantite'],  # Use 'quantite' instead of 'quantity'
-                prix=Decimal(item['prix']),
-            )
+        # Produits en une requête, lignes en bulk, stock décrémenté atomiquement
+        order = place_order(client, shipping_info, data['items'], data['total'])
 
         logger.info(f"Order created: {order.id} for user: {user.nom}")
        # Clear the user's cart
@@ -245,6 +232,12 @@ def checkout(request):
             {"detail": "Invalid product ID"},
             status=status.HTTP_400_BAD_REQUEST
         )
+    except CheckoutError as e:
+        logger.warning(f"Checkout rejected for user {user.id}: {str(e)}")
+        return Response(
+            {"detail": str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Client.DoesNotExist:
         logger.warning(f"No Client instance found for user: {user.id}")
         return Response(
@@ -261,9 +254,7 @@ def checkout(request):
 @api_view(['GET'])
 def list_orders(request):
     search = request.query_params.get('search', '')
-    page = int(request.query_params.get('page', 1))
-    search = request.query_params.get('search', '')
-    status = request.query_params.get('status', '')
+    status_filter = request.query_params.get('status', '')
     date_start = request.query_params.get('date_start', '')
     date_end = request.query_params.get('date_end', '')
     amount_min = request.query_params.get('amount_min', '')
@@ -273,11 +264,13 @@ def list_orders(request):
     sort_order = request.query_params.get('sort_order', 'desc')
 
     # Build query
-    queryset = Order.objects.all()
+    queryset = plan_queryset(Order.objects.all(), OrderSerializer)
     
-    # Filter by boutique_id
+    # Filter by boutique_id (EXISTS plutôt que JOIN + DISTINCT : garde le tri sur l'index)
     if boutique_id:
-        queryset = queryset.filter(items__produit__boutique_id=boutique_id).distinct()
+        queryset = queryset.filter(Exists(
+            OrderItem.objects.filter(order=OuterRef('pk'), produit__boutique_id=boutique_id)
+        ))
     
     # Search by ID or client name
     if search:
@@ -288,14 +281,14 @@ def list_orders(request):
         )
     
     # Filter by status
-    if status:
-        queryset = queryset.filter(status=status)
+    if status_filter:
+        queryset = queryset.filter(status=status_filter)
     
     # Filter by date range
     if date_start:
-        queryset = queryset.filter(created_at__gte=datetime.strptime(date_start, '%Y-%m-%d'))
+        queryset = queryset.filter(created_at__gte=datetime.datetime.strptime(date_start, '%Y-%m-%d'))
     if date_end:
-        queryset = queryset.filter(created_at__lte=datetime.strptime(date_end, '%Y-%m-%d'))
+        queryset = queryset.filter(created_at__lte=datetime.datetime.strptime(date_end, '%Y-%m-%d'))
     
     # Filter by amount range
     if amount_min:
@@ -303,34 +296,40 @@ def list_orders(request):
     if amount_max:
         queryset = queryset.filter(total__lte=float(amount_max))
     
-    # Sort
+    # Sort + pagination : par numéro (?page=, écran des commandes) ou par curseur (?cursor=, ?count=exact|estimate)
     sort_field = sort_by if sort_by in ['created_at', 'total'] else 'created_at'
-    sort_prefix = '-' if sort_order == 'desc' else ''
-    queryset = queryset.order_by(f'{sort_prefix}{sort_field}')
+    if wants_page_number(request):
+        sort_prefix = '-' if sort_order == 'desc' else ''
+        orders, meta = paginate_page_number(queryset, request, (f'{sort_prefix}{sort_field}', f'{sort_prefix}pk'))
+    else:
+        try:
+            orders, meta = paginate_keyset(
+                queryset, request,
+                sort_field=sort_field,
+                descending=sort_order == 'desc',
+            )
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Pagination
-    paginator = Paginator(queryset, 10)  # 10 orders per page
-    page_obj = paginator.get_page(page)
-    
-    serializer = OrderSerializer(page_obj, many=True)
-    return Response({
-        'count': paginator.count,
-        'results': serializer.data,
-    })
+    serializer = OrderSerializer(orders, many=True)
+    return Response({**meta, 'results': serializer.data})
 
 @api_view(['PATCH'])
 def update_order_status(request, order_id):
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        return Response({'error': 'Commande non trouvée'}, status=status.HTTP_404_NOT_FOUND)
-    
     new_status = request.data.get('status')
     if new_status not in ['pending', 'processing', 'shipped', 'delivered', 'cancelled']:
         return Response({'error': 'Statut invalide'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    order.status = new_status
-    order.save()
+
+    with transaction.atomic():
+        try:
+            order = Order.objects.select_for_update().get(id=order_id)
+        except Order.DoesNotExist:
+            return Response({'error': 'Commande non trouvée'}, status=status.HTTP_404_NOT_FOUND)
+
+        previous_status = order.status
+        order.status = new_status
+        order.save()
+        record_status_change(order, previous_status)
     serializer = OrderSerializer(order)
     return Response(serializer.data)
 from django.db.models import Count, Sum
@@ -400,7 +399,7 @@ def recent_orders(request):
                 'status': order.status
             } for order in orders
         ]
-        serializer = OrderSerializer(orders_data, many=True)
+        serializer = RecentOrderSerializer(orders_data, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
         logger.error(f"Error fetching recent orders: {str(e)}")
@@ -411,25 +410,10 @@ def revenue_overview(request):
     try:
         current_year = timezone.now().year
         logger.debug(f"Fetching revenue for year: {current_year}")
-        revenue_data = (
-            Order.objects.filter(
-                status='payée',
-                created_at__year=current_year
-            )
-            .values('created_at__month')
-            .annotate(total=Sum('total'))
-            .order_by('created_at__month')
+        series = sales_series(
+            datetime.date(current_year, 1, 1), datetime.date(current_year, 12, 31), 'month', statuses=['payée']
         )
-        logger.debug(f"Raw revenue data: {list(revenue_data)}")
-        
-        months = [{'month': i, 'total': 0.0} for i in range(1, 13)]
-        for data in revenue_data:
-            month = int(data['created_at__month'])
-            total = data['total']
-            if isinstance(total, (int, float)) and 1 <= month <= 12:
-                months[month - 1]['total'] = float(total)
-            else:
-                logger.warning(f"Invalid data for month {month}: total={total}")
+        months = [{'month': period.month, 'total': float(total)} for period, total in series]
         
         serializer = RevenueOverviewSerializer(months, many=True)
         logger.debug(f"Serialized data: {serializer.data}")
@@ -443,41 +427,31 @@ def revenue_overview(request):
 
 @api_view(['GET'])
 def user_growth(request):
+    end_date = timezone.localdate()
+    start_date = end_date - timedelta(weeks=12)
     try:
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(weeks=12)
-        user_data = (
-            User.objects.filter(
-                role='client',
-                created_at__date__gte=start_date,
-                created_at__date__lte=end_date
-            )
-            .extra(
-                select={'week': "EXTRACT(week FROM created_at)"}
-            )
-            .values('week')
-            .annotate(count=Count('id'))
-            .order_by('week')
-        )
         weeks = [
-            {'week': i, 'count': 0}
-            for i in range(int(start_date.isocalendar()[1]), int(end_date.isocalendar()[1]) + 1)
+            {'week': period.isocalendar()[1], 'count': count}
+            for period, count in signup_series(start_date, end_date, 'week')
         ]
-        for data in user_data:
-            week_index = int(data['week']) - int(start_date.isocalendar()[1])
-            if 0 <= week_index < len(weeks):
-                weeks[week_index]['count'] = data['count']
         serializer = UserGrowthSerializer(weeks, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
         logger.error(f"Error fetching user growth: {str(e)}", exc_info=True)
         return Response(
-            [{'week': i, 'count': 0} for i in range(int(start_date.isocalendar()[1]), int(end_date.isocalendar()[1]) + 1)],
+            [{'week': period.isocalendar()[1], 'count': 0} for period in period_starts(start_date, end_date, 'week')],
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def notification_list_view(request):
-    notifications = NotificationMarchand.objects.filter(user=request.user)
+    notifications = plan_queryset(NotificationMarchand.objects.filter(user=request.user), NotificationSerializer)
+    if not wants_pagination(request):
+        serializer = NotificationSerializer(notifications, many=True)
+        return Response(serializer.data)
+    try:
+        notifications, meta = paginate_keyset(notifications, request)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     serializer = NotificationSerializer(notifications, many=True)
-    return Response(serializer.data)   
\ No newline at end of file
+    return Response({**meta, 'results': serializer.data})   
\ No newline at end of file
@@ -0,0 +1,118 @@
+# chat/archive.py
+"""
+Archivage des anciens messages du chat (commande ``archive_chat``).
+
+Par lots de CHAT_ARCHIVE_BATCH_SIZE, dans une transaction chacun, les messages
+plus vieux que CHAT_ARCHIVE_AFTER_DAYS sont déplacés de ChatMessage vers
+ArchivedChatMessage (même id) :
+  - leurs réactions y sont figées en compteurs ``[{'emoji', 'count'}]`` ;
+  - leurs MessageRead sont compactés en ReadWatermark par (salon, utilisateur),
+    puis supprimés avec le message ;
+  - les messages épinglés restent dans la table chaude.
+Sur PostgreSQL, l'archive est partitionnée par mois sur ``timestamp`` : les
+partitions manquantes sont créées avant chaque lot.
+
+Les notifications lues plus anciennes que le même seuil sont supprimées.
+L'historique (chat/history.py) lit l'archive de façon transparente.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .history import reaction_counts
+from .models import ArchivedChatMessage, ChatMessage, MessageRead, Notification, PinnedMessage
+from .receipts import advance_watermarks
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = (
+    'id', 'room_id', 'user_id', 'customer_id', 'message', 'timestamp', 'idempotency_key',
+    'is_edited', 'is_deleted', 'reply_to_id',
+)
+
+
+def archive_cutoff():
+    return timezone.now() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+
+
+def ensure_partitions(months):
+    """Crée les partitions mensuelles (année, mois) manquantes de l'archive (PostgreSQL uniquement)."""
+    if connection.vendor != 'postgresql':
+        return
+    table = ArchivedChatMessage._meta.db_table
+    with connection.cursor() as cursor:
+        for year, month in sorted(months):
+            start = datetime(year, month, 1, tzinfo=dt_timezone.utc)
+            end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}_p{year}{month:02d}" PARTITION OF "{table}" '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+
+
+def compact_reads(message_ids):
+    """Dernier message lu par (salon, utilisateur) parmi ``message_ids`` -> ReadWatermark."""
+    rows = (
+        MessageRead.objects.filter(message_id__in=message_ids)
+        .values('message__room_id', 'user_id').annotate(last_read=Max('message_id')).order_by()
+    )
+    return advance_watermarks({(row['message__room_id'], row['user_id']): row['last_read'] for row in rows})
+
+
+@transaction.atomic
+def archive_batch(cutoff, batch_size):
+    """Archive au plus ``batch_size`` messages antérieurs à ``cutoff`` ; retourne leur nombre."""
+    pinned = PinnedMessage.objects.filter(message_id=OuterRef('pk'))
+    candidates = ChatMessage.objects.filter(timestamp__lt=cutoff).exclude(Exists(pinned))
+    rows = list(
+        candidates.select_for_update(skip_locked=True).order_by('timestamp', 'pk').values(*ARCHIVED_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+    ids = [row['id'] for row in rows]
+    reactions = reaction_counts(ids)
+
+    ensure_partitions({
+        (timestamp.year, timestamp.month)
+        for timestamp in (row['timestamp'].astimezone(dt_timezone.utc) for row in rows)
+    })
+    now = timezone.now()
+    # ignore_conflicts : un lot rejoué après une interruption ne double pas l'archive
+    ArchivedChatMessage.objects.bulk_create(
+        [ArchivedChatMessage(**row, reactions=reactions.get(row['id'], []), archived_at=now) for row in rows],
+        ignore_conflicts=True,
+    )
+    compact_reads(ids)
+    # Supprime aussi MessageRead et MessageReaction ; réponses et ReadWatermark gardent l'id
+    ChatMessage.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def purge_notifications(cutoff, batch_size):
+    deleted = 0
+    while True:
+        ids = list(
+            Notification.objects.filter(read=True, timestamp__lt=cutoff).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(pk__in=ids).delete()[0]
+
+
+def archive_messages(batch_size=None):
+    """Archive tous les messages éligibles par lots ; retourne (messages archivés, notifications supprimées)."""
+    batch_size = batch_size or settings.CHAT_ARCHIVE_BATCH_SIZE
+    cutoff = archive_cutoff()
+    archived = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        archived += moved
+        logger.info(f"Archived {archived} chat messages older than {cutoff.isoformat()}")
+    return archived, purge_notifications(cutoff, batch_size)
@@ -1,16 +1,31 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+import asyncio
 import json
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from channels.db import database_sync_to_async
-from .models import ChatRoom, ChatMessage, Notification, PinnedMessage, MessageReaction, MessageRead
+from .models import ChatRoom, ChatMessage, Notification, PinnedMessage
+from .history import get_history_page
+from .notifications import deliver, store_message_notifications, user_group
+from .persistence import MAX_KEY_LENGTH, make_idempotency_key, writer
+from .presence import get_presence
+from .receipts import MAX_EMOJI_LENGTH, aggregator
+from .rooms import check_access, resolve_room, room_from_info
+from .search import SearchTimeout, search_messages
+from .throttling import SendQueue, connection_bucket, metrics, room_bucket
+from .wire import DEFAULT_FORMAT, decode, encode_frame, encode_text, group_frame, negotiate
+from datadoit.pagination import InvalidCursor
 from boutique.models import Boutique
 import logging
 from datetime import datetime
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    wire_format = DEFAULT_FORMAT
+
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'chat_{self.room_name}'
@@ -22,7 +37,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             boutique_id = params.get('boutique_id')
             if not self.role or not boutique_id:
                 raise ValueError("Missing role or boutique_id")
-            self.boutique_id = str(boutique_id)
+            self.boutique_id = str(int(boutique_id))
         except (ValueError, IndexError) as e:
             logger.error(f"Invalid query string: {str(e)}")
             await self.close(code=4003, reason="Missing or invalid role/boutique_id")
@@ -30,8 +45,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         logger.debug(f"Connecting user: {self.user}, Role: {self.role}, Boutique ID: {self.boutique_id}, Room: {self.room_name}")
 
-        if not await self.validate_access():
-            logger.error("Access validation failed")
+        allowed, reason = await self.resolve_access()
+        if not allowed:
+            logger.error(f"Access validation failed: {reason}")
             await self.close(code=4003, reason="Access validation failed")
             return
 
@@ -39,42 +55,131 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        if self.user and self.user.is_authenticated:
+            await self.channel_layer.group_add(user_group(self.user.id), self.channel_name)
+        self.frame_bucket = connection_bucket()
+        self.throttled_in_a_row = 0
+        self.wire_format, subprotocol = negotiate(params, self.scope.get('subprotocols', []))
+        await self.accept(subprotocol)
+        self.send_queue = SendQueue(
+            lambda **frame: AsyncWebsocketConsumer.send(self, **frame),
+            lambda: self.close(code=4008),
+            maxsize=settings.CHAT_SEND_QUEUE_SIZE,
+            policy=settings.CHAT_SEND_QUEUE_POLICY,
+        )
+        self.joined_room = False
+        self.background_tasks = set()
+        await self.send_history()
+        await self.track_presence()
 
-    async def validate_access(self):
+    @database_sync_to_async
+    def resolve_access(self):
+        """Salon et droits en un seul passage synchrone, depuis le cache si possible (voir chat/rooms.py)."""
         try:
-            if self.role not in ['marchand', 'client']:
-                logger.warning(f"Invalid role: {self.role}")
-                return False
-            return await self._validate_access_db()
+            info = resolve_room(self.room_name, self.boutique_id)
+            self.room = room_from_info(self.room_name, info)
+            return check_access(info, self.user, self.role)
         except Exception as e:
             logger.error(f"Erreur de validation d'accès: {str(e)}")
+            return False, 'Internal error'
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Toutes les trames passent par la file bornée de la connexion (voir chat/throttling.py)."""
+        if text_data is not None and self.wire_format != DEFAULT_FORMAT:
+            frame = encode_text(text_data, self.wire_format)
+            text_data, bytes_data = frame.get('text_data'), frame.get('bytes_data')
+        send_queue = getattr(self, 'send_queue', None)
+        if send_queue is None:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+            return
+        await send_queue.put(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def throttle_frame(self):
+        """True si la trame doit être ignorée (seau de la connexion) ; vérifié avant tout décodage."""
+        if self.frame_bucket.consume():
             return False
+        await self.rate_limited('throttled_connection')
+        return True
 
-    @database_sync_to_async
-    def _validate_access_db(self):
-        try:
-            boutique = Boutique.objects.get(id=self.boutique_id)
-            if self.role == 'marchand':
-                return boutique.marchand.user == self.user
-            return True
-        except Boutique.DoesNotExist:
-            logger.error(f"Boutique with id {self.boutique_id} does not exist")
+    async def throttle_message(self, message_type):
+        """True si la trame décodée doit être ignorée (seau du salon, messages de chat uniquement)."""
+        if message_type != 'chat_message' or room_bucket(self.room_group_name).consume():
+            self.throttled_in_a_row = 0
             return False
+        await self.rate_limited('throttled_room')
+        return True
+
+    async def rate_limited(self, metric):
+        metrics.incr(metric)
+        self.throttled_in_a_row += 1
+        if self.throttled_in_a_row == 1:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Rate limit exceeded',
+                'code': 4029
+            }))
+        elif self.throttled_in_a_row == settings.CHAT_THROTTLE_CLOSE_AFTER:
+            metrics.incr('closed_flooding')
+            await self.close(code=4029)
 
     async def disconnect(self, close_code):
+        send_queue = getattr(self, 'send_queue', None)
+        if send_queue is not None:
+            send_queue.stop()
+        await self.untrack_presence()
+        try:
+            await writer.flush()
+        except Exception as e:
+            logger.error(f"Error flushing chat messages on disconnect: {str(e)}")
         try:
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+            if self.user and self.user.is_authenticated:
+                await self.channel_layer.group_discard(user_group(self.user.id), self.channel_name)
         except Exception as e:
             logger.error(f"Error during disconnect: {str(e)}")
 
-    async def receive(self, text_data):
+    async def track_presence(self):
+        """Enregistre la connexion (voir chat/presence.py) ; diffuse le passage en ligne."""
+        if not self.user or not self.user.is_authenticated:
+            return
         try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError as e:
+            if await get_presence().connect(self.boutique_id, self.role, self.user.id, self.channel_name):
+                await self.notify_member_status(True)
+            self.heartbeat_task = asyncio.create_task(self.presence_heartbeat())
+        except Exception as e:
+            logger.error(f"Error tracking presence: {str(e)}")
+
+    async def presence_heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.CHAT_PRESENCE_TTL / 3)
+            try:
+                await get_presence().heartbeat(self.boutique_id, self.role, self.user.id, self.channel_name)
+            except Exception as e:
+                logger.error(f"Error refreshing presence: {str(e)}")
+
+    async def untrack_presence(self):
+        heartbeat_task = getattr(self, 'heartbeat_task', None)
+        if heartbeat_task is None:
+            return
+        heartbeat_task.cancel()
+        try:
+            if await get_presence().disconnect(self.boutique_id, self.role, self.user.id, self.channel_name):
+                await self.notify_member_status(False)
+        except Exception as e:
+            logger.error(f"Error clearing presence: {str(e)}")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Avant le décodage : une rafale de trames (même illisibles) ne coûte rien à décompresser
+        if await self.throttle_frame():
+            return
+        try:
+            data = decode(text_data, bytes_data, self.wire_format)
+            if not isinstance(data, dict):
+                raise ValueError("Frame is not an object")
+        except ValueError as e:
             logger.error(f"Invalid JSON data: {str(e)}")
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -84,6 +189,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         message_type = data.get('type')
+        if await self.throttle_message(message_type):
+            return
         if message_type == 'connect':
             await self.handle_connect(data)
         elif message_type == 'chat_message':
@@ -94,6 +201,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.handle_get_members(data)
         elif message_type == 'get_notifications':
             await self.handle_get_notifications(data)
+        elif message_type == 'get_presence':
+            await self.handle_get_presence(data)
+        elif message_type in ('read', 'reaction'):
+            await self.handle_receipt(message_type, data)
+        elif message_type == 'search':
+            await self.handle_search(data)
+        elif message_type == 'load_more':
+            await self.send_history(data.get('cursor'), data.get('page_size'))
         else:
             logger.warning(f"Unknown message type: {message_type}")
             await self.send(text_data=json.dumps({
@@ -134,19 +249,72 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }))
             return
 
+        if not self.user or not self.user.is_authenticated:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Authentification requise pour envoyer un message',
+                'code': 4001
+            }))
+            return
+
         try:
+            customer_id = int(customer_id) if customer_id else None
+            reply_to = int(data['reply_to']) if data.get('reply_to') else None
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid customer_id or reply_to',
+                'code': 4000
+            }))
+            return
+
+        try:
+            if self.room is None:
+                self.room = await self.ensure_room()
+            sent_at = timezone.now()
+            idempotency_key = make_idempotency_key(self.user.id, data.get('client_key'))
+            # Diffusion immédiate ; l'écriture en base est groupée par chat/persistence.py
+            accepted = writer.enqueue({
+                'idempotency_key': idempotency_key,
+                'room_id': self.room.id,
+                'user_id': self.user.id,
+                'customer_id': customer_id,
+                'reply_to_id': reply_to,
+                'message': message,
+                'timestamp': sent_at,
+            })
+            if not accepted:
+                # Base indisponible et tampon plein : le client renverra (même client_key)
+                metrics.incr('write_backpressure')
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'Message non enregistré, veuillez réessayer',
+                    'code': 4503,
+                    'client_key': data.get('client_key'),
+                }))
+                return
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'chat_message',
                     'message': message,
+                    'message_key': idempotency_key,
                     'sender_id': str(self.user.id),
                     'sender_name': f"{self.user.prenom} {self.user.nom}",
                     'customer_id': customer_id,
                     'boutique_id': boutique_id,
-                    'time': datetime.now().isoformat()
-                }
+                    'reply_to': str(reply_to) if reply_to else None,
+                    'time': sent_at.isoformat()
+                })
             )
+            if not self.joined_room:
+                # Les membres du salon sont les destinataires des notifications
+                await self.join_room()
+                self.joined_room = True
+            # Notifications hors du chemin critique : l'expéditeur n'attend pas la diffusion
+            task = asyncio.create_task(self.save_and_send_notification(message, f"{self.user.prenom} {self.user.nom}"))
+            self.background_tasks.add(task)
+            task.add_done_callback(self.background_tasks.discard)
         except Exception as e:
             logger.error(f"Error sending chat message: {str(e)}")
             await self.send(text_data=json.dumps({
@@ -168,22 +336,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }))
                 return
 
-            customers = await database_sync_to_async(list)(
-                User.objects.filter(
-                    role='client',
-                    chat_messages__room__boutique__id=boutique_id
-                ).distinct()
-            )
+            customers = await self.get_boutique_customers(boutique_id)
+            online = await get_presence().online_ids(self.boutique_id, 'client')
             await self.send(text_data=json.dumps({
                 'type': 'customers',
                 'customers': [
                     {
-                        'id': str(customer.id),
-                        'name': f"{customer.prenom} {customer.nom}",
-                        'isOnline': True
+                        'id': str(customer['id']),
+                        'name': f"{customer['prenom']} {customer['nom']}",
+                        'isOnline': customer['id'] in online
                     }
                     for customer in customers
-                ]
+                ],
+                'online_count': len(online)
             }))
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des clients: {str(e)}")
@@ -195,15 +360,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def handle_get_members(self, data):
         try:
-            boutique = await database_sync_to_async(Boutique.objects.get)(id=self.boutique_id)
-            marchand = await database_sync_to_async(lambda: boutique.marchand)()
+            marchand = await database_sync_to_async(
+                Boutique.objects.filter(id=self.boutique_id).values('marchand__user_id', 'marchand__user__prenom', 'marchand__user__nom').get
+            )()
+            online = await get_presence().online_ids(self.boutique_id, 'marchand')
             await self.send(text_data=json.dumps({
                 'type': 'members',
                 'members': [
                     {
-                        'id': str(marchand.user.id),
-                        'name': f"{marchand.user.prenom} {marchand.user.nom}",
-                        'isOnline': True
+                        'id': str(marchand['marchand__user_id']),
+                        'name': f"{marchand['marchand__user__prenom']} {marchand['marchand__user__nom']}",
+                        'isOnline': marchand['marchand__user_id'] in online
                     }
                 ]
             }))
@@ -215,6 +382,86 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'code': 4000
             }))
 
+    async def handle_receipt(self, message_type, data):
+        """
+        Lecture (« lu jusqu'à message_id ») ou réaction, écrites et diffusées par
+        lots (chat/receipts.py). Un message reçu en direct, dont l'id n'est pas
+        encore connu du client, peut être désigné par sa ``message_key``.
+        """
+        emoji = data.get('emoji')
+        try:
+            message_ref = int(data.get('message_id'))
+        except (TypeError, ValueError):
+            message_key = data.get('message_key')
+            message_ref = message_key if isinstance(message_key, str) and len(message_key) <= MAX_KEY_LENGTH else None
+        invalid_reaction = message_type == 'reaction' and (not emoji or len(emoji) > MAX_EMOJI_LENGTH)
+        if not message_ref or invalid_reaction or not self.user or not self.user.is_authenticated:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid read receipt or reaction',
+                'code': 4000
+            }))
+            return
+        if self.room is None:
+            # Le premier message du salon vient peut-être d'être diffusé
+            self.room = await self.get_existing_room()
+        if self.room is None:
+            # Aucun message persisté dans ce salon : rien à marquer
+            return
+        if message_type == 'read':
+            aggregator.add_read(self.channel_layer, self.room_group_name, self.room.id, self.user.id, message_ref)
+        else:
+            aggregator.add_reaction(self.channel_layer, self.room_group_name, self.room.id, self.user.id, message_ref, emoji)
+
+    async def handle_search(self, data):
+        """Recherche du marchand dans ce salon, ou ``"scope": "boutique"`` pour tous ses salons (chat/search.py)."""
+        if self.role != 'marchand':
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Search is reserved to the marchand',
+                'code': 4003
+            }))
+            return
+        boutique_scope = data.get('scope') == 'boutique'
+        if self.room is None and not boutique_scope:
+            self.room = await self.get_existing_room()
+        if self.room is None and not boutique_scope:
+            await self.send(text_data=json.dumps({
+                'type': 'search_results', 'query': data.get('query'), 'messages': [],
+                'next_cursor': None, 'has_more': False, 'mode': None
+            }))
+            return
+        try:
+            page = await database_sync_to_async(search_messages)(
+                data.get('query'),
+                room_id=None if boutique_scope else self.room.id,
+                boutique_id=self.boutique_id if boutique_scope else None,
+                cursor=data.get('cursor'),
+                page_size=data.get('page_size'),
+            )
+        except (InvalidCursor, ValueError, SearchTimeout) as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': str(e),
+                'code': 4000
+            }))
+            return
+        except Exception as e:
+            logger.error(f"Erreur lors de la recherche: {str(e)}")
+            return
+        await self.send(text_data=json.dumps({'type': 'search_results', 'query': data.get('query'), **page}))
+
+    async def handle_get_presence(self, data):
+        try:
+            presence = get_presence()
+            await self.send(text_data=json.dumps({
+                'type': 'presence',
+                'customers_online': await presence.online_count(self.boutique_id, 'client'),
+                'marchand_online': await presence.online_count(self.boutique_id, 'marchand') > 0
+            }))
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération de la présence: {str(e)}")
+
     async def handle_get_notifications(self, data):
         try:
             notifications = await database_sync_to_async(list)(
@@ -243,6 +490,16 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'code': 4000
             }))
 
+    async def chat_frame(self, event):
+        """Diffusion pré-encodée (voir chat/wire.py) : aucune sérialisation par destinataire en JSON."""
+        try:
+            send_queue = getattr(self, 'send_queue', None)
+            if send_queue is not None:
+                await send_queue.put(close=False, **encode_frame(event, self.wire_format))
+        except Exception as e:
+            logger.error(f"Error sending chat frame: {str(e)}")
+
+    # Évènements typés, encore émis par les workers pas encore redéployés
     async def chat_message(self, event):
         try:
             await self.send(text_data=json.dumps(event))
@@ -265,6 +522,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'type': 'member_status',
                 'user_id': event['user_id'],
                 'name': event['name'],
+                'role': event.get('role'),
                 'isOnline': event['isOnline']
             }))
         except Exception as e:
@@ -298,25 +556,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error sending message_pinned event: {str(e)}")
 
-    async def message_reaction(self, event):
+    async def receipts(self, event):
         try:
             await self.send(text_data=json.dumps({
-                'type': 'message_reaction',
-                'message_id': event['message_id'],
-                'emoji': event['emoji'],
-                'sender_name': event['sender_name']
+                'type': 'receipts',
+                'reads': event['reads'],
+                'reactions': event['reactions']
             }))
         except Exception as e:
-            logger.error(f"Error sending message_reaction event: {str(e)}")
-
-    async def message_read(self, event):
-        try:
-            await self.send(text_data=json.dumps({
-                'type': 'message_read',
-                'message_id': event['message_id']
-            }))
-        except Exception as e:
-            logger.error(f"Error sending message_read event: {str(e)}")
+            logger.error(f"Error sending receipts event: {str(e)}")
 
     async def notification(self, event):
         try:
@@ -326,7 +574,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'message': event['message'],
                 'sender_name': event['sender_name'],
                 'time': event['time'],
-                'read': event['read']
+                'read': event['read'],
+                'count': event.get('count', 1)
             }))
         except Exception as e:
             logger.error(f"Error sending notification event: {str(e)}")
@@ -448,41 +697,47 @@ class ChatConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error adding user to room: {str(e)}")
 
     @database_sync_to_async
-    def save_message(self, room, user, message, customer_id, reply_to):
-        try:
-            customer = User.objects.get(id=customer_id) if customer_id else user
-            msg = ChatMessage.objects.create(
-                room=room,
-                user=user,
-                customer=customer,
-                message=message,
-                reply_to_id=reply_to
-            )
-            return msg.id
-        except Exception as e:
-            logger.error(f"Error saving message: {str(e)}")
-            return None
+    def join_room(self):
+        self.room.members.add(self.user)
+
+    @database_sync_to_async
+    def ensure_room(self):
+        room_type = 'admin' if self.room_name.startswith('admin_') else 'shop'
+        room, _ = ChatRoom.objects.get_or_create(
+            name=self.room_name,
+            defaults={'room_type': room_type, 'boutique_id': self.boutique_id if room_type == 'shop' else None}
+        )
+        if str(room.boutique_id) != self.boutique_id:
+            raise PermissionError(f"Room {self.room_name} belongs to another boutique")
+        return room
 
     @database_sync_to_async
     def get_room_members(self, room):
         try:
             if room.room_type == 'shop':
-                return list(room.members.filter(role__iexact='Client').values('id', 'name', 'role', 'is_online'))
-            return list(room.members.filter(role__iexact='Admin').values('id', 'name', 'role', 'is_online'))
+                return list(room.members.filter(role__iexact='Client').values('id', 'prenom', 'nom', 'role'))
+            return list(room.members.filter(role__iexact='Admin').values('id', 'prenom', 'nom', 'role'))
         except Exception as e:
             logger.error(f"Error getting room members: {str(e)}")
             return []
 
     @database_sync_to_async
-    def get_previous_messages(self, room):
-        try:
-            return list(ChatMessage.objects.filter(room=room).order_by('timestamp').values(
-                'id', 'user__name', 'user__id', 'customer__id', 'message', 'timestamp',
-                'is_edited', 'is_deleted', 'reply_to_id'
-            ))
-        except Exception as e:
-            logger.error(f"Error getting previous messages: {str(e)}")
-            return []
+    def get_boutique_customers(self, boutique_id):
+        """Clients ayant écrit dans un salon de la boutique (membres des salons, pas de parcours des messages)."""
+        return list(
+            User.objects.filter(role='client', chat_rooms__boutique_id=boutique_id)
+            .values('id', 'prenom', 'nom').distinct()
+        )
+
+    @database_sync_to_async
+    def get_existing_room(self):
+        return ChatRoom.objects.filter(name=self.room_name, boutique_id=self.boutique_id).only(
+            'id', 'name', 'room_type', 'boutique_id'
+        ).first()
+
+    @database_sync_to_async
+    def get_history(self, cursor, page_size):
+        return get_history_page(self.room.id, cursor=cursor, page_size=page_size)
 
     @database_sync_to_async
     def get_previous_notifications(self, user):
@@ -521,26 +776,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error pinning message: {str(e)}")
 
-    @database_sync_to_async
-    def react_to_message(self, message_id, emoji):
-        try:
-            message = ChatMessage.objects.get(id=message_id)
-            MessageReaction.objects.get_or_create(
-                message=message, user=self.scope['user'], emoji=emoji
-            )
-        except Exception as e:
-            logger.error(f"Error reacting to message: {str(e)}")
-
-    @database_sync_to_async
-    def mark_message_as_read(self, message_id):
-        try:
-            message = ChatMessage.objects.get(id=message_id)
-            MessageRead.objects.get_or_create(message=message, user=self.scope['user'])
-            return message.id
-        except Exception as e:
-            logger.error(f"Error marking message as read: {str(e)}")
-            return None
-
     @database_sync_to_async
     def mark_notification_as_read(self, notification_id):
         try:
@@ -562,11 +797,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             marchand = await database_sync_to_async(lambda: self.room.boutique.marchand)()
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'customer_entered',
                     'customer_id': str(user.id),
                     'customer_name': user.name
-                }
+                })
             )
             notification = await database_sync_to_async(Notification.objects.create)(
                 user=marchand,
@@ -576,73 +811,63 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'notification',
                     'notification_id': str(notification.id),
                     'message': notification.message,
                     'sender_name': notification.sender,
                     'time': notification.timestamp.isoformat(),
-                    'read': notification.read
-                }
+                    'read': notification.read,
+                    'count': notification.count
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification d'entrée du client: {str(e)}")
 
-    async def save_and_send_notification(self, message, sender_name, message_id):
+    async def save_and_send_notification(self, message, sender_name, message_id=None):
         try:
-            members = await self.get_room_members(self.room)
-            for member in members:
-                if member['name'] != sender_name:
-                    user = await database_sync_to_async(User.objects.get)(id=member['id'])
-                    notification = await database_sync_to_async(Notification.objects.create)(
-                        user=user,
-                        message=f"New message from {sender_name}: {message[:50]}...",
-                        sender=sender_name,
-                        read=False
-                    )
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'notification',
-                            'notification_id': str(notification.id),
-                            'message': notification.message,
-                            'sender_name': notification.sender,
-                            'time': notification.timestamp.isoformat(),
-                            'read': notification.read
-                        }
-                    )
+            notifications = await database_sync_to_async(store_message_notifications)(
+                self.room.id, self.user.id, sender_name, message
+            )
+            await deliver(self.channel_layer, notifications)
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi de la notification: {str(e)}")
 
-    async def send_previous_messages(self):
+    async def send_history(self, cursor=None, page_size=None):
+        """Une seule trame par page d'historique (voir chat/history.py)."""
+        if self.room is None:
+            self.room = await self.get_existing_room()
+        if self.room is None:
+            # Salon pas encore créé : aucun message à envoyer
+            await self.send(text_data=json.dumps({
+                'type': 'history', 'messages': [], 'next_cursor': None, 'has_more': False, 'cursor': cursor
+            }))
+            return
         try:
-            messages = await self.get_previous_messages(self.room)
-            for msg in messages:
-                await self.send(text_data=json.dumps({
-                    'type': 'chat_message',
-                    'id': str(msg['id']),
-                    'message': msg['message'],
-                    'sender_name': msg['user__name'],
-                    'sender_id': str(msg['user__id']),
-                    'customer_id': str(msg['customer__id']) if msg['customer__id'] else None,
-                    'reply_to': msg.get('reply_to_id'),
-                    'time': msg['timestamp'].isoformat(),
-                    'is_edited': msg.get('is_edited', False),
-                    'is_deleted': msg.get('is_deleted', False)
-                }))
+            page = await self.get_history(cursor, page_size)
+        except InvalidCursor:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Invalid cursor',
+                'code': 4000
+            }))
+            return
         except Exception as e:
-            logger.error(f"Erreur lors de l'envoi des messages précédents: {str(e)}")
+            logger.error(f"Erreur lors de l'envoi de l'historique: {str(e)}")
+            return
+        await self.send(text_data=json.dumps({'type': 'history', 'cursor': cursor, **page}))
 
     async def send_members(self):
         try:
             members = await self.get_room_members(self.room)
+            online = await get_presence().online_ids(self.boutique_id, 'client')
             await self.send(text_data=json.dumps({
                 'type': 'customers' if self.room.room_type == 'shop' else 'members',
                 'customers' if self.room.room_type == 'shop' else 'members': [
                     {
                         'id': str(member['id']),
-                        'name': member['name'],
-                        'is_online': member['is_online']
+                        'name': f"{member['prenom']} {member['nom']}",
+                        'is_online': member['id'] in online
                     }
                     for member in members
                 ]
@@ -669,12 +894,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'member_status',
-                    'user_id': str(self.scope['user'].id),
-                    'name': self.scope['user'].name,
+                    'user_id': str(self.user.id),
+                    'name': f"{self.user.prenom} {self.user.nom}",
+                    'role': self.role,
                     'isOnline': is_online
-                }
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification du statut du membre: {str(e)}")
@@ -683,11 +909,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'message_edited',
                     'message_id': str(message_id),
                     'new_text': new_text
-                }
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification de modification du message: {str(e)}")
@@ -696,10 +922,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'message_deleted',
                     'message_id': str(message_id)
-                }
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification de suppression du message: {str(e)}")
@@ -708,48 +934,22 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'message_pinned',
                     'message_id': str(message_id)
-                }
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification de message épinglé: {str(e)}")
 
-    async def notify_message_reaction(self, message_id, emoji):
-        try:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'message_reaction',
-                    'message_id': str(message_id),
-                    'emoji': emoji,
-                    'sender_name': self.scope['user'].name
-                }
-            )
-        except Exception as e:
-            logger.error(f"Erreur lors de la notification de réaction au message: {str(e)}")
-
-    async def notify_message_read(self, message_id):
-        try:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'message_read',
-                    'message_id': str(message_id)
-                }
-            )
-        except Exception as e:
-            logger.error(f"Erreur lors de la notification de message lu: {str(e)}")
-
     async def notify_notification_read(self, notification_id):
         try:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'notification_read',
                     'notification_id': str(notification_id)
-                }
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification de lecture de notification: {str(e)}")
@@ -758,9 +958,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                group_frame({
                     'type': 'all_notifications_read'
-                }
+                })
             )
         except Exception as e:
             logger.error(f"Erreur lors de la notification de toutes notifications lues: {str(e)}")
@@ -0,0 +1,163 @@
+# chat/history.py
+"""
+Historique d'un salon envoyé par pages.
+
+À la connexion, le consumer envoie les ``CHAT_HISTORY_PAGE_SIZE`` derniers
+messages dans une seule trame ``history`` ; le client remonte ensuite avec
+``{"type": "load_more", "cursor": ...}``. Le curseur (timestamp, id) est lu
+via l'index (room, timestamp), donc le coût d'une page ne dépend pas de la
+taille du salon. Réponses citées, réactions et lectures (MessageRead et
+ReadWatermark) sont chargées en une requête chacune pour toute la page.
+
+Les messages plus vieux que CHAT_ARCHIVE_AFTER_DAYS peuvent avoir été déplacés
+dans ArchivedChatMessage (chat/archive.py) : quand une page atteint cet âge,
+elle est complétée depuis l'archive, lue par le même curseur.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from datadoit.pagination import decode_cursor, encode_cursor
+from .models import ArchivedChatMessage, ChatMessage, MessageRead, MessageReaction, ReadWatermark
+
+MAX_PAGE_SIZE = 200
+
+
+def get_page_size(requested=None, default=None):
+    default = default or settings.CHAT_HISTORY_PAGE_SIZE
+    try:
+        page_size = int(requested) if requested is not None else default
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+MESSAGE_FIELDS = (
+    'id', 'idempotency_key', 'room_id', 'message', 'timestamp', 'is_edited', 'is_deleted', 'reply_to_id', 'customer_id',
+    'user_id', 'user__prenom', 'user__nom',
+)
+
+
+def message_queryset():
+    """Messages avec juste les colonnes nécessaires à ``serialize_messages``."""
+    return ChatMessage.objects.select_related('user').only(*MESSAGE_FIELDS)
+
+
+def archive_queryset():
+    return ArchivedChatMessage.objects.select_related('user').only(*MESSAGE_FIELDS, 'reactions')
+
+
+def _display_name(user):
+    return f"{user.prenom} {user.nom}"
+
+
+def _reply_previews(reply_ids):
+    if not reply_ids:
+        return {}
+    fields = ('id', 'message', 'is_deleted', 'user__prenom', 'user__nom')
+    replies = list(ChatMessage.objects.filter(pk__in=reply_ids).select_related('user').only(*fields))
+    archived_ids = set(reply_ids) - {reply.pk for reply in replies}
+    if archived_ids:
+        replies += ArchivedChatMessage.objects.filter(pk__in=archived_ids).select_related('user').only(*fields)
+    return {
+        reply.pk: {
+            'id': str(reply.pk),
+            'message': '' if reply.is_deleted else reply.message[:100],
+            'sender_name': _display_name(reply.user),
+        }
+        for reply in replies
+    }
+
+
+def reaction_counts(message_ids):
+    """{message_id: [{'emoji', 'count'}, ...]} en une requête."""
+    reactions = defaultdict(list)
+    rows = (
+        MessageReaction.objects.filter(message_id__in=message_ids)
+        .values('message_id', 'emoji').annotate(count=Count('id')).order_by('message_id', 'emoji')
+    )
+    for row in rows:
+        reactions[row['message_id']].append({'emoji': row['emoji'], 'count': row['count']})
+    return reactions
+
+
+def _reads(messages, room_id):
+    """Lectures unitaires (MessageRead) et marques « lu jusqu'à » du salon (ReadWatermark)."""
+    reads = defaultdict(set)
+    ids = [message.pk for message in messages]
+    for message_id, user_id in MessageRead.objects.filter(message_id__in=ids).values_list('message_id', 'user_id'):
+        reads[message_id].add(user_id)
+    if room_id is not None and ids:
+        watermarks = ReadWatermark.objects.filter(room_id=room_id, message_id__gte=min(ids)).values_list('user_id', 'message_id')
+        for user_id, last_read_id in watermarks:
+            for message in messages:
+                if message.pk <= last_read_id and message.user_id != user_id:
+                    reads[message.pk].add(user_id)
+    return {message_id: sorted(str(user_id) for user_id in users) for message_id, users in reads.items()}
+
+
+def serialize_messages(messages, room_id=None):
+    """Même forme que les évènements ``chat_message``, enrichie des réponses, réactions et lectures."""
+    previews = _reply_previews({message.reply_to_id for message in messages if message.reply_to_id})
+    archived = [message for message in messages if isinstance(message, ArchivedChatMessage)]
+    reactions = reaction_counts([message.pk for message in messages if not isinstance(message, ArchivedChatMessage)])
+    # Réactions des messages archivés : figées à l'archivage
+    reactions.update({message.pk: message.reactions for message in archived})
+    reads = _reads(messages, room_id)
+    return [
+        {
+            'id': str(message.pk),
+            # Clé de la diffusion en direct : le client rapproche ses messages live de l'historique
+            'message_key': message.idempotency_key,
+            'message': '' if message.is_deleted else message.message,
+            'sender_name': _display_name(message.user),
+            'sender_id': str(message.user_id),
+            'customer_id': str(message.customer_id) if message.customer_id else None,
+            'reply_to': str(message.reply_to_id) if message.reply_to_id else None,
+            'reply_preview': previews.get(message.reply_to_id),
+            'time': message.timestamp.isoformat(),
+            'is_edited': message.is_edited,
+            'is_deleted': message.is_deleted,
+            'reactions': reactions.get(message.pk, []),
+            'read_by': reads.get(message.pk, []),
+        }
+        for message in messages
+    ]
+
+
+def get_history_page(room_id, cursor=None, page_size=None):
+    """
+    Page de messages antérieurs à ``cursor`` (les plus récents si None), en ordre
+    chronologique. Retourne ``{'messages', 'next_cursor', 'has_more'}`` ;
+    lève datadoit.pagination.InvalidCursor si le curseur est illisible.
+    """
+    page_size = get_page_size(page_size)
+    before = Q()
+    if cursor:
+        timestamp, pk, _ = decode_cursor(cursor, ChatMessage._meta.get_field('timestamp'), ChatMessage._meta.pk)
+        before = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk)
+
+    page = list(message_queryset().filter(before, room_id=room_id).order_by('-timestamp', '-pk')[:page_size + 1])
+    archive_horizon = timezone.now() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+    if len(page) <= page_size or page[-1].timestamp < archive_horizon:
+        # Fin des messages récents, ou page assez ancienne pour croiser l'archive
+        archived = archive_queryset().filter(before, room_id=room_id).order_by('-timestamp', '-pk')[:page_size + 1]
+        hot_ids = {message.pk for message in page}
+        page = sorted(
+            page + [message for message in archived if message.pk not in hot_ids],
+            key=lambda message: (message.timestamp, message.pk), reverse=True,
+        )[:page_size + 1]
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    page.reverse()
+
+    next_cursor = encode_cursor(page[0].timestamp.isoformat(), page[0].pk) if has_more else None
+    return {
+        'messages': serialize_messages(page, room_id),
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
+
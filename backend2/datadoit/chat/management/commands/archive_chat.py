@@ -0,0 +1,20 @@
+# chat/management/commands/archive_chat.py
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = 'Déplace les messages du chat plus vieux que CHAT_ARCHIVE_AFTER_DAYS vers l\'archive (à planifier, ex. chaque nuit)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size',
+            help='Messages déplacés par transaction (CHAT_ARCHIVE_BATCH_SIZE par défaut).',
+        )
+
+    def handle(self, *args, **options):
+        archived, purged = archive_messages(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Chat archivé : {archived} messages déplacés, {purged} notifications lues supprimées."
+        ))
@@ -1,27 +1,27 @@
-import jwt
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
 from urllib.parse import parse_qs
 import logging
+from users.user_cache import get_active_user
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
 @database_sync_to_async
 def get_user_from_jwt(token):
+    payload = {}
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        logger.debug(f"JWT payload: {payload}")
-        user = User.objects.get(id=payload["user_id"])
+        # Même validation (clé SIMPLE_JWT, expiration, type) que l'API REST
+        payload = AccessToken(token)
+        logger.debug(f"JWT payload: {payload.payload}")
+        user = get_active_user(payload["user_id"], payload.get("jti"))
         logger.info(f"User found: {user.email}")
         return user
-    except jwt.ExpiredSignatureError:
-        logger.error("Token has expired")
-        return None
-    except jwt.DecodeError as e:
-        logger.error(f"Token decode error: {e}")
+    except TokenError as e:
+        logger.error(f"Invalid token: {e}")
         return None
     except User.DoesNotExist:
         logger.error(f"User with id {payload.get('user_id')} does not exist")
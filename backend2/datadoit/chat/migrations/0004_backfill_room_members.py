@@ -0,0 +1,27 @@
+# Generated by Django 5.2
+
+from django.db import migrations
+
+
+def backfill_room_members(apps, schema_editor):
+    """Les membres des salons servent d'index clients par boutique : on y ajoute les auteurs des messages existants."""
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    Membership = apps.get_model('chat', 'ChatRoom').members.through
+    pairs = set(ChatMessage.objects.values_list('room_id', 'user_id').distinct())
+    pairs |= set(ChatMessage.objects.exclude(customer_id=None).values_list('room_id', 'customer_id').distinct())
+    Membership.objects.bulk_create(
+        [Membership(chatroom_id=room_id, user_id=user_id) for room_id, user_id in pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_notification_room_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_room_members, migrations.RunPython.noop),
+    ]
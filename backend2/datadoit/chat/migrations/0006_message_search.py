@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+from django.db import migrations
+
+# Doit rester identique à l'expression utilisée par chat/search.py pour que l'index serve
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    # (room_id, tsvector) : la recherche dans un salon ne parcourt que ses propres entrées
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_msg_fts_idx ON chat_chatmessage "
+    "USING GIN (room_id, to_tsvector('simple', message))",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_msg_trgm_idx ON chat_chatmessage "
+    "USING GIN (room_id, message gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS chat_msg_trgm_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS chat_msg_fts_idx",
+]
+
+# Table FTS5 « external content » : le texte reste dans chat_chatmessage, des triggers tiennent l'index à jour
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_chatmessage_fts USING fts5("
+    "message, content='chat_chatmessage', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chat_chatmessage_fts_ai AFTER INSERT ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_chatmessage_fts_ad AFTER DELETE ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_chatmessage_fts_au AFTER UPDATE OF message ON chat_chatmessage BEGIN "
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO chat_chatmessage_fts(rowid, message) VALUES (new.id, new.message); END",
+    "INSERT INTO chat_chatmessage_fts(chat_chatmessage_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chat_chatmessage_fts_au",
+    "DROP TRIGGER IF EXISTS chat_chatmessage_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_chatmessage_fts_ai",
+    "DROP TABLE IF EXISTS chat_chatmessage_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY ne peut pas s'exécuter dans une transaction
+    atomic = False
+
+    dependencies = [
+        ('chat', '0005_readwatermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
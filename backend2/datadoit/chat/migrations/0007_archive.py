@@ -0,0 +1,77 @@
+# Generated by Django 5.2 on 2026-10-18 00:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_archive_table(apps, schema_editor):
+    model = apps.get_model('chat', 'ArchivedChatMessage')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(model)
+        return
+    # Table partitionnée par mois sur timestamp ; les partitions sont créées par chat/archive.py
+    quote = schema_editor.quote_name
+    columns = [
+        f"{quote(field.column)} {field.db_type(schema_editor.connection)}{'' if field.null else ' NOT NULL'}"
+        for field in model._meta.local_fields
+    ]
+    schema_editor.execute(
+        f"CREATE TABLE {quote(model._meta.db_table)} ({', '.join(columns)}, PRIMARY KEY (id, timestamp)) "
+        f"PARTITION BY RANGE (timestamp)"
+    )
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('chat', 'ArchivedChatMessage'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_message_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='replies', to='chat.chatmessage'),
+        ),
+        migrations.AlterField(
+            model_name='readwatermark',
+            name='message',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='chat.chatmessage'),
+        ),
+        # Schéma géré par create_archive_table (table partitionnée sur PostgreSQL)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedChatMessage',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('message', models.TextField()),
+                        ('timestamp', models.DateTimeField()),
+                        ('idempotency_key', models.CharField(blank=True, editable=False, max_length=64, null=True)),
+                        ('is_edited', models.BooleanField(default=False)),
+                        ('is_deleted', models.BooleanField(default=False)),
+                        ('reply_to_id', models.BigIntegerField(blank=True, null=True)),
+                        ('reactions', models.JSONField(blank=True, default=list)),
+                        ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('customer', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                        ('room', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='chat.chatroom')),
+                        ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'ordering': ['timestamp'],
+                        'indexes': [models.Index(fields=['room', 'timestamp'], name='chat_archive_room_ts_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
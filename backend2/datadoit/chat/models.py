@@ -1,6 +1,7 @@
 # chat/models.py
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from boutique.models import Boutique
 
@@ -30,10 +31,16 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages')
     customer = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='customer_messages')
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Heure de réception par le serveur, fixée avant l'écriture différée (voir chat/persistence.py)
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Rend l'écriture idempotente : un message rejoué n'est inséré qu'une fois
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     is_edited = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
-    reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
+    # Sans contrainte : le message cité peut avoir été déplacé dans ArchivedChatMessage (chat/archive.py)
+    reply_to = models.ForeignKey(
+        'self', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='replies'
+    )
 
     class Meta:
         ordering = ['timestamp']
@@ -78,15 +85,67 @@ class MessageRead(models.Model):
     def __str__(self):
         return f"{self.user.name} read message {self.message.id}"
 
+class ReadWatermark(models.Model):
+    """« Lu jusqu'au message X » : un seul enregistrement par utilisateur et par salon (voir chat/receipts.py)."""
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_watermarks')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='read_watermarks')
+    # Seul l'id compte (« lu jusqu'à ») : il reste valable une fois le message archivé
+    message = models.ForeignKey(ChatMessage, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('room', 'user')
+
+    def __str__(self):
+        return f"User {self.user_id} read {self.room_id} up to {self.message_id}"
+
+class ArchivedChatMessage(models.Model):
+    """
+    Message ancien déplacé hors de ChatMessage par ``archive_chat`` (chat/archive.py).
+    Même id que le message d'origine ; réactions figées en compteurs. Sur
+    PostgreSQL la table est partitionnée par mois sur ``timestamp``.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    room = models.ForeignKey(
+        ChatRoom, on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='archived_messages'
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False, db_index=False, related_name='+')
+    customer = models.ForeignKey(
+        User, on_delete=models.CASCADE, db_constraint=False, db_index=False, null=True, related_name='+'
+    )
+    message = models.TextField()
+    timestamp = models.DateTimeField()
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    is_edited = models.BooleanField(default=False)
+    is_deleted = models.BooleanField(default=False)
+    reply_to_id = models.BigIntegerField(null=True, blank=True)
+    reactions = models.JSONField(default=list, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['room', 'timestamp'], name='chat_archive_room_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived message {self.id} ({self.room_id})"
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     message = models.TextField()
     sender = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     read = models.BooleanField(default=False)
+    # Notifications de message : une seule non lue par salon, ``count`` messages regroupés (chat/notifications.py)
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    count = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['room', 'read', 'user'], name='chat_notif_room_unread_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.name} from {self.sender}"
\ No newline at end of file
@@ -0,0 +1,91 @@
+# chat/notifications.py
+"""
+Diffusion groupée des notifications de message.
+
+Pour un message, les destinataires (membres du salon et marchand de la
+boutique, hors expéditeur) sont lus en une requête. Un destinataire qui a déjà
+une notification non lue pour ce salon ne reçoit pas de nouvelle ligne : elle
+est mise à jour (dernier aperçu, ``count`` + 1) par un seul UPDATE. Les autres
+notifications sont créées par un seul ``bulk_create``. Chaque notification est
+ensuite poussée sur le groupe personnel de son destinataire (``user_group``),
+tous les envois étant lancés ensemble.
+"""
+import asyncio
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChatRoom, Notification
+from .wire import group_frame
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    """Groupe channels rejoint par chaque connexion de l'utilisateur."""
+    return f"notifications_user_{user_id}"
+
+
+def message_preview(sender_name, message):
+    return f"New message from {sender_name}: {message[:50]}..."
+
+
+def _recipient_ids(room_id, sender_id):
+    rows = ChatRoom.objects.filter(pk=room_id).values_list('members__id', 'boutique__marchand__user_id')
+    recipients = set()
+    for member_id, marchand_user_id in rows:
+        recipients.update(user_id for user_id in (member_id, marchand_user_id) if user_id)
+    recipients.discard(sender_id)
+    return recipients
+
+
+@transaction.atomic
+def store_message_notifications(room_id, sender_id, sender_name, message):
+    """Crée ou regroupe les notifications d'un message ; quatre requêtes au plus quel que soit le salon."""
+    recipients = _recipient_ids(room_id, sender_id)
+    if not recipients:
+        return []
+    now = timezone.now()
+    preview = message_preview(sender_name, message)
+
+    unread = Notification.objects.filter(room_id=room_id, read=False, user_id__in=recipients)
+    coalesced = list(unread.select_for_update())
+    if coalesced:
+        Notification.objects.filter(pk__in=[n.pk for n in coalesced]).update(
+            message=preview, sender=sender_name, timestamp=now, count=F('count') + 1
+        )
+        for notification in coalesced:
+            notification.message, notification.sender, notification.timestamp = preview, sender_name, now
+            notification.count += 1
+
+    already_notified = {notification.user_id for notification in coalesced}
+    created = Notification.objects.bulk_create([
+        Notification(user_id=user_id, room_id=room_id, message=preview, sender=sender_name, timestamp=now)
+        for user_id in recipients - already_notified
+    ])
+    return coalesced + created
+
+
+def notification_event(notification):
+    return {
+        'type': 'notification',
+        'notification_id': str(notification.id),
+        'message': notification.message,
+        'sender_name': notification.sender,
+        'time': notification.timestamp.isoformat(),
+        'read': notification.read,
+        'count': notification.count,
+    }
+
+
+async def deliver(channel_layer, notifications):
+    """Un group_send par destinataire, tous envoyés en parallèle."""
+    results = await asyncio.gather(
+        *(channel_layer.group_send(user_group(n.user_id), group_frame(notification_event(n))) for n in notifications),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.error(f"{len(failures)}/{len(notifications)} notification deliveries failed: {str(failures[0])}")
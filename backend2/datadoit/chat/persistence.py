@@ -0,0 +1,368 @@
+# chat/persistence.py
+"""
+Persistance différée (write-behind) des messages du chat.
+
+Le consumer diffuse le message puis le dépose dans un tampon en mémoire du
+processus, sans attendre la base. Une tâche asyncio vide le tampon par
+``bulk_create`` dès CHAT_WRITE_BATCH_SIZE messages ou au plus tard toutes les
+CHAT_WRITE_FLUSH_MS millisecondes.
+
+Livraison au moins une fois, sans abandon : chaque lot en échec garde son
+propre compteur de tentatives et est retenté avec un délai exponentiel
+(CHAT_WRITE_FLUSH_MS, doublé à chaque échec, plafonné à
+CHAT_WRITE_RETRY_MAX_MS) ; les nouveaux messages attendent derrière lui.
+Après CHAT_WRITE_SPILL_AFTER échecs, le lot est déversé dans une liste Redis
+(settings.CHAT_WRITE_SPILL_REDIS_URL) puis réinjecté en base dès qu'une
+écriture réussit, par ce processus ou au démarrage d'un autre. Sans Redis, il
+reste en mémoire. Au-delà de CHAT_WRITE_MAX_BUFFERED messages en mémoire,
+``enqueue`` refuse les nouveaux messages : le consumer répond à l'expéditeur
+au lieu de diffuser un message qui ne serait pas enregistré.
+
+Un message qui ne pourra jamais être écrit (salon ou expéditeur supprimé
+entre la diffusion et l'écriture, ligne refusée par la base) est écarté par
+``write_messages`` sans bloquer le reste de son lot : il est journalisé et
+déposé dans une liste Redis de lettres mortes (DEAD_LETTER_KEY). La reprise
+des messages déversés dans Redis a son propre délai exponentiel.
+
+Chaque message porte une ``idempotency_key`` unique : une réécriture ou un
+renvoi du client est ignoré par la base (``ignore_conflicts``). Le tampon est
+aussi vidé à chaque déconnexion ; seul un arrêt brutal du processus peut
+perdre les messages encore en mémoire.
+"""
+import asyncio
+from datetime import datetime
+import json
+import logging
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DataError, IntegrityError, transaction
+
+from .models import ChatMessage, ChatRoom
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis absent : les lots en échec restent en mémoire
+    aioredis = None
+
+MAX_KEY_LENGTH = 64
+SPILL_KEY = 'chat:write-spill'
+DEAD_LETTER_KEY = 'chat:write-dead-letter'
+# Lots réinjectés depuis Redis par flush, pour ne pas monopoliser la boucle
+SPILL_DRAIN_BATCHES = 10
+
+
+def make_idempotency_key(user_id, client_key=None):
+    """Clé fournie par le client (préfixée par l'expéditeur) ou générée."""
+    if client_key:
+        key = f"{user_id}:{client_key}"
+        if len(key) <= MAX_KEY_LENGTH:
+            return key
+    return uuid.uuid4().hex
+
+
+def write_messages(rows):
+    """
+    Insère un lot de messages (dicts) en une requête, plus une pour vérifier
+    les salons et une pour les utilisateurs (expéditeurs et clients désignés),
+    et une pour les messages cités. Les doublons sont ignorés. Retourne les
+    lignes qui ne pourront jamais être écrites : salon ou expéditeur disparu,
+    ou ligne refusée par la base (isolée par bisection du lot). Les erreurs
+    transitoires (connexion, verrou) sont propagées pour être retentées.
+    """
+    room_ids = {row['room_id'] for row in rows}
+    user_ids = {row['user_id'] for row in rows} | {row['customer_id'] for row in rows if row['customer_id']}
+    reply_ids = {row['reply_to_id'] for row in rows if row['reply_to_id']}
+    known_rooms = set(ChatRoom.objects.filter(pk__in=room_ids).values_list('pk', flat=True))
+    known_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    known_replies = set(ChatMessage.objects.filter(pk__in=reply_ids).values_list('pk', flat=True)) if reply_ids else set()
+
+    writable = [row for row in rows if row['room_id'] in known_rooms and row['user_id'] in known_users]
+    rejected = [row for row in rows if not (row['room_id'] in known_rooms and row['user_id'] in known_users)]
+    messages = [
+        ChatMessage(
+            idempotency_key=row['idempotency_key'],
+            room_id=row['room_id'],
+            user_id=row['user_id'],
+            # Comme avant : sans client désigné, le message est rattaché à l'expéditeur
+            customer_id=row['customer_id'] if row['customer_id'] in known_users else row['user_id'],
+            reply_to_id=row['reply_to_id'] if row['reply_to_id'] in known_replies else None,
+            message=row['message'],
+            timestamp=row['timestamp'],
+        )
+        for row in writable
+    ]
+    return rejected + _insert(writable, messages)
+
+
+def _insert(rows, messages):
+    """``bulk_create`` de ``messages`` ; si la base refuse le lot, moitié par moitié jusqu'aux lignes fautives."""
+    if not messages:
+        return []
+    try:
+        # Point de sauvegarde : un refus n'annule pas la transaction englobante éventuelle
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(messages, ignore_conflicts=True)
+        return []
+    except (IntegrityError, DataError):
+        if len(messages) == 1:
+            return rows
+        middle = len(messages) // 2
+        return _insert(rows[:middle], messages[:middle]) + _insert(rows[middle:], messages[middle:])
+
+
+class RedisSpill:
+    """Liste Redis des messages qui n'ont pas pu être écrits (un JSON par message)."""
+
+    def __init__(self, url):
+        self.url = url
+        self._clients = {}
+
+    def _client(self):
+        # Un client par boucle asyncio (les connexions redis.asyncio y sont liées)
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.from_url(self.url)
+        return client
+
+    @staticmethod
+    def _dump(row):
+        return json.dumps({**row, 'timestamp': row['timestamp'].isoformat()})
+
+    @staticmethod
+    def _load(raw):
+        row = json.loads(raw)
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        return row
+
+    async def push(self, rows):
+        await self._client().rpush(SPILL_KEY, *[self._dump(row) for row in rows])
+
+    async def pop(self, count):
+        return [self._load(raw) for raw in await self._client().lpop(SPILL_KEY, count) or []]
+
+    async def unpop(self, rows):
+        # Remis en tête, dans l'ordre d'origine
+        await self._client().lpush(SPILL_KEY, *[self._dump(row) for row in reversed(rows)])
+
+    async def dead_letter(self, rows):
+        await self._client().rpush(DEAD_LETTER_KEY, *[self._dump(row) for row in rows])
+
+
+_spill = None
+
+
+def get_spill():
+    global _spill
+    if _spill is None:
+        url = settings.CHAT_WRITE_SPILL_REDIS_URL
+        if url and aioredis is not None:
+            _spill = RedisSpill(url)
+        elif url:
+            logger.warning("redis is not installed: failed chat batches stay in memory")
+    return _spill
+
+
+class _Backoff:
+    def __init__(self):
+        self.attempts = 0
+        self.retry_at = 0.0
+
+    @property
+    def due(self):
+        return self.retry_at <= time.monotonic()
+
+    def succeeded(self):
+        self.attempts = 0
+        self.retry_at = 0.0
+
+    def failed(self):
+        self.attempts += 1
+        delay = min(settings.CHAT_WRITE_FLUSH_MS * 2 ** (self.attempts - 1), settings.CHAT_WRITE_RETRY_MAX_MS)
+        self.retry_at = time.monotonic() + delay / 1000
+
+
+class _Batch(_Backoff):
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+
+
+class MessageWriter:
+    def __init__(self):
+        self._pending = []
+        # Lots en échec, dans l'ordre d'arrivée, chacun avec ses tentatives
+        self._retries = []
+        # Au démarrage, un autre processus a pu laisser des messages dans Redis
+        self._spill_check = True
+        self._drain_backoff = _Backoff()
+        self._loop = None
+        self._wakeup = None
+        self._flush_lock = None
+        self._task = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Une boucle par processus en production ; les tests en créent plusieurs
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def enqueue(self, row):
+        """
+        À appeler depuis la boucle asyncio ; ne fait aucune I/O. Retourne False
+        (message refusé) si CHAT_WRITE_MAX_BUFFERED messages attendent déjà.
+        """
+        self._bind_loop()
+        if self.pending >= settings.CHAT_WRITE_MAX_BUFFERED:
+            return False
+        self._pending.append(row)
+        if len(self._pending) >= settings.CHAT_WRITE_BATCH_SIZE:
+            self._wakeup.set()
+        return True
+
+    @property
+    def pending(self):
+        return len(self._pending) + sum(len(batch.rows) for batch in self._retries)
+
+    async def _run(self):
+        interval = settings.CHAT_WRITE_FLUSH_MS / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Chat message flush loop error: {str(e)}")
+
+    async def _write(self, batch):
+        """
+        Nombre de messages écrits (les lignes impossibles à écrire partent en
+        lettres mortes) ; None si le lot a échoué et a été replanifié (ou
+        déversé dans Redis).
+        """
+        try:
+            rejected = await database_sync_to_async(write_messages)(batch.rows)
+        except Exception as e:
+            batch.failed()
+            logger.warning(f"Chat message flush failed for {len(batch.rows)} messages (attempt {batch.attempts}), will retry: {str(e)}")
+            if batch.attempts >= settings.CHAT_WRITE_SPILL_AFTER and await self._spill(batch):
+                self._retries.remove(batch)
+            return None
+        await self._dead_letter(rejected)
+        return len(batch.rows) - len(rejected)
+
+    async def _dead_letter(self, rows):
+        if not rows:
+            return
+        logger.error(
+            f"{len(rows)} chat messages can never be written (room or sender deleted, or refused by the database), "
+            f"moved to {DEAD_LETTER_KEY}: {[row['idempotency_key'] for row in rows]}"
+        )
+        spill = get_spill()
+        if spill is None:
+            return
+        try:
+            await spill.dead_letter(rows)
+        except Exception as e:
+            logger.error(f"Could not store {len(rows)} dead-letter chat messages in Redis: {str(e)}")
+
+    async def _spill(self, batch):
+        spill = get_spill()
+        if spill is None:
+            return False
+        try:
+            await spill.push(batch.rows)
+        except Exception as e:
+            logger.error(f"Could not spill {len(batch.rows)} chat messages to Redis, keeping them in memory: {str(e)}")
+            return False
+        self._spill_check = True
+        logger.warning(f"Spilled {len(batch.rows)} chat messages to Redis after {batch.attempts} attempts")
+        return True
+
+    async def _drain_spill(self):
+        spill = get_spill()
+        if spill is None or not self._spill_check or not self._drain_backoff.due:
+            return 0
+        written = 0
+        for _ in range(SPILL_DRAIN_BATCHES):
+            try:
+                rows = await spill.pop(settings.CHAT_WRITE_BATCH_SIZE)
+            except Exception as e:
+                self._drain_backoff.failed()
+                logger.warning(f"Could not read spilled chat messages from Redis, will retry: {str(e)}")
+                break
+            if not rows:
+                self._spill_check = False
+                break
+            try:
+                rejected = await database_sync_to_async(write_messages)(rows)
+            except Exception as e:
+                await self._unpop(spill, rows)
+                self._drain_backoff.failed()
+                logger.warning(f"Chat spill drain failed (attempt {self._drain_backoff.attempts}), will retry: {str(e)}")
+                break
+            self._drain_backoff.succeeded()
+            await self._dead_letter(rejected)
+            written += len(rows) - len(rejected)
+        return written
+
+    async def _unpop(self, spill, rows):
+        try:
+            await spill.unpop(rows)
+        except Exception as e:
+            # Ni base ni Redis : le lot reste en mémoire avec les autres lots en échec
+            logger.error(f"Could not return {len(rows)} chat messages to Redis, keeping them in memory: {str(e)}")
+            batch = _Batch(rows)
+            batch.failed()
+            self._retries.append(batch)
+
+    async def flush(self):
+        """Écrit ce qui peut l'être (lots dus, puis tampon) ; retourne le nombre de messages écrits."""
+        if not self._pending and not self._retries and not self._spill_check:
+            return 0
+        self._bind_loop()
+        async with self._flush_lock:
+            written = 0
+            # Lots en échec d'abord, dans l'ordre ; pendant leur délai, rien d'autre n'est tenté
+            for batch in list(self._retries):
+                if not batch.due:
+                    return written
+                batch_written = await self._write(batch)
+                if batch_written is None:
+                    return written
+                self._retries.remove(batch)
+                written += batch_written
+
+            while self._pending:
+                batch = _Batch(self._pending[:settings.CHAT_WRITE_BATCH_SIZE])
+                del self._pending[:len(batch.rows)]
+                self._retries.append(batch)
+                batch_written = await self._write(batch)
+                if batch_written is None:
+                    return written
+                self._retries.remove(batch)
+                written += batch_written
+
+            try:
+                written += await self._drain_spill()
+            except Exception as e:
+                logger.error(f"Error draining spilled chat messages: {str(e)}")
+            return written
+
+
+writer = MessageWriter()
@@ -0,0 +1,153 @@
+# chat/presence.py
+"""
+Présence des utilisateurs connectés au chat d'une boutique.
+
+Dans Redis (settings.CHAT_PRESENCE_REDIS_URL), par boutique et par rôle :
+  - ``presence:<boutique>:<rôle>`` : sorted set des utilisateurs en ligne,
+    score = expiration ; nombre d'utilisateurs en ligne = un ZCOUNT ;
+  - ``presence:<boutique>:<rôle>:<user>`` : sorted set des connexions
+    (channel_name) de l'utilisateur, pour gérer plusieurs onglets.
+Chaque consumer rafraîchit ses entrées toutes les CHAT_PRESENCE_TTL / 3
+secondes : si un processus meurt, ses utilisateurs expirent d'eux-mêmes.
+
+``connect`` / ``disconnect`` indiquent si l'utilisateur vient de passer en
+ligne ou hors ligne : seuls ces changements sont diffusés.
+
+Sans CHAT_PRESENCE_REDIS_URL, un registre en mémoire du processus est utilisé
+(développement, serveur unique).
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis absent : registre local uniquement
+    aioredis = None
+
+
+def roster_key(boutique_id, role):
+    return f"presence:{boutique_id}:{role}"
+
+
+def connections_key(boutique_id, role, user_id):
+    return f"presence:{boutique_id}:{role}:{user_id}"
+
+
+class RedisPresence:
+    def __init__(self, url):
+        self.url = url
+        self._clients = {}
+
+    def _client(self):
+        # Un client par boucle asyncio (les connexions redis.asyncio y sont liées)
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.from_url(self.url)
+        return client
+
+    async def connect(self, boutique_id, role, user_id, channel_name):
+        now, ttl = time.time(), settings.CHAT_PRESENCE_TTL
+        roster, conns = roster_key(boutique_id, role), connections_key(boutique_id, role, user_id)
+        pipe = self._client().pipeline(transaction=True)
+        pipe.zremrangebyscore(conns, '-inf', now)
+        pipe.zadd(conns, {channel_name: now + ttl})
+        pipe.expire(conns, ttl)
+        pipe.zremrangebyscore(roster, '-inf', now)
+        pipe.zadd(roster, {user_id: now + ttl})
+        results = await pipe.execute()
+        return results[-1] == 1
+
+    async def heartbeat(self, boutique_id, role, user_id, channel_name):
+        now, ttl = time.time(), settings.CHAT_PRESENCE_TTL
+        conns = connections_key(boutique_id, role, user_id)
+        pipe = self._client().pipeline(transaction=True)
+        pipe.zadd(conns, {channel_name: now + ttl})
+        pipe.expire(conns, ttl)
+        pipe.zadd(roster_key(boutique_id, role), {user_id: now + ttl})
+        await pipe.execute()
+
+    async def disconnect(self, boutique_id, role, user_id, channel_name):
+        now = time.time()
+        conns = connections_key(boutique_id, role, user_id)
+        client = self._client()
+        pipe = client.pipeline(transaction=True)
+        pipe.zrem(conns, channel_name)
+        pipe.zremrangebyscore(conns, '-inf', now)
+        pipe.zcard(conns)
+        remaining = (await pipe.execute())[-1]
+        if remaining:
+            return False
+        return await client.zrem(roster_key(boutique_id, role), user_id) == 1
+
+    async def online_ids(self, boutique_id, role):
+        members = await self._client().zrangebyscore(roster_key(boutique_id, role), time.time(), '+inf')
+        return {int(member) for member in members}
+
+    async def online_count(self, boutique_id, role):
+        return await self._client().zcount(roster_key(boutique_id, role), time.time(), '+inf')
+
+
+class LocalPresence:
+    def __init__(self):
+        # {(boutique_id, role): {user_id: {channel_name: expiration}}}
+        self._rosters = {}
+
+    def _live(self, boutique_id, role):
+        roster = self._rosters.setdefault((str(boutique_id), role), {})
+        now = time.time()
+        for user_id in list(roster):
+            channels = {name: expires for name, expires in roster[user_id].items() if expires > now}
+            if channels:
+                roster[user_id] = channels
+            else:
+                del roster[user_id]
+        return roster
+
+    async def connect(self, boutique_id, role, user_id, channel_name):
+        roster = self._live(boutique_id, role)
+        came_online = user_id not in roster
+        roster.setdefault(user_id, {})[channel_name] = time.time() + settings.CHAT_PRESENCE_TTL
+        return came_online
+
+    async def heartbeat(self, boutique_id, role, user_id, channel_name):
+        roster = self._live(boutique_id, role)
+        roster.setdefault(user_id, {})[channel_name] = time.time() + settings.CHAT_PRESENCE_TTL
+
+    async def disconnect(self, boutique_id, role, user_id, channel_name):
+        roster = self._live(boutique_id, role)
+        channels = roster.get(user_id)
+        if channels is None:
+            return False
+        channels.pop(channel_name, None)
+        if channels:
+            return False
+        del roster[user_id]
+        return True
+
+    async def online_ids(self, boutique_id, role):
+        return set(self._live(boutique_id, role))
+
+    async def online_count(self, boutique_id, role):
+        return len(self._live(boutique_id, role))
+
+
+_presence = None
+
+
+def get_presence():
+    global _presence
+    if _presence is None:
+        url = settings.CHAT_PRESENCE_REDIS_URL
+        if url and aioredis is not None:
+            _presence = RedisPresence(url)
+        else:
+            if url:
+                logger.warning("redis is not installed: chat presence falls back to a per-process registry")
+            _presence = LocalPresence()
+    return _presence
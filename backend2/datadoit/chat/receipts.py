@@ -0,0 +1,192 @@
+# chat/receipts.py
+"""
+Accusés de lecture et réactions regroupés.
+
+Les clients envoient ``{"type": "read", "message_id": X}`` (lu jusqu'à X) et
+``{"type": "reaction", "message_id": X, "emoji": "..."}``, ou ``message_key`` à la
+place de ``message_id`` pour un message reçu en direct (dont l'id n'est pas
+encore connu) : la clé est résolue en id au moment de l'écriture, après avoir
+vidé le tampon d'écriture des messages (chat/persistence.py). Les évènements
+``receipts`` portent l'id et la clé de chaque message. Le consumer les dépose
+dans un agrégateur en mémoire : pendant CHAT_RECEIPT_DEBOUNCE_MS, les marques
+de lecture par (salon, utilisateur) et les réactions distinctes s'accumulent.
+À chaque fenêtre, un seul passage en base écrit les ReadWatermark (upsert,
+jamais en arrière) et les MessageReaction (``ignore_conflicts``), puis chaque
+salon reçoit un unique évènement ``receipts`` résumant lectures et compteurs
+de réactions.
+"""
+import asyncio
+from collections import defaultdict
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ChatMessage, MessageReaction, ReadWatermark
+from .persistence import writer
+from .wire import group_frame
+
+logger = logging.getLogger(__name__)
+
+MAX_EMOJI_LENGTH = MessageReaction._meta.get_field('emoji').max_length
+
+
+def advance_watermarks(marks):
+    """
+    ``marks`` : {(room_id, user_id): message_id}. Upsert des ReadWatermark qui
+    avancent (jamais en arrière), en deux requêtes ; retourne ceux écrits.
+    """
+    if not marks:
+        return []
+    current = {
+        (room_id, user_id): message_id
+        for room_id, user_id, message_id in ReadWatermark.objects.filter(
+            room_id__in={room_id for room_id, _ in marks}, user_id__in={user_id for _, user_id in marks}
+        ).values_list('room_id', 'user_id', 'message_id')
+    }
+    now = timezone.now()
+    advanced = [
+        ReadWatermark(room_id=room_id, user_id=user_id, message_id=message_id, updated_at=now)
+        for (room_id, user_id), message_id in marks.items()
+        if message_id > current.get((room_id, user_id), 0)
+    ]
+    ReadWatermark.objects.bulk_create(
+        advanced, update_conflicts=True, unique_fields=['room', 'user'], update_fields=['message', 'updated_at']
+    )
+    return advanced
+
+
+def write_receipts(reads, reactions):
+    """
+    ``reads`` : {(room_id, user_id): {message_ref, ...}} ;
+    ``reactions`` : {(room_id, message_ref, user_id, emoji)}, où ``message_ref``
+    est un id (int) ou une ``message_key`` (str).
+    Retourne {room_id: {'reads': [...], 'reactions': [...]}} pour la diffusion.
+    Nombre de requêtes constant quel que soit le volume.
+    """
+    refs = set().union(*reads.values()) | {message_ref for _, message_ref, _, _ in reactions}
+    ids = {ref for ref in refs if isinstance(ref, int)}
+    keys = refs - ids
+    lookup = Q(pk__in=ids)
+    if keys:
+        lookup |= Q(idempotency_key__in=keys)
+    messages = {}
+    for message_id, room_id, message_key in ChatMessage.objects.filter(lookup).values_list('pk', 'room_id', 'idempotency_key'):
+        messages[message_id] = (message_id, room_id, message_key)
+        if message_key in keys:
+            messages[message_key] = (message_id, room_id, message_key)
+    keys_by_id = {message_id: message_key for message_id, _, message_key in messages.values()}
+
+    def resolve(message_ref, room_id):
+        # Un message inconnu (ou pas encore écrit) ou d'un autre salon est ignoré
+        message = messages.get(message_ref)
+        return message[0] if message and message[1] == room_id else None
+
+    # La marque retenue est le plus haut message valide
+    reads = {
+        key: max(valid)
+        for key, candidates in reads.items()
+        if (valid := [message_id for ref in candidates if (message_id := resolve(ref, key[0]))])
+    }
+    reactions = {
+        (room_id, message_id, user_id, emoji)
+        for room_id, ref, user_id, emoji in reactions
+        if (message_id := resolve(ref, room_id))
+    }
+
+    summary = defaultdict(lambda: {'reads': [], 'reactions': []})
+    for watermark in advance_watermarks(reads):
+        summary[watermark.room_id]['reads'].append({
+            'user_id': str(watermark.user_id), 'message_id': str(watermark.message_id),
+            'message_key': keys_by_id.get(watermark.message_id),
+        })
+
+    if reactions:
+        MessageReaction.objects.bulk_create(
+            [
+                MessageReaction(message_id=message_id, user_id=user_id, emoji=emoji)
+                for _, message_id, user_id, emoji in reactions
+            ],
+            ignore_conflicts=True,
+        )
+        counts = (
+            MessageReaction.objects.filter(message_id__in={message_id for _, message_id, _, _ in reactions})
+            .values('message_id', 'emoji').annotate(count=Count('id')).order_by('message_id', 'emoji')
+        )
+        for row in counts:
+            summary[messages[row['message_id']][1]]['reactions'].append({
+                'message_id': str(row['message_id']), 'message_key': keys_by_id.get(row['message_id']),
+                'emoji': row['emoji'], 'count': row['count'],
+            })
+    return summary
+
+
+class ReceiptAggregator:
+    def __init__(self):
+        self._reads = {}
+        self._reactions = set()
+        self._groups = {}
+        self._loop = None
+        self._flush_lock = None
+        self._scheduled = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._flush_lock = asyncio.Lock()
+            self._scheduled = None
+        return loop
+
+    def _schedule(self, channel_layer):
+        loop = self._bind_loop()
+        if self._scheduled is None or self._scheduled.done():
+            self._scheduled = loop.create_task(self._flush_later(channel_layer))
+
+    async def _flush_later(self, channel_layer):
+        await asyncio.sleep(settings.CHAT_RECEIPT_DEBOUNCE_MS / 1000)
+        await self.flush(channel_layer)
+
+    def add_read(self, channel_layer, group_name, room_id, user_id, message_ref):
+        self._reads.setdefault((room_id, user_id), set()).add(message_ref)
+        self._groups[room_id] = group_name
+        self._schedule(channel_layer)
+
+    def add_reaction(self, channel_layer, group_name, room_id, user_id, message_ref, emoji):
+        self._reactions.add((room_id, message_ref, user_id, emoji))
+        self._groups[room_id] = group_name
+        self._schedule(channel_layer)
+
+    async def flush(self, channel_layer):
+        self._bind_loop()
+        async with self._flush_lock:
+            if not self._reads and not self._reactions:
+                return
+            reads, reactions, groups = self._reads, self._reactions, self._groups
+            self._reads, self._reactions, self._groups = {}, set(), {}
+            if any(isinstance(ref, str) for refs in reads.values() for ref in refs) or any(
+                isinstance(ref, str) for _, ref, _, _ in reactions
+            ):
+                # Messages désignés par leur clé : ceux encore en attente d'écriture doivent exister en base
+                await writer.flush()
+            try:
+                summary = await database_sync_to_async(write_receipts)(reads, reactions)
+            except Exception as e:
+                # Accusés de lecture et réactions ne sont pas critiques : pas de nouvel essai
+                logger.error(f"Error writing {len(reads)} read receipts / {len(reactions)} reactions: {str(e)}")
+                return
+            results = await asyncio.gather(
+                *(
+                    channel_layer.group_send(groups[room_id], group_frame({'type': 'receipts', **events}))
+                    for room_id, events in summary.items()
+                ),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Error broadcasting receipts: {str(result)}")
+
+
+aggregator = ReceiptAggregator()
@@ -0,0 +1,133 @@
+# chat/rooms.py
+"""
+Résolution en cache d'un salon et de ses droits d'accès à la connexion.
+
+``resolve_room`` renvoie en une seule requête (au plus) tout ce dont
+``ChatConsumer.connect`` a besoin : salon (id, type, boutique) s'il existe
+déjà et marchand de la boutique. Les deux parties sont gardées dans un LRU du
+processus (settings.CHAT_ROOM_LOCAL_TTL) devant le cache Redis partagé
+(settings.CHAT_ROOM_CACHE_TIMEOUT) ; chat/signals.py invalide les entrées à
+chaque modification d'un ChatRoom ou d'une Boutique. Une vague de reconnexions
+après un déploiement ne touche ainsi la base qu'une fois par salon.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Subquery
+
+from boutique.models import Boutique
+from datadoit.local_cache import LocalLRU
+from .models import ChatRoom
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MAX_ENTRIES = 4096
+
+_local = LocalLRU(LOCAL_MAX_ENTRIES)
+
+
+def _room_key(room_name):
+    return f"chat:room:{room_name}"
+
+
+def _boutique_key(boutique_id):
+    return f"chat:room-boutique:{boutique_id}"
+
+
+def _room_values(room):
+    if room is None:
+        # Salon pas encore créé : mis en cache aussi, invalidé par sa création
+        return {'room_id': None, 'room_type': None, 'room_boutique_id': None}
+    return {'room_id': room['id'], 'room_type': room['room_type'], 'room_boutique_id': room['boutique_id']}
+
+
+def _load(room_name, boutique_id, need_room, need_boutique):
+    rooms = ChatRoom.objects.filter(name=room_name)
+    if not need_boutique:
+        return _room_values(rooms.values('id', 'room_type', 'boutique_id').first()), None
+    boutiques = Boutique.objects.filter(pk=boutique_id).values('marchand__user_id')
+    if not need_room:
+        row = boutiques.first()
+        return None, (row and {'marchand_user_id': row['marchand__user_id']})
+    row = boutiques.annotate(
+        room_id=Subquery(rooms.values('id')[:1]),
+        room_type=Subquery(rooms.values('room_type')[:1]),
+        room_boutique_id=Subquery(rooms.values('boutique_id')[:1]),
+    ).first()
+    if row is None:
+        return None, None
+    room = {'room_id': row['room_id'], 'room_type': row['room_type'], 'room_boutique_id': row['room_boutique_id']}
+    return room, {'marchand_user_id': row['marchand__user_id']}
+
+
+def _get(key):
+    value = _local.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            _local.set(key, value, settings.CHAT_ROOM_LOCAL_TTL)
+    return value
+
+
+def _set(key, value):
+    cache.set(key, value, timeout=settings.CHAT_ROOM_CACHE_TIMEOUT)
+    _local.set(key, value, settings.CHAT_ROOM_LOCAL_TTL)
+
+
+def resolve_room(room_name, boutique_id):
+    """
+    Retourne ``{'boutique_id', 'marchand_user_id', 'room_id', 'room_type',
+    'room_boutique_id'}`` ou None si la boutique n'existe pas. ``room_id`` est
+    None tant que le salon n'a pas été créé (premier message). Au plus une
+    requête, aucune si les deux entrées sont en cache.
+    """
+    room = _get(_room_key(room_name))
+    boutique = _get(_boutique_key(boutique_id))
+    if room is None or boutique is None:
+        loaded_room, loaded_boutique = _load(room_name, boutique_id, room is None, boutique is None)
+        logger.debug(f"Chat room cache miss for {room_name} (boutique {boutique_id})")
+        if room is None and loaded_room is not None:
+            room = loaded_room
+            _set(_room_key(room_name), room)
+        if boutique is None and loaded_boutique is not None:
+            boutique = loaded_boutique
+            _set(_boutique_key(boutique_id), boutique)
+    if boutique is None:
+        return None
+    return {'boutique_id': int(boutique_id), **boutique, **(room or _room_values(None))}
+
+
+def check_access(info, user, role):
+    """(autorisé, raison) pour ``user`` connecté avec ``role`` au salon décrit par ``info``."""
+    if info is None:
+        return False, 'Boutique not found'
+    if role not in ('marchand', 'client'):
+        return False, f'Invalid role: {role}'
+    if role == 'marchand' and info['marchand_user_id'] != user.id:
+        return False, 'User is not the marchand of this boutique'
+    if info['room_id'] is not None and info['room_boutique_id'] != info['boutique_id']:
+        # L'historique est envoyé à la connexion : un salon n'est lisible que via sa boutique
+        return False, 'Room belongs to another boutique'
+    return True, ''
+
+
+def room_from_info(room_name, info):
+    """Instance ChatRoom construite depuis le cache, sans requête (None si le salon n'existe pas encore)."""
+    if info is None or info['room_id'] is None:
+        return None
+    return ChatRoom.from_db(
+        ChatRoom.objects.db,
+        ['id', 'name', 'room_type', 'boutique_id'],
+        [info['room_id'], room_name, info['room_type'], info['room_boutique_id']],
+    )
+
+
+def invalidate_room(room_name):
+    cache.delete(_room_key(room_name))
+    _local.discard(_room_key(room_name))
+
+
+def invalidate_boutique(boutique_id):
+    cache.delete(_boutique_key(boutique_id))
+    _local.discard(_boutique_key(boutique_id))
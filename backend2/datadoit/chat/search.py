@@ -0,0 +1,215 @@
+# chat/search.py
+"""
+Recherche plein texte dans l'historique du chat, pour les marchands.
+
+La recherche porte sur un salon ou sur tous les salons d'une boutique :
+  - PostgreSQL : ``to_tsvector('simple', message) @@ websearch_to_tsquery``,
+    classé par ``ts_rank``, servi par l'index GIN (room_id, tsvector) ;
+  - si aucun mot ne correspond (mot partiel, faute de frappe), repli sur
+    ``ILIKE '%…%'`` classé par similarité trigramme (pg_trgm), servi par
+    l'index GIN (room_id, message gin_trgm_ops) ;
+  - SQLite (développement) : table FTS5 ``chat_chatmessage_fts`` classée par
+    bm25, repli sur LIKE.
+Les index sont créés par la migration chat 0006. Sous SQLite, toute
+modification de ChatMessage reconstruit la table et supprime les triggers de
+synchronisation FTS5 : ``ensure_sqlite_index`` les réinstalle après chaque
+``migrate`` (chat/signals.py).
+
+Les résultats sont triés par pertinence puis par id décroissant. Le curseur
+(mode, rang, id) est appliqué dans la requête : le coût d'une page ne dépend
+que du nombre de messages correspondants, jamais de la taille du salon. Sur
+PostgreSQL, ``statement_timeout`` borne chaque recherche
+(settings.CHAT_SEARCH_TIMEOUT_MS).
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+
+from datadoit.pagination import InvalidCursor, decode_cursor, encode_cursor
+from .history import get_page_size, message_queryset, serialize_messages
+from .models import ChatMessage, ChatRoom
+
+logger = logging.getLogger(__name__)
+
+# Doit rester identique à l'expression indexée par la migration chat 0006
+TS_CONFIG = 'simple'
+MAX_QUERY_LENGTH = 200
+# En dessous, un motif LIKE ne peut pas utiliser l'index trigramme
+MIN_SUBSTRING_LENGTH = 3
+
+FULL_TEXT = 'fts'
+SUBSTRING = 'substring'
+
+MESSAGES = ChatMessage._meta.db_table
+ROOMS = ChatRoom._meta.db_table
+
+
+# Mêmes triggers que la migration chat 0006
+SQLITE_TRIGGERS = {
+    f'{MESSAGES}_fts_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {MESSAGES}_fts_ai AFTER INSERT ON {MESSAGES} BEGIN "
+        f"INSERT INTO {MESSAGES}_fts(rowid, message) VALUES (new.id, new.message); END"
+    ),
+    f'{MESSAGES}_fts_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {MESSAGES}_fts_ad AFTER DELETE ON {MESSAGES} BEGIN "
+        f"INSERT INTO {MESSAGES}_fts({MESSAGES}_fts, rowid, message) VALUES ('delete', old.id, old.message); END"
+    ),
+    f'{MESSAGES}_fts_au': (
+        f"CREATE TRIGGER IF NOT EXISTS {MESSAGES}_fts_au AFTER UPDATE OF message ON {MESSAGES} BEGIN "
+        f"INSERT INTO {MESSAGES}_fts({MESSAGES}_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+        f"INSERT INTO {MESSAGES}_fts(rowid, message) VALUES (new.id, new.message); END"
+    ),
+}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def ensure_sqlite_index(using='default'):
+    """Réinstalle les triggers FTS5 manquants et reconstruit l'index (SQLite uniquement)."""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE %s", [f'{MESSAGES}_fts%'])
+        existing = {name for name, in cursor.fetchall()}
+        if f'{MESSAGES}_fts' not in existing:
+            # Migration 0006 pas (ou plus) appliquée
+            return
+        missing = [sql for name, sql in SQLITE_TRIGGERS.items() if name not in existing]
+        if not missing:
+            return
+        for sql in missing:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {MESSAGES}_fts({MESSAGES}_fts) VALUES ('rebuild')")
+    logger.info(f"Reinstalled {len(missing)} chat search triggers and rebuilt the FTS5 index")
+
+
+def _scope_sql(room_id, boutique_id):
+    if room_id is not None:
+        return "m.room_id = %s", [room_id]
+    return f"m.room_id IN (SELECT id FROM {ROOMS} WHERE boutique_id = %s)", [boutique_id]
+
+
+def _fts5_query(query):
+    # Chaque mot entre guillemets : la syntaxe FTS5 (NEAR, *, ^...) saisie par l'utilisateur est neutralisée
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _matches_sql(mode, query, scope, scope_params):
+    """(sql, params) d'une sous-requête ``id, rank`` sur les messages correspondants."""
+    postgres = connection.vendor == 'postgresql'
+    if mode == FULL_TEXT and postgres:
+        return (
+            # float8 : le rang relu depuis le curseur doit être égal, au bit près, à celui recalculé
+            f"SELECT m.id, ts_rank(to_tsvector('{TS_CONFIG}', m.message), q)::float8 AS rank "
+            f"FROM {MESSAGES} m, websearch_to_tsquery('{TS_CONFIG}', %s) q "
+            f"WHERE {scope} AND NOT m.is_deleted AND to_tsvector('{TS_CONFIG}', m.message) @@ q",
+            [query, *scope_params],
+        )
+    if mode == FULL_TEXT and connection.vendor == 'sqlite':
+        return (
+            f"SELECT m.id, -bm25({MESSAGES}_fts) AS rank "
+            f"FROM {MESSAGES}_fts JOIN {MESSAGES} m ON m.id = {MESSAGES}_fts.rowid "
+            f"WHERE {MESSAGES}_fts MATCH %s AND {scope} AND NOT m.is_deleted",
+            [_fts5_query(query), *scope_params],
+        )
+    if mode == FULL_TEXT:
+        return None, None
+    if postgres:
+        return (
+            f"SELECT m.id, similarity(m.message, %s)::float8 AS rank FROM {MESSAGES} m "
+            f"WHERE {scope} AND NOT m.is_deleted AND m.message ILIKE %s",
+            [query, *scope_params, _like_pattern(query)],
+        )
+    # Sans similarité, les correspondances partielles sont classées par récence (id)
+    return (
+        f"SELECT m.id, 0.0 AS rank FROM {MESSAGES} m "
+        f"WHERE {scope} AND NOT m.is_deleted AND m.message LIKE %s ESCAPE '\\'",
+        [*scope_params, _like_pattern(query)],
+    )
+
+
+def _ranked_ids(mode, query, scope, scope_params, after, limit):
+    matches, params = _matches_sql(mode, query, scope, scope_params)
+    if matches is None:
+        return []
+    sql = f"SELECT id, rank FROM ({matches}) hits"
+    if after is not None:
+        rank, pk = after
+        sql += " WHERE rank < %s OR (rank = %s AND id < %s)"
+        params += [rank, rank, pk]
+    sql += " ORDER BY rank DESC, id DESC LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _run(mode, query, scope, scope_params, after, limit):
+    if connection.vendor != 'postgresql':
+        return _ranked_ids(mode, query, scope, scope_params, after, limit)
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [int(settings.CHAT_SEARCH_TIMEOUT_MS)])
+            return _ranked_ids(mode, query, scope, scope_params, after, limit)
+    except OperationalError as e:
+        # QueryCanceled (statement_timeout) est une OperationalError pour Django
+        logger.warning(f"Chat search timed out for {query!r}: {str(e)}")
+        raise SearchTimeout('Search took too long, refine the query')
+
+
+def search_messages(query, room_id=None, boutique_id=None, cursor=None, page_size=None):
+    """
+    Messages de ``room_id`` (ou de tous les salons de ``boutique_id``)
+    correspondant à ``query``, les plus pertinents d'abord. Retourne
+    ``{'messages', 'next_cursor', 'has_more', 'mode'}``. Lève ValueError pour
+    une recherche vide, InvalidCursor pour un curseur illisible et
+    SearchTimeout si la requête dépasse CHAT_SEARCH_TIMEOUT_MS.
+    """
+    query = (query or '').strip()[:MAX_QUERY_LENGTH]
+    if not query:
+        raise ValueError('Empty search query')
+    page_size = get_page_size(page_size, default=settings.CHAT_SEARCH_PAGE_SIZE)
+    scope, scope_params = _scope_sql(room_id, boutique_id)
+
+    after = None
+    if cursor:
+        value, pk, _ = decode_cursor(cursor)
+        if not isinstance(value, list) or len(value) != 2 or value[0] not in (FULL_TEXT, SUBSTRING):
+            raise InvalidCursor('Invalid cursor')
+        mode, after = value[0], (value[1], pk)
+        rows = _run(mode, query, scope, scope_params, after, page_size + 1)
+    else:
+        mode = FULL_TEXT
+        rows = _run(mode, query, scope, scope_params, None, page_size + 1)
+        if not rows and len(query) >= MIN_SUBSTRING_LENGTH:
+            mode = SUBSTRING
+            rows = _run(mode, query, scope, scope_params, None, page_size + 1)
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    ranks = dict(rows)
+    by_id = message_queryset().in_bulk(list(ranks))
+    messages = [by_id[pk] for pk, _ in rows if pk in by_id]
+
+    results = serialize_messages(messages, room_id)
+    for message, result in zip(messages, results):
+        result['room_id'] = str(message.room_id)
+        result['rank'] = ranks[message.pk]
+    last_pk, last_rank = rows[-1] if rows else (None, None)
+    return {
+        'messages': results,
+        'next_cursor': encode_cursor([mode, last_rank], last_pk) if has_more else None,
+        'has_more': has_more,
+        'mode': mode,
+    }
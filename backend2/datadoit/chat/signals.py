@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from boutique.models import Boutique
+from .models import ChatRoom
+from .rooms import invalidate_boutique, invalidate_room
+from .search import ensure_sqlite_index
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_cached_room(sender, instance, **kwargs):
+    room_name = instance.name
+    transaction.on_commit(lambda: invalidate_room(room_name))
+
+
+@receiver(post_save, sender=Boutique)
+@receiver(post_delete, sender=Boutique)
+def invalidate_cached_room_boutique(sender, instance, **kwargs):
+    # Lu tout de suite : après un post_delete, instance.pk vaut None au commit
+    boutique_id = instance.pk
+    transaction.on_commit(lambda: invalidate_boutique(boutique_id))
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'chat':
+        ensure_sqlite_index(using)
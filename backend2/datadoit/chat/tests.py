@@ -1,3 +1,456 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from io import StringIO
+import json
+from unittest import mock
+import zlib
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from boutique.tests import make_catalog, make_client
+from .archive import ARCHIVED_FIELDS
+from .consumers import ChatConsumer
+from .history import get_history_page
+from .notifications import store_message_notifications
+from .models import (
+    ArchivedChatMessage, ChatMessage, ChatRoom, MessageRead, MessageReaction, Notification, PinnedMessage, ReadWatermark,
+)
+from .persistence import MessageWriter, write_messages
+from .receipts import ReceiptAggregator, write_receipts
+from .rooms import _local, resolve_room
+from .throttling import TokenBucket
+from .wire import MAX_FRAME_BYTES, decode
+
+
+def row(n, room_id=1, user_id=1, message=None):
+    return {
+        'idempotency_key': f'key-{n}', 'room_id': room_id, 'user_id': user_id, 'customer_id': None,
+        'reply_to_id': None, 'message': message or f'message {n}', 'timestamp': timezone.now(),
+    }
+
+
+class FlakyDatabase:
+    """
+    Remplace write_messages : échoue ``failures`` fois puis enregistre les lots,
+    sauf les messages ``poison`` qu'il rejette comme impossibles à écrire.
+    """
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rows = []
+
+    def __call__(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database unavailable')
+        self.rows += [r for r in rows if r['message'] != 'poison']
+        return [r for r in rows if r['message'] == 'poison']
+
+
+class FakeSpill:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.dead = []
+
+    async def dead_letter(self, rows):
+        self.dead += rows
+
+    async def push(self, rows):
+        self.rows += rows
+
+    async def pop(self, count):
+        rows, self.rows = self.rows[:count], self.rows[count:]
+        return rows
+
+    async def unpop(self, rows):
+        self.rows[:0] = rows
+
+
+# Tâche de fond figée (FLUSH_MS) : les tests appellent flush eux-mêmes ; RETRY_MAX_MS=0 rend les reprises immédiates
+@override_settings(CHAT_WRITE_BATCH_SIZE=10, CHAT_WRITE_FLUSH_MS=60000, CHAT_WRITE_RETRY_MAX_MS=0,
+                   CHAT_WRITE_SPILL_AFTER=3, CHAT_WRITE_MAX_BUFFERED=50)
+class MessageWriterTests(SimpleTestCase):
+    def run_writer(self, database, scenario, spill=None):
+        writer = MessageWriter()
+        with mock.patch('chat.persistence.write_messages', database), \
+                mock.patch('chat.persistence.get_spill', return_value=spill):
+            return asyncio.run(scenario(writer))
+
+    def test_failed_batch_is_never_dropped(self):
+        database = FlakyDatabase(failures=8)
+
+        async def scenario(writer):
+            for n in range(5):
+                writer.enqueue(row(n))
+            for _ in range(9):
+                await writer.flush()
+            return writer.pending
+
+        self.assertEqual(self.run_writer(database, scenario), 0)
+        self.assertEqual([r['idempotency_key'] for r in database.rows], [f'key-{n}' for n in range(5)])
+
+    def test_attempts_are_counted_per_batch(self):
+        database = FlakyDatabase(failures=2)
+
+        async def scenario(writer):
+            writer.enqueue(row(1))
+            await writer.flush()
+            await writer.flush()
+            first = writer._retries[0].attempts
+            await writer.flush()
+            writer.enqueue(row(2))
+            database.failures = 1
+            await writer.flush()
+            return first, [batch.attempts for batch in writer._retries]
+
+        first, attempts = self.run_writer(database, scenario)
+        self.assertEqual(first, 2)
+        # Le premier lot est écrit ; le second a son propre compteur
+        self.assertEqual(attempts, [1])
+        self.assertEqual([r['idempotency_key'] for r in database.rows], ['key-1'])
+
+    @override_settings(CHAT_WRITE_RETRY_MAX_MS=60000)
+    def test_retry_waits_for_backoff(self):
+        database = FlakyDatabase(failures=1)
+
+        async def scenario(writer):
+            writer.enqueue(row(1))
+            await writer.flush()
+            writer.enqueue(row(2))
+            return await writer.flush(), writer.pending
+
+        self.assertEqual(self.run_writer(database, scenario), (0, 2))
+        self.assertEqual(database.rows, [])
+
+    def test_spills_after_repeated_failures_and_drains_on_recovery(self):
+        database = FlakyDatabase(failures=3)
+        spill = FakeSpill()
+
+        async def scenario(writer):
+            for n in range(4):
+                writer.enqueue(row(n))
+            for _ in range(3):
+                await writer.flush()
+            spilled = (writer.pending, len(spill.rows))
+            await writer.flush()
+            return spilled
+
+        self.assertEqual(self.run_writer(database, scenario, spill), (0, 4))
+        self.assertEqual(len(database.rows), 4)
+        self.assertEqual(spill.rows, [])
+
+    def test_poisoned_row_is_dead_lettered_without_blocking(self):
+        database = FlakyDatabase()
+        spill = FakeSpill()
+
+        async def scenario(writer):
+            for n in range(4):
+                writer.enqueue(row(n, message='poison' if n == 2 else None))
+            written = await writer.flush()
+            writer.enqueue(row(4))
+            return written + await writer.flush(), writer.pending
+
+        self.assertEqual(self.run_writer(database, scenario, spill), (4, 0))
+        self.assertEqual([r['idempotency_key'] for r in database.rows], ['key-0', 'key-1', 'key-3', 'key-4'])
+        self.assertEqual([r['idempotency_key'] for r in spill.dead], ['key-2'])
+        self.assertEqual(spill.rows, [])
+
+    @override_settings(CHAT_WRITE_RETRY_MAX_MS=60000)
+    def test_spill_drain_backs_off(self):
+        database = FlakyDatabase(failures=5)
+        spill = FakeSpill([row(1), row(2)])
+
+        async def scenario(writer):
+            for _ in range(3):
+                await writer.flush()
+
+        self.run_writer(database, scenario, spill)
+        # Une seule tentative pendant le délai, lignes remises en tête de la liste
+        self.assertEqual(database.failures, 4)
+        self.assertEqual([r['idempotency_key'] for r in spill.rows], ['key-1', 'key-2'])
+
+    def test_backpressure_when_buffer_is_full(self):
+        database = FlakyDatabase(failures=100)
+
+        async def scenario(writer):
+            accepted = [writer.enqueue(row(n)) for n in range(50)]
+            await writer.flush()
+            return accepted, writer.enqueue(row(50))
+
+        accepted, last = self.run_writer(database, scenario)
+        self.assertTrue(all(accepted))
+        self.assertFalse(last)
+
+
+class WriteMessagesTests(TestCase):
+    def setUp(self):
+        boutique = make_catalog(1, 0)[0]
+        self.room = ChatRoom.objects.create(name=f'boutique_{boutique.pk}', boutique=boutique)
+        self.user_id = boutique.marchand.user_id
+
+    def test_rows_with_deleted_room_or_sender_are_rejected(self):
+        rows = [row(1, self.room.pk, self.user_id), row(2, self.room.pk + 1, self.user_id), row(3, self.room.pk, 999999)]
+        rejected = write_messages(rows)
+        self.assertEqual([r['idempotency_key'] for r in rejected], ['key-2', 'key-3'])
+        self.assertEqual(list(ChatMessage.objects.values_list('idempotency_key', flat=True)), ['key-1'])
+
+    def test_refused_row_is_isolated(self):
+        bulk_create = ChatMessage.objects.bulk_create
+
+        def refuse_poison(messages, **kwargs):
+            if any(message.message == 'poison' for message in messages):
+                raise IntegrityError('refused')
+            return bulk_create(messages, **kwargs)
+
+        rows = [row(n, self.room.pk, self.user_id, message='poison' if n == 3 else None) for n in range(5)]
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=refuse_poison):
+            rejected = write_messages(rows)
+        self.assertEqual([r['idempotency_key'] for r in rejected], ['key-3'])
+        self.assertEqual(
+            sorted(ChatMessage.objects.values_list('idempotency_key', flat=True)), ['key-0', 'key-1', 'key-2', 'key-4']
+        )
+
+
+class RoomCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.boutique = make_catalog(1, 0)[0]
+        self.room_name = f'boutique_{self.boutique.pk}'
+
+    def test_deleted_boutique_is_evicted(self):
+        boutique_id = self.boutique.pk
+        self.assertIsNotNone(resolve_room(self.room_name, boutique_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.boutique.delete()
+        with self.assertNumQueries(1):
+            self.assertIsNone(resolve_room(self.room_name, boutique_id))
+
+    def test_created_room_is_resolved(self):
+        self.assertIsNone(resolve_room(self.room_name, self.boutique.pk)['room_id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            room = ChatRoom.objects.create(name=self.room_name, boutique=self.boutique)
+        self.assertEqual(resolve_room(self.room_name, self.boutique.pk)['room_id'], room.pk)
+
+
+class WireDecodeTests(SimpleTestCase):
+    def test_deflate_frame(self):
+        frame = zlib.compress(json.dumps({'type': 'connect'}).encode())
+        self.assertEqual(decode(None, frame, 'deflate'), {'type': 'connect'})
+
+    def test_decompression_bomb_is_rejected(self):
+        bomb = zlib.compress(b' ' * (100 * MAX_FRAME_BYTES))
+        self.assertLess(len(bomb), MAX_FRAME_BYTES)
+        with self.assertRaises(ValueError):
+            decode(None, bomb, 'deflate')
+
+    def test_truncated_and_oversized_frames_are_rejected(self):
+        frame = zlib.compress(json.dumps({'type': 'connect'}).encode())
+        with self.assertRaises(ValueError):
+            decode(None, frame[:-4], 'deflate')
+        with self.assertRaises(ValueError):
+            decode(' ' * (MAX_FRAME_BYTES + 1), None, 'json')
+
+
+class ConsumerThrottleTests(SimpleTestCase):
+    def make_consumer(self, tokens):
+        consumer = ChatConsumer()
+        consumer.room_group_name = 'chat_test'
+        consumer.wire_format = 'deflate'
+        consumer.frame_bucket = TokenBucket(0, tokens)
+        consumer.throttled_in_a_row = 0
+        consumer.send = mock.AsyncMock()
+        consumer.close = mock.AsyncMock()
+        return consumer
+
+    def test_throttled_frame_is_not_decoded(self):
+        consumer = self.make_consumer(tokens=0)
+        with mock.patch('chat.consumers.decode') as decode_mock:
+            asyncio.run(consumer.receive(bytes_data=b'frame'))
+        decode_mock.assert_not_called()
+        self.assertEqual(json.loads(consumer.send.call_args.kwargs['text_data'])['code'], 4029)
+
+    def test_frame_within_limit_is_decoded(self):
+        consumer = self.make_consumer(tokens=1)
+        frame = zlib.compress(json.dumps({'type': 'connect'}).encode())
+        asyncio.run(consumer.receive(bytes_data=frame))
+        self.assertEqual(json.loads(consumer.send.call_args.kwargs['text_data'])['type'], 'connection_established')
+        self.assertEqual(consumer.throttled_in_a_row, 0)
+
+
+class ReceiptKeyTests(TestCase):
+    def setUp(self):
+        boutique = make_catalog(1, 0)[0]
+        self.room = ChatRoom.objects.create(name=f'boutique_{boutique.pk}', boutique=boutique)
+        self.marchand_id = boutique.marchand.user_id
+        self.reader_id = make_client().pk
+        self.first, self.second = [
+            ChatMessage.objects.create(room=self.room, user_id=self.marchand_id, message=f'message {n}', idempotency_key=f'key-{n}')
+            for n in (1, 2)
+        ]
+
+    def test_history_carries_message_key(self):
+        messages = get_history_page(self.room.pk)['messages']
+        self.assertEqual([(m['id'], m['message_key']) for m in messages], [(str(self.first.pk), 'key-1'), (str(self.second.pk), 'key-2')])
+
+    def test_receipts_resolve_message_keys(self):
+        summary = write_receipts(
+            {(self.room.pk, self.reader_id): {self.first.pk, 'key-2', 'unknown-key'}},
+            {(self.room.pk, 'key-1', self.reader_id, '👍'), (self.room.pk, 'unknown-key', self.reader_id, '👍')},
+        )
+        self.assertEqual(ReadWatermark.objects.get(user_id=self.reader_id).message_id, self.second.pk)
+        self.assertEqual(list(MessageReaction.objects.values_list('message_id', flat=True)), [self.first.pk])
+        events = summary[self.room.pk]
+        self.assertEqual(events['reads'], [{'user_id': str(self.reader_id), 'message_id': str(self.second.pk), 'message_key': 'key-2'}])
+        self.assertEqual(events['reactions'], [{'message_id': str(self.first.pk), 'message_key': 'key-1', 'emoji': '👍', 'count': 1}])
+
+
+class ReceiptAggregatorTests(SimpleTestCase):
+    def run_flush(self, message_ref):
+        aggregator = ReceiptAggregator()
+        channel_layer = mock.Mock(group_send=mock.AsyncMock())
+
+        async def scenario():
+            aggregator.add_read(channel_layer, 'chat_test', 1, 2, message_ref)
+            await aggregator.flush(channel_layer)
+
+        with mock.patch('chat.receipts.writer') as writer_mock, \
+                mock.patch('chat.receipts.write_receipts', return_value={}) as write_mock:
+            writer_mock.flush = mock.AsyncMock()
+            asyncio.run(scenario())
+        write_mock.assert_called_once_with({(1, 2): {message_ref}}, set())
+        return writer_mock.flush
+
+    def test_pending_messages_are_written_before_resolving_keys(self):
+        self.run_flush('key-1').assert_awaited_once()
+
+    def test_ids_do_not_flush_messages(self):
+        self.run_flush(5).assert_not_awaited()
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        boutique = make_catalog(1, 0)[0]
+        self.room = ChatRoom.objects.create(name=f'boutique_{boutique.pk}', boutique=boutique)
+        self.marchand_id = boutique.marchand.user_id
+        self.client_id = make_client().pk
+        old = timezone.now() - timedelta(days=200)
+
+        def message(n, timestamp, **fields):
+            return ChatMessage.objects.create(
+                room=self.room, user_id=self.client_id, message=f'message {n}', timestamp=timestamp,
+                idempotency_key=f'key-{n}', **fields
+            )
+
+        self.old = [message(n, old + timedelta(minutes=n)) for n in range(3)]
+        self.old[1].is_edited = True
+        self.old[1].save()
+        self.pinned = message(3, old + timedelta(minutes=3))
+        PinnedMessage.objects.create(message=self.pinned, pinned_by_id=self.marchand_id)
+        self.recent = message(4, timezone.now(), reply_to=self.old[0])
+
+        MessageReaction.objects.create(message=self.old[0], user_id=self.marchand_id, emoji='👍')
+        MessageReaction.objects.create(message=self.old[0], user_id=self.client_id, emoji='👍')
+        MessageReaction.objects.create(message=self.old[0], user_id=self.client_id, emoji='❤')
+        MessageRead.objects.create(message=self.old[0], user_id=self.marchand_id)
+        MessageRead.objects.create(message=self.old[2], user_id=self.marchand_id)
+        MessageRead.objects.create(message=self.old[1], user_id=self.client_id)
+        # Marque déjà plus avancée que les lectures archivées : elle ne doit pas reculer
+        ReadWatermark.objects.create(room=self.room, user_id=self.client_id, message=self.recent)
+
+        Notification.objects.create(user_id=self.marchand_id, message='lue', sender='x', timestamp=old, read=True)
+        Notification.objects.create(user_id=self.marchand_id, message='non lue', sender='x', timestamp=old)
+
+    def archive(self):
+        call_command('archive_chat', batch_size=2, stdout=StringIO())
+
+    def state(self):
+        return (
+            list(ArchivedChatMessage.objects.order_by('pk').values(*ARCHIVED_FIELDS, 'reactions')),
+            list(ChatMessage.objects.order_by('pk').values_list('pk', flat=True)),
+            sorted(ReadWatermark.objects.values_list('room_id', 'user_id', 'message_id')),
+            list(Notification.objects.values_list('message', flat=True)),
+        )
+
+    def test_archive_moves_old_messages(self):
+        source = {row['id']: row for row in ChatMessage.objects.filter(pk__in=[m.pk for m in self.old]).values(*ARCHIVED_FIELDS)}
+        self.archive()
+
+        archived, hot, watermarks, notifications = self.state()
+        self.assertEqual([{field: row[field] for field in ARCHIVED_FIELDS} for row in archived], [source[m.pk] for m in self.old])
+        self.assertEqual(archived[0]['reactions'], [{'emoji': '❤', 'count': 1}, {'emoji': '👍', 'count': 2}])
+        self.assertEqual(archived[1]['reactions'], [])
+        self.assertEqual(hot, [self.pinned.pk, self.recent.pk])
+        archived_ids = [m.pk for m in self.old]
+        self.assertFalse(MessageReaction.objects.filter(message_id__in=archived_ids).exists())
+        self.assertFalse(MessageRead.objects.filter(message_id__in=archived_ids).exists())
+        self.assertEqual(watermarks, sorted([
+            (self.room.pk, self.marchand_id, self.old[2].pk), (self.room.pk, self.client_id, self.recent.pk),
+        ]))
+        self.assertEqual(notifications, ['non lue'])
+        # L'historique lit l'archive de façon transparente
+        messages = get_history_page(self.room.pk)['messages']
+        self.assertEqual([m['id'] for m in messages], [str(m.pk) for m in [*self.old, self.pinned, self.recent]])
+
+    def test_second_run_changes_nothing(self):
+        self.archive()
+        before = self.state()
+        self.archive()
+        self.assertEqual(self.state(), before)
+
+
+class NotificationTests(TestCase):
+    """Regroupement des notifications de message, en un nombre de requêtes constant (chat/notifications.py)."""
+
+    def setUp(self):
+        boutique = make_catalog(1, 0)[0]
+        self.room = ChatRoom.objects.create(name=f'boutique_{boutique.pk}', boutique=boutique)
+        self.marchand_id = boutique.marchand.user_id
+        self.sender_id = make_client('sender@example.com').pk
+        self.room.members.add(self.sender_id)
+
+    def add_members(self, count):
+        members = [make_client(f'member{self.room.members.count()}-{n}@example.com').pk for n in range(count)]
+        self.room.members.add(*members)
+        return members
+
+    def store(self, message):
+        # Points de sauvegarde du @transaction.atomic exclus : seules les requêtes utiles comptent
+        with CaptureQueriesContext(connection) as queries:
+            notifications = store_message_notifications(self.room.pk, self.sender_id, 'Client', message)
+        return notifications, [q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def test_notifications_are_coalesced(self):
+        reader, other = self.add_members(2)
+        created, _ = self.store('premier')
+        self.assertEqual(sorted(n.user_id for n in created), sorted([self.marchand_id, reader, other]))
+        Notification.objects.filter(user_id=reader).update(read=True)
+
+        self.store('deuxième')
+        notifications = Notification.objects.filter(room=self.room)
+        self.assertFalse(notifications.filter(user_id=self.sender_id).exists())
+        self.assertEqual(
+            sorted(notifications.filter(read=False).values_list('user_id', 'count')),
+            sorted([(self.marchand_id, 2), (other, 2), (reader, 1)]),
+        )
+        self.assertTrue(all('deuxième' in n.message for n in notifications.filter(read=False)))
+
+    def test_at_most_four_queries(self):
+        members = self.add_members(2)
+        _, first = self.store('premier')
+        Notification.objects.filter(user_id=members[0]).update(read=True)
+        _, mixed = self.store('deuxième')
+        self.assertLessEqual(len(first), 4)
+        self.assertEqual(len(mixed), 4)
+
+        members += self.add_members(20)
+        Notification.objects.filter(user_id__in=members[:5]).update(read=True)
+        notifications, larger = self.store('troisième')
+        self.assertEqual(len(notifications), len(members) + 1)
+        self.assertEqual(len(larger), len(mixed))
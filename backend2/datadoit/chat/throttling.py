@@ -0,0 +1,121 @@
+# chat/throttling.py
+"""
+Limites de débit et contre-pression du chat WebSocket.
+
+  - ``TokenBucket`` : un seau par connexion (toutes les trames reçues) et un
+    seau par salon, partagé par les connexions du processus (messages de chat
+    uniquement), réglés par settings.CHAT_RATE_LIMITS ;
+  - ``SendQueue`` : file d'envoi bornée par connexion. Quand un client ne lit
+    plus assez vite, la trame est abandonnée ou la connexion fermée selon
+    settings.CHAT_SEND_QUEUE_POLICY, au lieu d'accumuler de la mémoire dans le
+    worker ASGI ;
+  - ``metrics`` : compteurs des trames limitées / abandonnées, résumés dans les
+    logs toutes les CHAT_METRICS_LOG_INTERVAL secondes.
+"""
+import asyncio
+from collections import Counter
+import logging
+import time
+
+from django.conf import settings
+
+from datadoit.local_cache import LocalLRU
+
+logger = logging.getLogger(__name__)
+
+# Un seau de salon inactif depuis ce délai est oublié (il serait de toute façon plein)
+ROOM_BUCKET_IDLE_TTL = 300
+ROOM_BUCKETS_MAX = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def consume(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+_room_buckets = LocalLRU(ROOM_BUCKETS_MAX)
+
+
+def connection_bucket():
+    rate, burst = settings.CHAT_RATE_LIMITS['connection']
+    return TokenBucket(rate, burst)
+
+
+def room_bucket(room_group_name):
+    bucket = _room_buckets.get(room_group_name)
+    if bucket is None:
+        rate, burst = settings.CHAT_RATE_LIMITS['room']
+        bucket = TokenBucket(rate, burst)
+    # Réécrit à chaque accès : le TTL repart, le seau d'un salon actif reste en mémoire
+    _room_buckets.set(room_group_name, bucket, ROOM_BUCKET_IDLE_TTL)
+    return bucket
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = Counter()
+        self._logged_at = time.monotonic()
+
+    def incr(self, name, value=1):
+        self.counters[name] += value
+        now = time.monotonic()
+        if now - self._logged_at >= settings.CHAT_METRICS_LOG_INTERVAL:
+            self._logged_at = now
+            logger.warning(f"Chat backpressure metrics: {dict(self.counters)}")
+
+    def snapshot(self):
+        return dict(self.counters)
+
+
+metrics = Metrics()
+
+
+class SendQueue:
+    """
+    File bornée entre les handlers du consumer et la socket. ``send`` n'attend
+    jamais le client : si la file est pleine, la politique ``drop`` abandonne la
+    trame, ``close`` appelle ``on_overflow`` (fermeture de la connexion).
+    """
+
+    def __init__(self, send, on_overflow, maxsize, policy):
+        self._send = send
+        self._on_overflow = on_overflow
+        self._policy = policy
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+        self.overflowed = False
+
+    async def _drain(self):
+        while True:
+            kwargs = await self._queue.get()
+            try:
+                await self._send(**kwargs)
+            except Exception as e:
+                logger.error(f"Error writing to websocket: {str(e)}")
+
+    async def put(self, **kwargs):
+        try:
+            self._queue.put_nowait(kwargs)
+        except asyncio.QueueFull:
+            if self._policy == 'close':
+                if not self.overflowed:
+                    self.overflowed = True
+                    metrics.incr('closed_slow_consumer')
+                    await self._on_overflow()
+            else:
+                metrics.incr('dropped_outgoing')
+
+    def stop(self):
+        self._task.cancel()
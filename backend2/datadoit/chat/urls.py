@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import path
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-]
\ No newline at end of file
+    path('search/', views.search_chat_messages, name='chat-search'),
+]
@@ -1,3 +1,61 @@
-from django.shortcuts import render
+import logging
 
-# Create your views here.
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from boutique.models import Boutique
+from datadoit.pagination import InvalidCursor
+from .models import ChatRoom
+from .search import SearchTimeout, search_messages
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_chat_messages(request):
+    """
+    Recherche dans l'historique : ``?q=`` et ``?room=<nom du salon>`` ou
+    ``?boutique_id=`` (tous les salons de la boutique). Réservée au marchand
+    de la boutique. Pagination par ``?cursor=`` / ``?page_size=``.
+    """
+    query = request.query_params.get('q', '')
+    room_name = request.query_params.get('room')
+    boutique_id = request.query_params.get('boutique_id')
+    if not room_name and not boutique_id:
+        return Response({"success": False, "error": "room or boutique_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        room_id = None
+        if room_name:
+            room_id = ChatRoom.objects.filter(
+                name=room_name, boutique__marchand__user=request.user
+            ).values_list('id', flat=True).first()
+            if room_id is None:
+                return Response({"success": False, "error": "Salon introuvable"}, status=status.HTTP_404_NOT_FOUND)
+        elif not Boutique.objects.filter(pk=boutique_id, marchand__user=request.user).exists():
+            return Response({"success": False, "error": "Boutique introuvable"}, status=status.HTTP_404_NOT_FOUND)
+
+        page = search_messages(
+            query,
+            room_id=room_id,
+            boutique_id=None if room_id else boutique_id,
+            cursor=request.query_params.get('cursor'),
+            page_size=request.query_params.get('page_size'),
+        )
+        return Response({
+            "success": True,
+            "next": page['next_cursor'],
+            "has_more": page['has_more'],
+            "mode": page['mode'],
+            "messages": page['messages'],
+        })
+    except (InvalidCursor, ValueError) as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except SearchTimeout as e:
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logger.error(f"Error searching chat messages: {str(e)}")
+        return Response({"success": False, "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,122 @@
+# chat/wire.py
+"""
+Format des trames du chat WebSocket, négocié à la connexion.
+
+Le client choisit par ``?format=<nom>`` ou par sous-protocole WebSocket
+``chat.<nom>`` (``Sec-WebSocket-Protocol``) parmi settings.CHAT_WIRE_FORMATS :
+  - ``json`` (défaut) : trames texte, inchangées ;
+  - ``msgpack`` : trames binaires MessagePack (si le paquet ``msgpack`` est
+    installé, sinon repli sur JSON) ;
+  - ``deflate`` : JSON compressé par zlib en trames binaires, pour les
+    serveurs ASGI sans permessage-deflate.
+Les trames reçues en binaire sont décodées selon le même format ; une trame
+de plus de MAX_FRAME_BYTES (une fois décompressée) est refusée.
+
+Les diffusions de groupe passent par ``group_frame`` : le JSON est produit une
+fois par l'expéditeur et transporté tel quel dans l'évènement. Chaque autre
+format est encodé au plus une fois par processus (LRU indexé par
+``frame_id``), quel que soit le nombre de connexions du salon.
+"""
+import json
+import uuid
+import zlib
+
+from django.conf import settings
+
+from datadoit.local_cache import LocalLRU
+
+try:
+    import msgpack
+except ImportError:  # msgpack absent : format JSON uniquement
+    msgpack = None
+
+DEFAULT_FORMAT = 'json'
+SUBPROTOCOL_PREFIX = 'chat.'
+# Une trame diffusée est envoyée par toutes les connexions du processus en quelques millisecondes
+ENCODED_FRAME_TTL = 5
+ENCODED_FRAMES_MAX = 1024
+# Taille max d'une trame reçue, décompressée : une trame deflate n'est jamais décompressée au-delà
+MAX_FRAME_BYTES = 64 * 1024
+
+_encoded = LocalLRU(ENCODED_FRAMES_MAX)
+
+
+def available_formats():
+    return [
+        name for name in settings.CHAT_WIRE_FORMATS
+        if name in ('json', 'deflate') or (name == 'msgpack' and msgpack is not None)
+    ]
+
+
+def negotiate(params, subprotocols):
+    """
+    (format, sous-protocole à renvoyer dans le handshake ou None). Le paramètre
+    ``format`` l'emporte ; un format inconnu ou indisponible retombe sur JSON.
+    """
+    formats = available_formats()
+    offered = [p[len(SUBPROTOCOL_PREFIX):] for p in subprotocols if p.startswith(SUBPROTOCOL_PREFIX)]
+    requested = params.get('format')
+    if requested in formats:
+        fmt = requested
+    else:
+        fmt = next((name for name in offered if name in formats), DEFAULT_FORMAT)
+    # Un navigateur refuse la connexion si le serveur ne confirme pas l'un des sous-protocoles proposés
+    subprotocol = f'{SUBPROTOCOL_PREFIX}{fmt}' if fmt in offered else None
+    return fmt, subprotocol
+
+
+def _encode(payload, fmt):
+    if fmt == 'msgpack':
+        return {'bytes_data': msgpack.packb(payload)}
+    text = json.dumps(payload) if not isinstance(payload, str) else payload
+    if fmt == 'deflate':
+        return {'bytes_data': zlib.compress(text.encode())}
+    return {'text_data': text}
+
+
+def encode_text(text_data, fmt):
+    """Arguments de ``send`` pour une trame JSON déjà sérialisée, dans le format de la connexion."""
+    if fmt == 'msgpack':
+        return _encode(json.loads(text_data), fmt)
+    return _encode(text_data, fmt)
+
+
+def group_frame(payload):
+    """Évènement channels ``chat.frame`` : charge utile sérialisée une seule fois pour tout le groupe."""
+    return {'type': 'chat.frame', 'frame_id': uuid.uuid4().hex, 'text': json.dumps(payload)}
+
+
+def encode_frame(event, fmt):
+    """Arguments de ``send`` pour un évènement ``group_frame`` ; encodé une fois par processus et par format."""
+    if fmt == DEFAULT_FORMAT:
+        return {'text_data': event['text']}
+    key = f"{event['frame_id']}:{fmt}"
+    frame = _encoded.get(key)
+    if frame is None:
+        frame = encode_text(event['text'], fmt)
+        _encoded.set(key, frame, ENCODED_FRAME_TTL)
+    return frame
+
+
+def decode(text_data, bytes_data, fmt):
+    """Trame reçue -> objet Python. Lève ValueError si elle est illisible ou trop grande."""
+    if len(text_data if text_data is not None else bytes_data) > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame exceeds {MAX_FRAME_BYTES} bytes")
+    if text_data is not None:
+        return json.loads(text_data)
+    # Erreurs msgpack et JSON : sous-classes de ValueError
+    if fmt == 'msgpack':
+        return msgpack.unpackb(bytes_data)
+    if fmt == 'deflate':
+        decompressor = zlib.decompressobj()
+        try:
+            raw = decompressor.decompress(bytes_data, MAX_FRAME_BYTES)
+        except zlib.error as e:
+            raise ValueError(str(e))
+        if decompressor.unconsumed_tail:
+            # Bombe de décompression : le reste n'est jamais décompressé
+            raise ValueError(f"Decompressed frame exceeds {MAX_FRAME_BYTES} bytes")
+        if not decompressor.eof:
+            raise ValueError("Truncated deflate frame")
+        return json.loads(raw)
+    raise ValueError(f"Binary frames are not supported with format {fmt}")
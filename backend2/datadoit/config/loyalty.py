@@ -0,0 +1,73 @@
+# config/loyalty.py
+"""
+Badges et règles de parrainage en cache, pour les chemins d'écriture chauds
+(Client.save, inscription avec code de parrainage).
+
+Les deux tables sont minuscules et changent rarement : elles sont lues en
+entier, triées, et gardées dans un LRU du processus
+(settings.LOYALTY_RULES_LOCAL_TTL) devant le cache Redis partagé
+(settings.LOYALTY_RULES_CACHE_TIMEOUT). config/signals.py invalide la liste
+à chaque création, modification ou suppression d'un Badge ou d'une
+ReferralRule. Le badge mérité par un nombre de commandes est trouvé par
+bisection sur les seuils, sans requête.
+"""
+from bisect import bisect_right
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from datadoit.local_cache import LocalLRU
+from .models import Badge, ReferralRule
+
+logger = logging.getLogger(__name__)
+
+BADGES_KEY = 'loyalty:badges'
+REFERRAL_RULES_KEY = 'loyalty:referral-rules'
+
+_local = LocalLRU(8)
+
+
+def _cached(key, load):
+    value = _local.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is None:
+            value = load()
+            cache.set(key, value, timeout=settings.LOYALTY_RULES_CACHE_TIMEOUT)
+            logger.debug(f"Loyalty cache miss for {key}")
+        _local.set(key, value, settings.LOYALTY_RULES_LOCAL_TTL)
+    return value
+
+
+def _load_badges():
+    badges = list(Badge.objects.order_by('threshold', 'pk'))
+    return [badge.threshold for badge in badges], badges
+
+
+def _load_referral_rules():
+    rules = list(ReferralRule.objects.order_by('referrals_count', 'pk'))
+    return [rule.referrals_count for rule in rules], rules
+
+
+def eligible_badge(orders):
+    """Badge de plus haut seuil atteint avec ``orders`` commandes, ou None. Aucune requête si en cache."""
+    thresholds, badges = _cached(BADGES_KEY, _load_badges)
+    index = bisect_right(thresholds, orders or 0)
+    return badges[index - 1] if index else None
+
+
+def reached_referral_rules(referrals):
+    """Règles de parrainage dont le seuil est atteint avec ``referrals`` filleuls, par seuil croissant."""
+    counts, rules = _cached(REFERRAL_RULES_KEY, _load_referral_rules)
+    return rules[:bisect_right(counts, referrals or 0)]
+
+
+def invalidate_badges():
+    cache.delete(BADGES_KEY)
+    _local.discard(BADGES_KEY)
+
+
+def invalidate_referral_rules():
+    cache.delete(REFERRAL_RULES_KEY)
+    _local.discard(REFERRAL_RULES_KEY)
@@ -0,0 +1,147 @@
+# config/payment_plans.py
+"""
+Plans de paiement des boutiques (RemiseType) et calcul des échéanciers.
+
+``resolve_plans`` retourne le plan en vigueur (le RemiseType le plus récent)
+de plusieurs boutiques en une seule requête, aucune si tout est en cache :
+LRU du processus (settings.PAYMENT_PLAN_LOCAL_TTL) devant le cache Redis
+partagé (settings.PAYMENT_PLAN_CACHE_TIMEOUT). config/signals.py invalide la
+boutique à chaque création, modification ou suppression d'un RemiseType.
+
+``compute_schedule`` est un calcul pur (ni base ni cache) : montants après
+remise, part de remise et échéances de chaque tranche.
+"""
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from datadoit.local_cache import LocalLRU
+from .models import RemiseType
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MAX_ENTRIES = 1024
+
+CENT = Decimal('0.01')
+
+# Préfixe de l'unité -> jours ; 'année' avant 'an'
+DURATION_UNITS = {'jour': 1, 'day': 1, 'mois': 30, 'month': 30, 'année': 360, 'an': 360, 'year': 360}
+
+_local = LocalLRU(LOCAL_MAX_ENTRIES)
+
+
+def _plan_key(boutique_id):
+    return f"payment-plan:boutique:{boutique_id}"
+
+
+def _plan_values(remise_type):
+    if remise_type is None:
+        # Boutique sans plan : mis en cache aussi, invalidé par la création d'un RemiseType
+        return {'id': None}
+    return {
+        'id': remise_type.pk,
+        'type_remise': remise_type.type_remise,
+        'nombre_tranches': remise_type.nombre_tranches or 1,
+        'pourcentage_remise': Decimal(str(remise_type.pourcentage_remise)),
+        'montant_max_remise': (
+            Decimal(str(remise_type.montant_max_remise)) if remise_type.montant_max_remise else None
+        ),
+        'duree_plan_paiement': remise_type.duree_plan_paiement or '',
+    }
+
+
+def resolve_plans(boutique_ids):
+    """
+    ``{boutique_id: plan}`` où plan vaut ``{'id', 'type_remise', 'nombre_tranches',
+    'pourcentage_remise', 'montant_max_remise', 'duree_plan_paiement'}``, ou
+    None si la boutique n'a pas de RemiseType. Au plus une requête.
+    """
+    boutique_ids = set(boutique_ids)
+    plans = {}
+    for boutique_id in boutique_ids:
+        value = _local.get(_plan_key(boutique_id))
+        if value is not None:
+            plans[boutique_id] = value
+
+    missing = boutique_ids - set(plans)
+    if missing:
+        cached = cache.get_many([_plan_key(boutique_id) for boutique_id in missing])
+        for boutique_id in missing:
+            value = cached.get(_plan_key(boutique_id))
+            if value is not None:
+                plans[boutique_id] = value
+                _local.set(_plan_key(boutique_id), value, settings.PAYMENT_PLAN_LOCAL_TTL)
+
+    missing = boutique_ids - set(plans)
+    if missing:
+        latest = {}
+        # Le plus récent par boutique, comme RemiseType.objects.filter(boutique_id=...).first()
+        remise_types = RemiseType.objects.filter(boutique_id__in=missing).order_by('boutique_id', '-date_creation', '-pk')
+        for remise_type in remise_types:
+            latest.setdefault(remise_type.boutique_id, remise_type)
+        loaded = {boutique_id: _plan_values(latest.get(boutique_id)) for boutique_id in missing}
+        cache.set_many(
+            {_plan_key(boutique_id): value for boutique_id, value in loaded.items()},
+            timeout=settings.PAYMENT_PLAN_CACHE_TIMEOUT,
+        )
+        for boutique_id, value in loaded.items():
+            _local.set(_plan_key(boutique_id), value, settings.PAYMENT_PLAN_LOCAL_TTL)
+        plans.update(loaded)
+        logger.debug(f"Payment plan cache miss for boutiques {sorted(missing)}")
+
+    return {boutique_id: value if value['id'] is not None else None for boutique_id, value in plans.items()}
+
+
+def resolve_plan(boutique_id):
+    return resolve_plans([boutique_id])[boutique_id]
+
+
+def invalidate_plan(boutique_id):
+    cache.delete(_plan_key(boutique_id))
+    _local.discard(_plan_key(boutique_id))
+    logger.debug(f"Payment plan cache invalidated for boutique {boutique_id}")
+
+
+def parse_duration(duration_str):
+    """Durée du plan ('12 mois', '3 months', '90 jours') en jours ; 0 si illisible."""
+    match = re.match(r'\s*(\d+)\s*([^\W\d_]+)', (duration_str or '').lower())
+    if not match:
+        return 0
+    value, unit = int(match.group(1)), match.group(2)
+    for prefix, days in DURATION_UNITS.items():
+        if unit.startswith(prefix):
+            return value * days
+    return 0
+
+
+def _split(amount, count):
+    """``count`` parts au centime ; l'arrondi est reporté sur la dernière pour que la somme soit exacte."""
+    amount = amount.quantize(CENT)
+    part = (amount / count).quantize(CENT, rounding=ROUND_DOWN)
+    return [part] * (count - 1) + [amount - part * (count - 1)]
+
+
+def compute_schedule(total_initial, plan, start):
+    """
+    Échéancier d'un montant avant remise ``total_initial`` selon ``plan`` (voir
+    ``resolve_plans``), à partir de ``start`` : liste de ``{'numero', 'montant',
+    'remise', 'date_echeance'}``. La 1ère tranche est due à ``start``, les
+    suivantes sont réparties sur la durée du plan.
+    """
+    nombre_tranches = plan['nombre_tranches']
+    total_initial = Decimal(str(total_initial))
+    remise_totale = total_initial * plan['pourcentage_remise'] / Decimal('100')
+    if plan['montant_max_remise'] and remise_totale > plan['montant_max_remise']:
+        remise_totale = plan['montant_max_remise']
+
+    step = timedelta(days=parse_duration(plan['duree_plan_paiement']) / nombre_tranches)
+    montants = _split(total_initial - remise_totale, nombre_tranches)
+    remises = _split(remise_totale, nombre_tranches)
+    return [
+        {'numero': numero, 'montant': montant, 'remise': remise, 'date_echeance': start + (numero - 1) * step}
+        for numero, (montant, remise) in enumerate(zip(montants, remises), start=1)
+    ]
@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .loyalty import invalidate_badges, invalidate_referral_rules
+from .models import Badge, ReferralRule, RemiseType
+from .payment_plans import invalidate_plan
+
+
+@receiver(post_save, sender=RemiseType)
+@receiver(post_delete, sender=RemiseType)
+def invalidate_cached_plan(sender, instance, **kwargs):
+    if instance.boutique_id is not None:
+        transaction.on_commit(lambda: invalidate_plan(instance.boutique_id))
+
+
+@receiver(post_save, sender=Badge)
+@receiver(post_delete, sender=Badge)
+def invalidate_cached_badges(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_badges)
+
+
+@receiver(post_save, sender=ReferralRule)
+@receiver(post_delete, sender=ReferralRule)
+def invalidate_cached_referral_rules(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_referral_rules)
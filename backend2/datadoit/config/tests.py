@@ -1,3 +1,125 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from boutique.tests import make_catalog, make_client
+from cart.models import Order, OrderItem
+from cart.tests import make_order
+from cart.tranches import pay_tranches
+from datadoit.pagination import encode_cursor
+from .models import RemiseType
+from .payment_plans import _local, resolve_plan
+
+
+class PaymentPlanCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.boutique = make_catalog(1, 0)[0]
+
+    def create_plan(self, nombre_tranches):
+        with self.captureOnCommitCallbacks(execute=True):
+            return RemiseType.objects.create(
+                boutique=self.boutique, duree_plan_paiement='3 mois', type_remise='tranches',
+                nombre_tranches=nombre_tranches, pourcentage_remise=Decimal('5'),
+            )
+
+    def test_cached_plan_follows_remise_type_changes(self):
+        self.assertIsNone(resolve_plan(self.boutique.pk))
+        remise_type = self.create_plan(3)
+        self.assertEqual(resolve_plan(self.boutique.pk)['nombre_tranches'], 3)
+        with self.assertNumQueries(0):
+            resolve_plan(self.boutique.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            remise_type.nombre_tranches = 4
+            remise_type.save()
+        self.assertEqual(resolve_plan(self.boutique.pk)['nombre_tranches'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                remise_type.delete()
+        self.assertIsNone(resolve_plan(self.boutique.pk))
+
+    def test_latest_remise_type_wins(self):
+        self.create_plan(2)
+        self.assertEqual(resolve_plan(self.boutique.pk)['nombre_tranches'], 2)
+        latest = self.create_plan(6)
+        self.assertEqual(resolve_plan(self.boutique.pk)['id'], latest.pk)
+
+
+class ClientPaymentSchedulesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.boutique = make_catalog(1, 1)[0]
+        self.produit = self.boutique.produits.get()
+        RemiseType.objects.create(
+            boutique=self.boutique, duree_plan_paiement='3 mois', type_remise='tranches',
+            nombre_tranches=3, pourcentage_remise=Decimal('10'),
+        )
+        self.client_profile = make_client()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_profile.user)
+
+    def add_orders(self, count, days_ago=0):
+        orders = []
+        for n in range(count):
+            order = make_order(self.client_profile, total='100.00')
+            OrderItem.objects.create(order=order, produit=self.produit, quantite=1, prix=Decimal('100.00'))
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago, minutes=n))
+            orders.append(order)
+        return orders
+
+    def get(self, **params):
+        return self.api.get(f'/config/payments/{self.client_profile.pk}/', params)
+
+    def walk(self, **params):
+        seen, response = [], self.get(page_size=2, **params)
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            seen += [schedule['order_id'] for schedule in response.data['results']]
+            if not response.data['next']:
+                return seen
+            response = self.get(page_size=2, cursor=response.data['next'], **params)
+
+    def test_three_queries_per_page(self):
+        self.add_orders(3)
+        # Premier appel : les échéanciers manquants sont créés
+        self.assertEqual(self.get(page_size=2).status_code, 200)
+        with self.assertNumQueries(3):
+            first = self.get(page_size=2)
+        with self.assertNumQueries(3):
+            self.get(page_size=2, cursor=first.data['next'])
+        self.add_orders(10)
+        self.get()
+        with self.assertNumQueries(3):
+            response = self.get(page_size=2, status='pending')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_status_filter(self):
+        overdue = self.add_orders(1, days_ago=40)[0]
+        pending = self.add_orders(1)[0]
+        paid = self.add_orders(1, days_ago=5)[0]
+        self.get()
+        pay_tranches(paid)
+        for statut, order in (('overdue', overdue), ('pending', pending), ('paid', paid)):
+            with self.subTest(status=statut):
+                response = self.get(status=statut)
+                self.assertEqual([(s['order_id'], s['schedule_status']) for s in response.data['results']], [(order.pk, statut)])
+        self.assertEqual(self.get(status='late').status_code, 400)
+
+    def test_cursor_walk_covers_every_order_once(self):
+        orders = self.add_orders(5)
+        # Du plus récent au plus ancien : created_at recule d'une minute par commande
+        self.assertEqual(self.walk(), [order.pk for order in orders])
 
-# Create your tests here.
+    def test_invalid_cursor(self):
+        self.add_orders(1)
+        for cursor in ('not-a-cursor', encode_cursor('x', 1)):
+            self.assertEqual(self.get(cursor=cursor).status_code, 400)
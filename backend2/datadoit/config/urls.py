@@ -1,7 +1,7 @@
 from django.urls import path
 
 
-from .views import   badge_detail, badge_list_create, client_detail, client_list, mark_all_notifications_as_read, mark_notification_as_read, notification_detail, notification_list_create, pay_total, pay_tranche, payment_list, referral_detail, referral_list_create, remise_type_list_create, remise_type_detail
+from .views import   badge_detail, badge_list_create, client_detail, client_payment_schedules, client_list, mark_all_notifications_as_read, mark_notification_as_read, notification_detail, notification_list_create, pay_total, pay_tranche, payment_list, referral_detail, referral_list_create, remise_type_list_create, remise_type_detail
 
 urlpatterns = [
     path('admin/remises-types/', remise_type_list_create, name='remise-type-list-create'),
@@ -9,6 +9,7 @@ urlpatterns = [
     path('clients/<int:client_id>/orders/<int:order_id>/payments/', payment_list, name='payment-list'),
     path('clients/<int:client_id>/orders/<int:order_id>/pay-tranche/', pay_tranche, name='pay_tranche'),
     path('clients/<int:client_id>/orders/<int:order_id>/pay-total/', pay_total, name='pay_total'),
+    path('payments/<int:client_id>/', client_payment_schedules, name='client-payment-schedules'),
         # Badges
     path('badges/', badge_list_create, name='badge-list-create'),
     path('badges/<uuid:pk>/', badge_detail, name='badge-detail'),
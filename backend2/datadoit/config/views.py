@@ -1,6 +1,5 @@
-from datetime import datetime, timedelta, timezone
+from datetime import timezone
 from decimal import Decimal
-import re
 from venv import logger
 
 from rest_framework.decorators import api_view, permission_classes
@@ -8,15 +7,13 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 
-from cart.models import Order, OrderItem
+from cart.models import Order
 from .models import RemiseType
-from .serializers import PaymentScheduleSerializer, RemiseTypeSerializer
+from .serializers import RemiseTypeSerializer
 from boutique.models import Boutique
 
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from datetime import timedelta
-import re
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
@@ -153,288 +150,193 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from decimal import Decimal
-from datetime import timedelta
-from cart.models import  Order, OrderItem
+from cart.models import  Order
 from users.models import Client
 from config.models import RemiseType
-from .serializers import PaymentScheduleSerializer
-import re
 
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-from .serializers import PaymentScheduleSerializer, OrderSerializer
-from decimal import Decimal
-from datetime import timedelta
-
-import re
-
-
-
-def parse_duration(duration_str):
-    """Parse duration string (e.g., '12 mois') into days."""
-    if not duration_str:
-        return 0
-    match = re.match(r'(\d+)\s*(jour|mois|année)s?', duration_str.lower())
-    if not match:
-        return 0
-    value, unit = int(match.group(1)), match.group(2)
-    if unit == 'mois':
-        return value * 30  # 1 month = 30 days
-    elif unit == 'année':
-        return value * 360  # 1 year = 360 days
-    elif unit == 'jour':
-        return value * 1  # 1 day = 1 day
-    return 0
-
-
-
+from cart.models import Tranche
+from cart.tranches import (
+    SCHEDULE_STATUSES, NoPaymentPlan, TrancheAlreadyPaid, create_tranches, ensure_schedules, filter_by_schedule,
+    get_tranches, get_tranches_by_order, pay_tranches, schedule_status,
+)
+from datadoit.pagination import InvalidCursor, paginate_keyset
+
+
+def _payment_data(tranche):
+    """Échéance telle que l'attend le front (mêmes clés que l'ancien calcul à la volée)."""
+    remise_type = tranche.remise_type
+    montant_initial = tranche.montant + tranche.remise
+    pourcentage_remise = tranche.remise / montant_initial * Decimal('100') if montant_initial > 0 else Decimal('0')
+    payee = tranche.statut == Tranche.STATUT_PAYEE
+    return {
+        'id': f"order-{tranche.order_id}-{tranche.numero}",
+        'order_id': tranche.order_id,
+        'tranche': tranche.numero,
+        'montant': f"{tranche.montant:.2f}",
+        'montant_initial': f"{montant_initial:.2f}",
+        'date_ordre': tranche.order.created_at.isoformat(),
+        'date_echeance': tranche.date_echeance.isoformat(),
+        'statut': tranche.statut,
+        'statut_display': tranche.get_statut_display(),
+        'type_remise': remise_type.type_remise if remise_type else '',
+        'type_remise_display': remise_type.get_type_remise_display() if remise_type else '',
+        'remise_appliquee': f"{tranche.remise:.2f}",
+        'pourcentage_remise': f"{pourcentage_remise:.2f}",
+        'montant_apres_remise': f"{tranche.montant:.2f}",
+        'montant_paye': float(tranche.montant) if payee else 0,
+        'duree_plan_paiement': (remise_type.duree_plan_paiement or '') if remise_type else '',
+        'paid_at': tranche.paid_at.isoformat() if tranche.paid_at else None,
+    }
+
+
+def _schedule_data(tranches):
+    """Paiements, totaux et statut d'une commande à partir de ses tranches."""
+    montant_initial = sum((tranche.montant + tranche.remise for tranche in tranches), Decimal('0'))
+    remise = sum((tranche.remise for tranche in tranches), Decimal('0'))
+    paye = sum((tranche.montant for tranche in tranches if tranche.statut == Tranche.STATUT_PAYEE), Decimal('0'))
+    return {
+        'payments': [_payment_data(tranche) for tranche in tranches],
+        'totals': {
+            'total_montant_initial': f"{montant_initial:.2f}",
+            'total_remise': f"{remise:.2f}",
+            'total_apres_remise': f"{montant_initial - remise:.2f}",
+            'total_paye': f"{paye:.2f}",
+        },
+        'order_status': tranches[0].order.status,
+    }
+
+
+def _load_tranches(request, client_id, order_id):
+    """
+    Tranches de la commande, en une requête indexée ; l'échéancier est créé
+    s'il n'existe pas encore. Lève PermissionDenied, Http404 ou NoPaymentPlan.
+    """
+    if client_id != request.user.id:
+        raise PermissionDenied('Unauthorized: You do not have access to this client’s data')
+    tranches = get_tranches(order_id, client_id)
+    if not tranches:
+        order = get_object_or_404(Order, id=order_id, client_id=client_id)
+        create_tranches(order)
+        tranches = get_tranches(order_id, client_id)
+    return tranches
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def payment_list(request, client_id, order_id):
     """
-    Récupère dynamiquement les échéances de paiement pour une commande.
-    Divise le montant total de la commande par le nombre de tranches.
-    Divise la durée totale (duree_plan_paiement) par le nombre de tranches.
-    Pour la 1ère tranche: date_echeance = now()
-    Pour les tranches suivantes: date_echeance = now() + (tranche - 1) * (duration_days / nombre_tranches)
-    Retourne les paiements, les totaux, et le statut de la commande.
+    Récupère les échéances de paiement d'une commande depuis la table ``tranches``
+    (cart/tranches.py) : montant après remise, part de remise, date d'échéance
+    et statut de chaque tranche. Retourne les paiements, les totaux, et le
+    statut de la commande.
     """
     try:
-        user_id = request.user.id
-        client = get_object_or_404(Client, user_id=client_id)
-        if client.user_id != user_id:
-            return Response(
-                {'error': 'Unauthorized: You do not have access to this client’s data'},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        order = get_object_or_404(Order, id=order_id, client_id=client_id)
-        order_items = OrderItem.objects.filter(order_id=order_id).select_related('produit__boutique')
-
-        if not order_items.exists():
-            return Response(
-                {'error': 'No order items found for the specified order'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        tranches = _load_tranches(request, client_id, order_id)
+        return Response(_schedule_data(tranches), status=status.HTTP_200_OK)
+
+    except PermissionDenied as e:
+        return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+    except Http404:
+        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    except NoPaymentPlan as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response(
+            {'error': f'Erreur lors de la récupération des paiements: {str(e)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-        payments = []
-        total_montant_initial = Decimal('0')
-        total_remise = Decimal('0')
-        total_apres_remise = Decimal('0')
-        total_paye = Decimal('0')
-
-        # Calculate total order amount
-        for order_item in order_items:
-            montant = Decimal(str(order_item.prix * order_item.quantite))
-            total_montant_initial += montant
-
-        # Get remise_type from the first order item's boutique (assuming single boutique)
-        boutique_id = order_items.first().produit.boutique_id
-        remise_type = RemiseType.objects.filter(boutique_id=boutique_id).first()
-        if not remise_type:
-            return Response(
-                {'error': 'No discount type found for the boutique'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
 
-        # Calculate total discount
-        pourcentage_remise = Decimal(str(remise_type.pourcentage_remise))
-        remise_totale = (total_montant_initial * pourcentage_remise) / Decimal('100')
-        if remise_type.montant_max_remise and remise_totale > Decimal(str(remise_type.montant_max_remise)):
-            remise_totale = Decimal(str(remise_type.montant_max_remise))
-
-        # Calculate amount after discount
-        total_apres_remise = total_montant_initial - remise_totale
-
-        # Divide into tranches
-        nombre_tranches = remise_type.nombre_tranches or 1
-        montant_par_tranche = total_apres_remise / Decimal(str(nombre_tranches))
-        remise_par_tranche = remise_totale / Decimal(str(nombre_tranches))
-        pourcentage_remise_tranche = (
-            (remise_par_tranche / (montant_par_tranche + remise_par_tranche) * Decimal('100'))
-            if (montant_par_tranche + remise_par_tranche) > 0 else Decimal('0')
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def client_payment_schedules(request, client_id):
+    """
+    Échéanciers de toutes les commandes du client, en une réponse : même
+    contenu que ``payment_list`` par commande, plus ``schedule_status``
+    (pending / overdue / paid). ``?status=`` filtre sur ce statut ; pagination
+    par curseur sur la date de commande (``?cursor=``, ``?page_size=``,
+    ``?count=exact``). Trois requêtes par page quand les échéanciers existent.
+    """
+    if client_id != request.user.id:
+        return Response(
+            {'error': 'Unauthorized: You do not have access to this client’s data'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    schedule_filter = request.query_params.get('status')
+    if schedule_filter and schedule_filter not in SCHEDULE_STATUSES:
+        return Response(
+            {'error': f"status doit être l'un de : {', '.join(SCHEDULE_STATUSES)}"},
+            status=status.HTTP_400_BAD_REQUEST
         )
 
-        # Calculate duration per tranche in days
-        total_duration_days = parse_duration(remise_type.duree_plan_paiement)
-        duration_per_tranche = total_duration_days / nombre_tranches if nombre_tranches > 1 else 0
-
-        # Generate payment data for each tranche
-        for i in range(1, nombre_tranches + 1):
-            tranche_key = f"order-{order_id}-{i}"
-            statut = order.paid_tranches.get(tranche_key, 'en_attente')
-            montant_paye = float(montant_par_tranche) if statut == 'payée' else 0
-
-            # Calculate date_echeance: now() + (tranche - 1) * (duration / nombre_tranches)
-            date_echeance = datetime.now() + timedelta(days=(i - 1) * duration_per_tranche)
-
-            payment_data = {
-                'id': f"order-{order_id}-{i}",
-                'order_id': order.id,
-                'tranche': i,
-                'montant': f"{montant_par_tranche:.2f}",
-                'montant_initial': f"{(montant_par_tranche + remise_par_tranche):.2f}",
-                'date_ordre': order.created_at.isoformat(),
-                'date_echeance': date_echeance.isoformat(),
-                'statut': statut,
-                'statut_display': 'Payée' if statut == 'payée' else 'En attente',
-                'type_remise': remise_type.type_remise,
-                'type_remise_display': remise_type.get_type_remise_display(),
-                'remise_appliquee': f"{remise_par_tranche:.2f}",
-                'pourcentage_remise': f"{pourcentage_remise_tranche:.2f}",
-                'montant_apres_remise': f"{montant_par_tranche:.2f}",
-                'montant_paye': montant_paye,
-                'duree_plan_paiement': remise_type.duree_plan_paiement or '',
+    try:
+        orders = Order.objects.filter(client_id=client_id).only('id', 'created_at')
+        ensure_schedules(orders)
+        now = timezone.now()
+        page, meta = paginate_keyset(filter_by_schedule(orders, schedule_filter, now), request)
+        tranches = get_tranches_by_order([order.pk for order in page])
+        schedules = [
+            {
+                'order_id': order.pk,
+                'schedule_status': schedule_status(tranches[order.pk], now),
+                **_schedule_data(tranches[order.pk]),
             }
-            payments.append(payment_data)
-            total_remise += remise_par_tranche
-            if statut == 'payée':
-                total_paye += montant_par_tranche
-
-        totals = {
-            'total_montant_initial': f"{total_montant_initial:.2f}",
-            'total_remise': f"{total_remise:.2f}",
-            'total_apres_remise': f"{total_apres_remise:.2f}",
-            'total_paye': f"{total_paye:.2f}",
-        }
-
-        return Response({
-            'payments': payments,
-            'totals': totals,
-            'order_status': order.status,
-        }, status=status.HTTP_200_OK)
+            for order in page
+            if order.pk in tranches
+        ]
+        return Response({**meta, 'results': schedules}, status=status.HTTP_200_OK)
 
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response(
             {'error': f'Erreur lors de la récupération des paiements: {str(e)}'},
-            status=status.HTTP_400_BAD_REQUEST
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-def parse_duration(duration_str):
-    """Parse duration string (e.g., '3 months') to days."""
-    if not duration_str:
-        return 0
-    try:
-        value, unit = duration_str.split()
-        value = int(value)
-        if 'month' in unit.lower():
-            return value * 30  # Approximate
-        elif 'day' in unit.lower():
-            return value
-        return 0
-    except (ValueError, AttributeError):
-        return 0
+
+def _settle_client(client_id, order):
+    """Commande entièrement réglée : historique d'achats et compteur de commandes du client."""
+    Client.objects.get(user_id=client_id).update_purchase_history(order)
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def pay_tranche(request, client_id, order_id):
     try:
-        user_id = request.user.id
-        client = get_object_or_404(Client, user_id=client_id)
-        if client.user_id != user_id:
-            return Response(
-                {'error': 'Unauthorized: You do not have access to this client’s data'},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        order = get_object_or_404(Order, id=order_id, client_id=client_id)
         tranche = request.data.get('tranche')
-
         if not tranche or not isinstance(tranche, int) or tranche < 1:
             return Response(
                 {'error': 'Invalid tranche number'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        order_items = OrderItem.objects.filter(order_id=order_id).select_related('produit__boutique')
-        if not order_items.exists():
-            return Response(
-                {'error': 'No order items found for the specified order'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        boutique_id = order_items.first().produit.boutique_id
-        remise_type = RemiseType.objects.filter(boutique_id=boutique_id).first()
-        if not remise_type:
-            return Response(
-                {'error': 'No discount type found for the boutique'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        nombre_tranches = remise_type.nombre_tranches or 1
-        if tranche > nombre_tranches:
+        tranches = _load_tranches(request, client_id, order_id)
+        if tranche > len(tranches):
             return Response(
-                {'error': f'Tranche {tranche} exceeds maximum tranches ({nombre_tranches})'},
+                {'error': f'Tranche {tranche} exceeds maximum tranches ({len(tranches)})'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        tranche_key = f"order-{order_id}-{tranche}"
-        if order.paid_tranches.get(tranche_key) == 'payée':
-            return Response(
-                {'error': 'Tranche already paid'},
-                status=status.HTTP_409_CONFLICT
-            )
-
-        # Mark tranche as paid
-        order.paid_tranches[tranche_key] = 'payée'
-        order.save()
-
-        # Recalculate totals
-        total_montant_initial = Decimal('0')
-        for order_item in order_items:
-            montant = Decimal(str(order_item.prix * order_item.quantite))
-            total_montant_initial += montant
-
-        pourcentage_remise = Decimal(str(remise_type.pourcentage_remise))
-        remise_totale = (total_montant_initial * pourcentage_remise) / Decimal('100')
-        if remise_type.montant_max_remise and remise_totale > Decimal(str(remise_type.montant_max_remise)):
-            remise_totale = Decimal(str(remise_type.montant_max_remise))
-
-        total_apres_remise = total_montant_initial - remise_totale
-        montant_par_tranche = total_apres_remise / Decimal(str(nombre_tranches))
-        remise_par_tranche = remise_totale / Decimal(str(nombre_tranches))
-        pourcentage_remise_tranche = (
-            (remise_par_tranche / (montant_par_tranche + remise_par_tranche) * Decimal('100'))
-            if (montant_par_tranche + remise_par_tranche) > 0 else Decimal('0')
-        )
-
-        total_duration_days = parse_duration(remise_type.duree_plan_paiement)
-        duration_per_tranche = total_duration_days / nombre_tranches if nombre_tranches > 1 else 0
-        date_echeance = datetime.now() + timedelta(days=(tranche - 1) * duration_per_tranche)
-
-        payment_data = {
-            'id': tranche_key,
-            'order_id': order.id,
-            'tranche': tranche,
-            'montant': f"{montant_par_tranche:.2f}",
-            'montant_initial': f"{(montant_par_tranche + remise_par_tranche):.2f}",
-            'date_ordre': order.created_at.isoformat(),
-            'date_echeance': date_echeance.isoformat(),
-            'statut': 'payée',
-            'statut_display': 'Payée',
-            'type_remise': remise_type.type_remise,
-            'type_remise_display': remise_type.get_type_remise_display(),
-            'remise_appliquee': f"{remise_par_tranche:.2f}",
-            'pourcentage_remise': f"{pourcentage_remise_tranche:.2f}",
-            'montant_apres_remise': f"{montant_par_tranche:.2f}",
-            'montant_paye': float(montant_par_tranche),
-            'duree_plan_paiement': remise_type.duree_plan_paiement or '',
-        }
-
-        # Check if all tranches are paid
-        all_paid = all(
-            order.paid_tranches.get(f"order-{order_id}-{i}", 'en_attente') == 'payée'
-            for i in range(1, nombre_tranches + 1)
-        )
-        if all_paid:
-            order.status = 'payée'
-            order.save()
-            # Update Client orders and historique_achats
-            client.orders += 1
-            client.update_purchase_history(order)
-            client.save()
-
-        return Response(payment_data, status=status.HTTP_200_OK)
-
+        order = tranches[0].order
+        tranches, settled = pay_tranches(order, [tranche])
+        if settled:
+            _settle_client(client_id, order)
+
+        return Response(_payment_data(tranches[tranche - 1]), status=status.HTTP_200_OK)
+
+    except TrancheAlreadyPaid as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    except PermissionDenied as e:
+        return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+    except Http404:
+        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    except NoPaymentPlan as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response(
             {'error': f'Erreur lors du paiement de la tranche: {str(e)}'},
@@ -445,56 +347,21 @@ def pay_tranche(request, client_id, order_id):
 @permission_classes([IsAuthenticated])
 def pay_total(request, client_id, order_id):
     try:
-        user_id = request.user.id
-        client = get_object_or_404(Client, user_id=client_id)
-        if client.user_id != user_id:
-            return Response(
-                {'error': 'Unauthorized: You do not have access to this client’s data'},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        order = get_object_or_404(Order, id=order_id, client_id=client_id)
-        order_items = OrderItem.objects.filter(order_id=order_id).select_related('produit__boutique')
-
-        if not order_items.exists():
-            return Response(
-                {'error': 'No order items found for the specified order'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        boutique_id = order_items.first().produit.boutique_id
-        remise_type = RemiseType.objects.filter(boutique_id=boutique_id).first()
-        if not remise_type:
-            return Response(
-                {'error': 'No discount type found for the boutique'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        nombre_tranches = remise_type.nombre_tranches or 1
-        all_paid = all(
-            order.paid_tranches.get(f"order-{order_id}-{i}", 'en_attente') == 'payée'
-            for i in range(1, nombre_tranches + 1)
-        )
-        if all_paid:
-            return Response(
-                {'error': 'Order already fully paid'},
-                status=status.HTTP_409_CONFLICT
-            )
-
-        # Mark all tranches as paid
-        for i in range(1, nombre_tranches + 1):
-            tranche_key = f"order-{order_id}-{i}"
-            order.paid_tranches[tranche_key] = 'payée'
-
-        order.status = 'payée'
-        order.save()
-
-        # Update Client orders and historique_achats
-        client.orders += 1
-        client.update_purchase_history(order)
-        client.save()
+        order = _load_tranches(request, client_id, order_id)[0].order
+        _, settled = pay_tranches(order)
+        if settled:
+            _settle_client(client_id, order)
 
         return Response({'message': 'All tranches paid successfully'}, status=status.HTTP_200_OK)
 
+    except TrancheAlreadyPaid as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    except PermissionDenied as e:
+        return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+    except Http404:
+        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    except NoPaymentPlan as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response(
             {'error': f'Erreur lors du paiement total: {str(e)}'},
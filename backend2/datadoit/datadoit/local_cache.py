@@ -0,0 +1,50 @@
+# datadoit/local_cache.py
+"""
+Petit cache LRU en mémoire du processus, à TTL par entrée.
+
+Sert de premier niveau devant le cache Redis pour les données lues à chaque
+requête ou connexion (utilisateur d'un JWT, salons du chat) : un TTL court
+borne le délai de propagation d'une invalidation faite dans un autre processus.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class LocalLRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_matching(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
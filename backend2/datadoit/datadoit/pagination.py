@@ -0,0 +1,181 @@
+# datadoit/pagination.py
+"""
+Pagination par curseur (keyset) pour les listes volumineuses.
+
+Au lieu de OFFSET + COUNT(*), chaque page est lue avec un filtre
+``(sort_key, id) < (dernière valeur, dernier id)`` qui s'appuie sur l'index de
+tri : le coût d'une page ne dépend plus de sa profondeur. Le curseur renvoyé
+au client est opaque (base64 d'un petit JSON).
+
+Le total est optionnel : ``?count=exact`` lance un COUNT(*), ``?count=estimate``
+lit l'estimation du planificateur PostgreSQL (COUNT exact sur les autres bases).
+
+Les écrans qui affichent « page N sur M » envoient ``?page=`` :
+``paginate_page_number`` leur garde la réponse historique (OFFSET, COUNT exact).
+"""
+import base64
+import binascii
+import json
+import logging
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db import connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk, reverse=False):
+    payload = json.dumps({'v': value, 'id': pk, 'r': reverse}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field=None, pk_field=None):
+    """
+    ``(valeur, id, sens inverse)`` du curseur. Si ``field`` / ``pk_field`` sont
+    donnés, la valeur et l'id sont convertis par leur ``to_python`` : un curseur
+    bien formé mais du mauvais type lève InvalidCursor, pas une erreur de l'ORM.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        value, pk = payload['v'], payload['id']
+        if field is not None:
+            value = field.to_python(value)
+        if pk_field is not None:
+            pk = pk_field.to_python(pk)
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError, ValidationError):
+        raise InvalidCursor('Invalid cursor')
+    if (field is not None and value is None) or (pk_field is not None and pk is None):
+        raise InvalidCursor('Invalid cursor')
+    return value, pk, bool(payload.get('r'))
+
+
+def _sort_model_field(queryset, sort_field):
+    """Champ (ou type de l'annotation) ``sort_field`` de ``queryset``, pour valider les curseurs."""
+    try:
+        annotation = queryset.query.annotations.get(sort_field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(sort_field)
+    except (FieldDoesNotExist, FieldError):
+        return None
+
+
+def estimate_count(queryset):
+    """Estimation du nombre de lignes sans parcourir la table (PostgreSQL uniquement)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def wants_pagination(request):
+    """Pour les listes historiquement renvoyées en entier : pagination sur demande."""
+    return 'cursor' in request.query_params or 'page_size' in request.query_params
+
+
+def wants_page_number(request):
+    """Clients paginés par numéro (?page= sans curseur) : réponse count / total_pages / current_page."""
+    return 'page' in request.query_params and 'cursor' not in request.query_params
+
+
+def paginate_page_number(queryset, request, ordering, page_size=None):
+    """
+    Retourne ``(items, meta)`` pour la page ``?page=`` triée par ``ordering``.
+    ``meta`` contient ``count`` (COUNT exact : le client en déduit le nombre de
+    pages), ``total_pages`` et ``current_page``. Comme Paginator.get_page, un
+    numéro illisible donne la 1ère page et un numéro trop grand la dernière.
+    """
+    page_size = page_size or get_page_size(request)
+    count = queryset.count()
+    total_pages = max(1, -(-count // page_size))
+    try:
+        page = int(request.query_params.get('page', 1))
+    except (TypeError, ValueError):
+        page = 1
+    page = max(1, min(page, total_pages))
+    start = (page - 1) * page_size
+    items = list(queryset.order_by(*ordering)[start:start + page_size])
+    return items, {'count': count, 'total_pages': total_pages, 'current_page': page}
+
+
+def paginate_keyset(queryset, request, sort_field='created_at', descending=True,
+                    page_size=None, default_count=None):
+    """
+    Retourne ``(items, meta)`` pour la page désignée par ``?cursor=``.
+    ``meta`` contient ``next``/``previous`` (curseurs ou None) et ``count``
+    si le client l'a demandé via ``?count=exact|estimate`` (ou si la vue
+    fournit ``default_count``). ``sort_field`` doit être une colonne ou une
+    annotation non nulle.
+    Lève InvalidCursor si le curseur fourni est illisible.
+    """
+    page_size = page_size or get_page_size(request)
+    cursor = request.query_params.get('cursor')
+
+    count_mode = request.query_params.get('count', default_count)
+    count = None
+    if count_mode == 'exact':
+        count = queryset.count()
+    elif count_mode == 'estimate':
+        count = estimate_count(queryset)
+
+    # La clé de tri sert à construire les curseurs : elle doit être chargée même sous only()
+    # (une annotation, elle, est toujours sélectionnée)
+    fields, defer = queryset.query.deferred_loading
+    if fields and not defer and sort_field not in fields and sort_field not in queryset.query.annotations:
+        queryset = queryset.only(*fields, sort_field)
+
+    reverse = False
+    if cursor:
+        value, pk, reverse = decode_cursor(cursor, _sort_model_field(queryset, sort_field), queryset.model._meta.pk)
+        # Page précédente : on parcourt l'index dans l'autre sens puis on remet l'ordre
+        forward_desc = descending != reverse
+        lookup = 'lt' if forward_desc else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{sort_field}__{lookup}': value}) |
+            Q(**{sort_field: value, f'pk__{lookup}': pk})
+        )
+    else:
+        forward_desc = descending
+
+    prefix = '-' if forward_desc else ''
+    items = list(queryset.order_by(f'{prefix}{sort_field}', f'{prefix}pk')[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if reverse:
+        items.reverse()
+
+    next_cursor = previous_cursor = None
+    if items:
+        first, last = items[0], items[-1]
+        if has_more or reverse:
+            next_cursor = encode_cursor(getattr(last, sort_field), last.pk)
+        if cursor and (has_more or not reverse):
+            previous_cursor = encode_cursor(getattr(first, sort_field), first.pk, reverse=True)
+
+    meta = {'next': next_cursor, 'previous': previous_cursor}
+    if count is not None:
+        meta['count'] = count
+    return items, meta
@@ -157,6 +157,60 @@ CACHES = {
     }
 }
 
+# Cache des endpoints publics du catalogue (boutique/cache.py)
+CATALOG_CACHE_TIMEOUT = 60 * 15  # Durée de vie d'une réponse en cache (secondes)
+CATALOG_CACHE_MAX_AGE = 0  # max-age envoyé aux navigateurs/CDN, qui revalident via ETag
+
+# Cache des utilisateurs authentifiés par JWT (users/user_cache.py)
+AUTH_USER_CACHE_TIMEOUT = 60  # Entrée Redis, supprimée à chaque modification du User
+AUTH_USER_LOCAL_TTL = 5  # LRU en mémoire du processus : délai max de propagation d'une invalidation
+
+# Popularité des produits (boutique/popularity.py)
+POPULARITY_HALF_LIFE_DAYS = 14  # Un événement pèse moitié moins après cette durée
+POPULARITY_ORDER_WEIGHT = 0.4  # Points par article commandé
+POPULARITY_RATING_WEIGHT = 0.6  # Points pour une note de 5/5
+POPULARITY_LEADERBOARDS = False  # Classements Redis (sorted sets) par boutique et par catégorie
+
+# Recherche dans le catalogue (boutique/search.py)
+CATALOG_SEARCH_PRICE_BUCKETS = (20, 50, 100, 200, 500)  # Bornes des tranches de prix des facettes
+CATALOG_SEARCH_FACET_LIMIT = 20  # Valeurs renvoyées par facette (les plus fréquentes)
+
+# Plans de paiement des boutiques (config/payment_plans.py)
+PAYMENT_PLAN_CACHE_TIMEOUT = 60 * 60  # Entrée Redis, supprimée à chaque modification d'un RemiseType
+PAYMENT_PLAN_LOCAL_TTL = 5  # LRU en mémoire du processus : délai max de propagation d'une invalidation
+
+# Badges et règles de parrainage (config/loyalty.py)
+LOYALTY_RULES_CACHE_TIMEOUT = 60 * 60  # Listes Redis, supprimées à chaque modification d'un Badge ou d'une ReferralRule
+LOYALTY_RULES_LOCAL_TTL = 5  # LRU en mémoire du processus : délai max de propagation d'une invalidation
+
+# Chat WebSocket (chat/)
+CHAT_HISTORY_PAGE_SIZE = 50  # Messages envoyés à la connexion puis par load_more
+CHAT_WRITE_BATCH_SIZE = 100  # Messages insérés par bulk_create
+CHAT_WRITE_FLUSH_MS = 200  # Délai max avant écriture d'un message diffusé
+CHAT_WRITE_RETRY_MAX_MS = 30000  # Délai max entre deux tentatives d'un lot en échec (doublé à chaque échec)
+CHAT_WRITE_SPILL_AFTER = 5  # Échecs avant déversement du lot dans Redis (jamais abandonné)
+CHAT_WRITE_SPILL_REDIS_URL = 'redis://127.0.0.1:6379/2'  # None = lots en échec gardés en mémoire
+CHAT_WRITE_MAX_BUFFERED = 10000  # Messages en attente au-delà desquels les nouveaux messages sont refusés
+CHAT_PRESENCE_REDIS_URL = 'redis://127.0.0.1:6379/2'  # None = registre de présence local au processus
+CHAT_PRESENCE_TTL = 60  # Secondes sans heartbeat avant qu'un utilisateur soit considéré hors ligne
+CHAT_ROOM_CACHE_TIMEOUT = 60 * 5  # Salon et marchand résolus à la connexion (chat/rooms.py), invalidés par signaux
+CHAT_ROOM_LOCAL_TTL = 5  # LRU en mémoire du processus : délai max de propagation d'une invalidation
+CHAT_RECEIPT_DEBOUNCE_MS = 500  # Fenêtre de regroupement des accusés de lecture et réactions (chat/receipts.py)
+CHAT_SEARCH_PAGE_SIZE = 20  # Résultats par page de recherche (chat/search.py)
+CHAT_SEARCH_TIMEOUT_MS = 200  # statement_timeout d'une recherche sur PostgreSQL
+CHAT_ARCHIVE_AFTER_DAYS = 180  # Âge à partir duquel archive_chat déplace les messages (chat/archive.py)
+CHAT_ARCHIVE_BATCH_SIZE = 2000  # Messages déplacés par transaction
+# Limites par connexion (toutes trames) et par salon (messages), en (trames/seconde, rafale) — chat/throttling.py
+CHAT_RATE_LIMITS = {
+    'connection': (10, 30),
+    'room': (50, 100),
+}
+CHAT_THROTTLE_CLOSE_AFTER = 100  # Trames limitées consécutives avant fermeture (code 4029)
+CHAT_SEND_QUEUE_SIZE = 256  # Trames en attente d'envoi par connexion
+CHAT_SEND_QUEUE_POLICY = 'drop'  # File pleine : 'drop' (trame abandonnée) ou 'close' (code 4008)
+CHAT_METRICS_LOG_INTERVAL = 60  # Secondes entre deux résumés des compteurs dans les logs
+CHAT_WIRE_FORMATS = ('json', 'msgpack', 'deflate')  # Formats de trame acceptés via ?format= ou sous-protocole chat.<format> (chat/wire.py)
+
 # Validation des mots de passe
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
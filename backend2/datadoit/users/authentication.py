@@ -5,6 +5,7 @@ import rest_framework_simplejwt
 from rest_framework_simplejwt.tokens import AccessToken
 import jwt
 from users.models import User
+from users.user_cache import get_active_user
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,7 +32,7 @@ class JWTBearerAuthentication(BaseAuthentication):
             user_id = payload['user_id']
             
             try:
-                user = User.objects.get(id=user_id, is_active=True)
+                user = get_active_user(user_id, payload.get('jti'))
             except User.DoesNotExist:
                 logger.warning(f"User not found or inactive: user_id={user_id}")
                 raise AuthenticationFailed('User not found or inactive')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marchand',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Nombre de notes'),
+        ),
+        migrations.AddField(
+            model_name='marchand',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Somme des notes'),
+        ),
+    ]
@@ -0,0 +1,153 @@
+# Generated by Django 5.2 on 2026-10-18 15:20
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import json
+import logging
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+ORDER_REF_MAX_LENGTH = 64
+
+
+def _parse_date(value):
+    try:
+        date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return date if timezone.is_aware(date) else timezone.make_aware(date)
+
+
+def _amount(entry):
+    try:
+        if entry.get('total_montant') is not None:
+            return Decimal(str(entry['total_montant']))
+        return sum((Decimal(str(item.get('total', 0))) for item in entry.get('items') or []), Decimal('0'))
+    except (InvalidOperation, AttributeError, TypeError):
+        return Decimal('0')
+
+
+def _order_ref(entry):
+    order_id = entry.get('order_id')
+    return '' if order_id is None else str(order_id)[:ORDER_REF_MAX_LENGTH]
+
+
+def backfill_purchases(apps, schema_editor):
+    """Une ligne ``purchases`` par commande de l'ancien historique JSON des clients."""
+    Client = apps.get_model('users', 'Client')
+    Order = apps.get_model('cart', 'Order')
+    Purchase = apps.get_model('users', 'Purchase')
+
+    used_orders = set()
+    skipped = 0
+
+    def flush(rows):
+        order_ids = {order_id for _, order_id, _ in rows if order_id is not None}
+        existing = set(Order.objects.filter(pk__in=order_ids).values_list('pk', flat=True))
+        purchases = []
+        for client_id, order_id, entry in rows:
+            if order_id is not None and order_id in used_orders:
+                # Même commande enregistrée deux fois dans le JSON
+                continue
+            if order_id not in existing:
+                order_id = None
+            else:
+                used_orders.add(order_id)
+            purchases.append(Purchase(
+                client_id=client_id,
+                order_id=order_id,
+                # Référence d'origine, même si la commande n'existe plus : le front l'affiche et la filtre
+                order_ref=_order_ref(entry),
+                purchased_at=_parse_date(entry.get('created_at')),
+                total_montant=_amount(entry),
+                items=entry.get('items') or [],
+            ))
+        Purchase.objects.bulk_create(purchases, batch_size=BATCH_SIZE)
+
+    rows = []
+    clients = (
+        Client.objects.exclude(historique_achats__isnull=True)
+        .exclude(historique_achats__in=['', '{"orders": []}'])
+        .only('pk', 'historique_achats').order_by('pk')
+    )
+    for client in clients.iterator(chunk_size=BATCH_SIZE):
+        try:
+            history = json.loads(client.historique_achats)
+            entries = history.get('orders') or []
+        except (ValueError, AttributeError):
+            skipped += 1
+            continue
+        for entry in entries:
+            if not isinstance(entry, dict) or _parse_date(entry.get('created_at')) is None:
+                skipped += 1
+                continue
+            try:
+                order_id = int(entry.get('order_id'))
+            except (TypeError, ValueError):
+                order_id = None
+            rows.append((client.pk, order_id, entry))
+        if len(rows) >= BATCH_SIZE:
+            flush(rows)
+            rows = []
+    if rows:
+        flush(rows)
+    if skipped:
+        logger.warning(f"Purchase history backfill skipped {skipped} unreadable entries")
+
+
+def restore_history(apps, schema_editor):
+    Client = apps.get_model('users', 'Client')
+    Purchase = apps.get_model('users', 'Purchase')
+
+    histories = {}
+    for purchase in Purchase.objects.order_by('purchased_at', 'pk').iterator(chunk_size=BATCH_SIZE):
+        histories.setdefault(purchase.client_id, []).append({
+            'order_id': purchase.order_ref,
+            'created_at': purchase.purchased_at.isoformat(),
+            'items': purchase.items,
+            'total_montant': float(purchase.total_montant),
+        })
+    clients = []
+    for client in Client.objects.filter(pk__in=list(histories)).only('pk'):
+        client.historique_achats = json.dumps({'orders': histories[client.pk]}, ensure_ascii=False)
+        clients.append(client)
+    Client.objects.bulk_update(clients, ['historique_achats'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0015_order_client_created_idx'),
+        ('users', '0009_marchand_rating_count_marchand_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Purchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purchased_at', models.DateTimeField(verbose_name='Date de commande')),
+                ('total_montant', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Montant total')),
+                ('items', models.JSONField(blank=True, default=list)),
+                ('order_ref', models.CharField(blank=True, default='', max_length=64, verbose_name='Référence de commande')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchases', to='users.client')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchase', to='cart.order')),
+            ],
+            options={
+                'verbose_name': 'Achat',
+                'verbose_name_plural': 'Achats',
+                'db_table': 'purchases',
+                'indexes': [models.Index(fields=['client', 'purchased_at', 'id'], name='purchases_client_date_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_purchases, restore_history),
+        migrations.RemoveField(
+            model_name='client',
+            name='historique_achats',
+        ),
+    ]
@@ -1,4 +1,5 @@
 from datetime import timedelta
+from decimal import Decimal
 from django.utils import timezone
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
@@ -114,7 +115,6 @@ class Client(models.Model):
         related_name='client_profile'
     )
     solde_points = models.IntegerField(default=0, null=True)
-    historique_achats = models.TextField(blank=True, default='{"orders": []}', null=True)
     referral_code = models.CharField(max_length=10, unique=True, blank=True, null=True, default=generate_referral_code)
     nombre_clients_parraines = models.IntegerField(default=0)
     current_badge = models.ForeignKey('config.Badge', on_delete=models.SET_NULL, blank=True, null=True, related_name='clients')
@@ -131,40 +131,42 @@ class Client(models.Model):
         return self.orders
 
     def update_purchase_history(self, order):
-        try:
-            history = json.loads(self.historique_achats or '{"orders": []}')
-            if not isinstance(history, dict) or 'orders' not in history:
-                history = {'orders': []}
-        except json.JSONDecodeError:
-            history = {'orders': []}
-
-        order_items = order.items.select_related('produit').all()
-        order_data = {
-            'order_id': str(order.id),
-            'created_at': order.created_at.isoformat(),
-            'items': [
-                {
-                    'produit_id': str(item.produit.id),
-                    'produit_nom': item.produit.nom,
-                    'prix': float(item.prix),
-                    'quantite': item.quantite,
-                    'total': float(item.prix * item.quantite)
-                }
-                for item in order_items
-            ],
-            'total_montant': float(sum(item.prix * item.quantite for item in order_items))
-        }
-
-        history['orders'].append(order_data)
-        self.historique_achats = json.dumps(history, ensure_ascii=False)
-        self.orders += 1
-        self.save()
+        """
+        Ajoute ``order`` (entièrement payée) à l'historique d'achats : une ligne
+        ``purchases``, sans relire ni réécrire l'historique existant. Sans effet
+        si la commande y figure déjà.
+        """
+        order_items = list(order.items.select_related('produit'))
+        items = [
+            {
+                'produit_id': str(item.produit.id),
+                'produit_nom': item.produit.nom,
+                'prix': float(item.prix),
+                'quantite': item.quantite,
+                'total': float(item.prix * item.quantite)
+            }
+            for item in order_items
+        ]
+        _, created = Purchase.objects.get_or_create(
+            order=order,
+            defaults={
+                'client': self,
+                'order_ref': str(order.id),
+                'purchased_at': order.created_at,
+                'total_montant': sum((item.prix * item.quantite for item in order_items), Decimal('0')),
+                'items': items,
+            },
+        )
+        if created:
+            self.orders += 1
+            self.save(update_fields=['orders'])
 
     def assign_badge(self):
-        from config.models import Badge
+        from config.loyalty import eligible_badge as find_badge
         from .models import Discount, Notification
-        eligible_badge = Badge.objects.filter(threshold__lte=self.orders).order_by('-threshold').first()
-        if eligible_badge and eligible_badge != self.current_badge:
+        # Seuils en cache (config/loyalty.py) : aucune requête tant que le badge ne change pas
+        eligible_badge = find_badge(self.orders)
+        if eligible_badge and eligible_badge.pk != self.current_badge_id:
             logger.info(f"Nouveau badge attribué pour client {self.user_id}: {eligible_badge.name}")
             self.current_badge = eligible_badge
             super().save(update_fields=['current_badge'])  # Éviter d'appeler assign_badge récursivement
@@ -222,8 +224,55 @@ class Client(models.Model):
             while Client.objects.filter(referral_code=code).exists():
                 code = self.user.first_name.upper()[:5] + str(uuid.uuid4())[:5].upper()
             self.referral_code = code
+        update_fields = kwargs.get('update_fields')
+        # Le badge ne dépend que du nombre de commandes : rien à recalculer s'il n'a pas changé
+        orders_changed = (update_fields is None or 'orders' in update_fields) and (
+            self._state.adding or self.orders != getattr(self, '_loaded_orders', None)
+        )
         super().save(*args, **kwargs)
-        self.assign_badge()
+        self._loaded_orders = self.orders
+        if orders_changed:
+            self.assign_badge()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeur lue en base, comparée dans save() ; absente si le champ est différé
+        instance._loaded_orders = instance.__dict__.get('orders')
+        return instance
+class Purchase(models.Model):
+    """Historique d'achats : une ligne par commande payée d'un client, articles figés à l'achat."""
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='purchases')
+    # NULL pour un achat repris de l'ancien historique JSON dont la commande n'existe plus
+    order = models.OneToOneField('cart.Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='purchase')
+    # Identifiant affiché de la commande, conservé quand la commande est supprimée (order passe à NULL)
+    order_ref = models.CharField(max_length=64, blank=True, default='', verbose_name=("Référence de commande"))
+    purchased_at = models.DateTimeField(verbose_name=("Date de commande"))
+    total_montant = models.DecimalField(max_digits=12, decimal_places=2, verbose_name=("Montant total"))
+    # [{'produit_id', 'produit_nom', 'prix', 'quantite', 'total'}]
+    items = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        db_table = 'purchases'
+        verbose_name = ("Achat")
+        verbose_name_plural = ("Achats")
+        indexes = [
+            # Historique d'un client par date (pagination par curseur, filtres de dates)
+            models.Index(fields=['client', 'purchased_at', 'id'], name='purchases_client_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Achat {self.order_ref} du client {self.client_id}"
+
+    def as_history_entry(self):
+        """Entrée au format de l'ancien historique JSON."""
+        return {
+            'order_id': self.order_ref,
+            'created_at': self.purchased_at.isoformat(),
+            'items': self.items,
+            'total_montant': float(self.total_montant),
+        }
+
 class Marchand(models.Model):
     user = models.OneToOneField(
         User,
@@ -234,6 +283,9 @@ class Marchand(models.Model):
     )
     is_marchant = models.BooleanField(default=True, verbose_name=("Est marchand"))
     average_rating = models.FloatField(default=0.0, verbose_name=("Note moyenne"))
+    # Toutes les notes des produits du marchand, maintenues par boutique/ratings.py
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=("Nombre de notes"))
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name=("Somme des notes"))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=("Créé le"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=("Mis à jour le"))
 
@@ -261,11 +313,17 @@ class Marchand(models.Model):
         return timezone.now() < self.created_at + timedelta(days=30)
 
     def calculate_average_rating(self):
-        """Calcule la note moyenne basée sur les produits du marchand."""
-        ratings = self.produits.aggregate(avg_rating=Avg('average_rating'))
-        avg_rating = ratings['avg_rating'] or 0.0
-        self.average_rating = round(avg_rating, 1)
-        self.save(update_fields=['average_rating'])
+        """Recalcule la note moyenne sur toutes les notes des produits des boutiques du marchand."""
+        from boutique.models import Rating
+
+        totals = Rating.objects.filter(
+            models.Q(produit__boutique__marchand=self) |
+            models.Q(produit__boutique__isnull=True, produit__marchand=self)
+        ).aggregate(count=models.Count('id'), total=models.Sum('value'))
+        self.rating_count = totals['count']
+        self.rating_sum = totals['total'] or 0
+        self.average_rating = round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0.0
+        self.save(update_fields=['rating_count', 'rating_sum', 'average_rating'])
         return self.average_rating
 
 class Admin(models.Model):
@@ -16,7 +16,6 @@ User = get_user_model()
 
 class UserSerializer(serializers.ModelSerializer):
     solde_points = serializers.IntegerField(source='client_profile.solde_points', read_only=True, required=False)
-    historique_achats = serializers.CharField(source='client_profile.historique_achats', read_only=True, required=False)
     referral_code = serializers.CharField(source='client_profile.referral_code', read_only=True, required=False)
     nombre_clients_parraines = serializers.IntegerField(source='client_profile.nombre_clients_parraines', read_only=True, required=False)
     has_boutique = serializers.SerializerMethodField(read_only=True)
@@ -26,7 +25,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'email', 'nom', 'prenom','avatar' ,'telephone', 'adresse','role',
             'is_active', 'is_approved', 'is_staff', 'created_at', 'updated_at',
-            'solde_points', 'historique_achats', 'referral_code', 'nombre_clients_parraines',
+            'solde_points', 'referral_code', 'nombre_clients_parraines',
             'has_boutique'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'is_staff', 'is_approved']
@@ -40,7 +39,6 @@ class UserSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         if instance.role.lower() != 'client':
             representation.pop('solde_points', None)
-            representation.pop('historique_achats', None)
             representation.pop('referral_code', None)
             representation.pop('nombre_clients_parraines', None)
         if instance.role.lower() != 'marchand':
@@ -67,10 +65,9 @@ User = get_user_model()
 class ClientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Client
-        fields = ['solde_points', 'historique_achats', 'referral_code', 'nombre_clients_parraines']
+        fields = ['solde_points', 'referral_code', 'nombre_clients_parraines']
         extra_kwargs = {
             'solde_points': {'default': 0, 'allow_null': True, 'required': False},
-            'historique_achats': {'allow_blank': True, 'allow_null': True, 'required': False},
             'referral_code': {'read_only': True},
             'nombre_clients_parraines': {'read_only': True},
         }
@@ -145,11 +142,11 @@ class SignupSerializer(serializers.ModelSerializer):
                         referrer = Client.objects.select_for_update().get(referral_code=referral_code)
                         logger.info(f"Référent trouvé: {referrer.user_id}, nombre_clients_parraines avant: {referrer.nombre_clients_parraines}")
                         referrer.nombre_clients_parraines += 1
-                        referrer.save()
+                        referrer.save(update_fields=['nombre_clients_parraines'])
                         logger.info(f"Référent sauvegardé, nombre_clients_parraines après: {referrer.nombre_clients_parraines}")
-                        # Appliquer les réductions pour toutes les règles de parrainage
-                        from .models import ReferralRule
-                        for rule in ReferralRule.objects.all():
+                        # Appliquer les réductions des règles atteintes (en cache, config/loyalty.py)
+                        from config.loyalty import reached_referral_rules
+                        for rule in reached_referral_rules(referrer.nombre_clients_parraines):
                             logger.info(f"Vérification de la règle: {rule.referrals_count} referrals")
                             referrer.apply_referral_discount(rule)
                 except Client.DoesNotExist:
@@ -173,7 +170,6 @@ class UserUpdateSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(required=False)
     password = serializers.CharField(write_only=True, required=False, min_length=8)
     solde_points = serializers.IntegerField(required=False)
-    historique_achats = serializers.CharField(allow_blank=True, allow_null=True, required=False)
    
     description = serializers.CharField(required=False)
 
@@ -181,7 +177,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         model = User
         fields = [
             'email', 'nom', 'prenom', 'telephone', 'password',
-            'solde_points', 'historique_achats', 'description'
+            'solde_points', 'description'
         ]
         read_only_fields = ['role']
 
@@ -190,10 +186,10 @@ class UserUpdateSerializer(serializers.ModelSerializer):
             if  'description' in data:
                 raise serializers.ValidationError({"non_field_errors": "Client cannot update marchand-specific fields."})
         elif self.instance.role == 'Marchand':
-            if 'solde_points' in data or 'historique_achats' in data:
+            if 'solde_points' in data:
                 raise serializers.ValidationError({"non_field_errors": "Marchand cannot update client-specific fields."})
         elif self.instance.role == 'Admin':
-            if any(key in data for key in ['solde_points', 'historique_achats',  'description']):
+            if any(key in data for key in ['solde_points', 'description']):
                 raise serializers.ValidationError({"non_field_errors": "Admin cannot update client or marchand-specific fields."})
         return data
 
@@ -208,7 +204,6 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         if instance.role == 'Client':
             client = instance.client
             client.solde_points = validated_data.pop('solde_points', client.solde_points)
-            client.historique_achats = validated_data.pop('historique_achats', client.historique_achats)
             client.save()
         elif instance.role == 'Marchand':
             marchand = instance.marchand
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .models import User
+from .user_cache import invalidate_user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Après le commit : une requête concurrente ne peut pas remettre l'ancienne version en cache.
+    # pk lu tout de suite : après un delete, Django le remet à None avant le commit
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklisted_token_user(sender, instance, created, **kwargs):
+    user_id = instance.token.user_id
+    if created and user_id is not None:
+        transaction.on_commit(lambda: invalidate_user(user_id))
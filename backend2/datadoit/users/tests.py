@@ -1,3 +1,116 @@
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from cart.tests import make_order
+from config.loyalty import _local as loyalty_local, eligible_badge, reached_referral_rules
+from config.models import Badge, ReferralRule
+from .authentication import JWTBearerAuthentication
+from .models import Client, Purchase, User
+from .user_cache import _redis_key, get_active_user
+
+
+def make_user(email='client@example.com', role='client', **fields):
+    return User.objects.create_user(email=email, password=None, nom='Nom', prenom='Prenom', telephone='1', role=role, **fields)
+
+
+def make_client(email='client@example.com'):
+    return Client.objects.get(user=make_user(email))
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.access, _ = JWTBearerAuthentication.generate_tokens_for_user(self.user)
+
+    def me(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        return api.get('/users/me/')
+
+    def test_deleted_user_is_evicted(self):
+        get_active_user(self.user.pk)
+        self.assertIsNotNone(cache.get(_redis_key(self.user.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.user.delete()
+        self.assertIsNone(cache.get(_redis_key(self.user.pk)))
+
+    def test_deleted_user_token_stops_authenticating(self):
+        self.assertEqual(self.me().status_code, 200)
+        admin = make_user('admin@example.com', role='admin')
+        api = APIClient()
+        api.force_authenticate(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.delete(f'/users/delete/{self.user.pk}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deactivated_user_is_evicted(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+
+class PurchaseHistoryTests(TestCase):
+    def setUp(self):
+        self.client_profile = make_client()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_profile.user)
+
+    def history(self):
+        response = self.api.get('/users/client/purchase-history/')
+        self.assertEqual(response.status_code, 200)
+        return [entry['order_id'] for entry in response.data['orders']]
+
+    def test_order_id_survives_order_deletion(self):
+        order = make_order(self.client_profile)
+        self.client_profile.update_purchase_history(order)
+        order_id = str(order.id)
+        self.assertEqual(self.history(), [order_id])
+        order.delete()
+        self.assertIsNone(Purchase.objects.get().order_id)
+        self.assertEqual(self.history(), [order_id])
+
+
+class LoyaltyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        loyalty_local.clear()
+        self.client_profile = make_client()
+
+    def create(self, model, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return model.objects.create(**fields)
+
+    def test_new_badge_is_awarded_on_next_order(self):
+        self.assertIsNone(eligible_badge(1))
+        badge = self.create(Badge, name='Bronze', threshold=1, discount=5.0, icon='bronze.svg', color='#CD7F32')
+        self.client_profile.orders = 1
+        self.client_profile.save(update_fields=['orders'])
+        self.client_profile.refresh_from_db()
+        self.assertEqual(self.client_profile.current_badge_id, badge.pk)
+
+    def test_updated_threshold_is_used(self):
+        badge = self.create(Badge, name='Bronze', threshold=5, discount=5.0, icon='bronze.svg', color='#CD7F32')
+        self.assertIsNone(eligible_badge(2))
+        with self.captureOnCommitCallbacks(execute=True):
+            badge.threshold = 2
+            badge.save()
+        self.assertEqual(eligible_badge(2), badge)
+
+    def test_new_referral_rule_is_reached(self):
+        self.assertEqual(reached_referral_rules(3), [])
+        rule = self.create(ReferralRule, referrals_count=3, discount=10.0)
+        self.assertEqual(reached_referral_rules(3), [rule])
+
+    def test_save_without_order_change_skips_badges(self):
+        self.create(Badge, name='Bronze', threshold=1, discount=5.0, icon='bronze.svg', color='#CD7F32')
+        client = Client.objects.get(pk=self.client_profile.pk)
+        client.solde_points = 10
+        with self.assertNumQueries(1):
+            client.save()
@@ -0,0 +1,61 @@
+# users/user_cache.py
+"""
+Résolution en cache de l'utilisateur d'un JWT.
+
+Deux niveaux :
+  - un LRU en mémoire du processus, indexé par (user_id, jti), à TTL très court
+    (settings.AUTH_USER_LOCAL_TTL) : il absorbe les rafales de requêtes d'un même
+    token sans aller-retour réseau ;
+  - le cache Redis partagé (settings.CACHES), indexé par user_id, à TTL court
+    (settings.AUTH_USER_CACHE_TIMEOUT).
+
+Les signaux de users/signals.py appellent ``invalidate_user`` à chaque
+sauvegarde / suppression d'un User et à chaque blacklist d'un token : l'entrée
+Redis disparaît aussitôt, les LRU des autres processus expirent au plus tard
+après AUTH_USER_LOCAL_TTL secondes. Seuls les utilisateurs actifs sont mis en
+cache.
+"""
+import copy
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from datadoit.local_cache import LocalLRU
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MAX_ENTRIES = 1024
+
+_local = LocalLRU(LOCAL_MAX_ENTRIES)
+
+
+def _redis_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def get_active_user(user_id, jti=None):
+    """
+    Retourne l'utilisateur actif ``user_id`` (copie propre à l'appelant) ou lève
+    User.DoesNotExist. ``jti`` identifie le token dans le cache local.
+    """
+    user_id = int(user_id)
+    local_key = (user_id, jti)
+    user = _local.get(local_key)
+    if user is None:
+        user = cache.get(_redis_key(user_id))
+        if user is None:
+            user = User.objects.get(id=user_id, is_active=True)
+            cache.set(_redis_key(user_id), user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+            logger.debug(f"Auth user cache miss for user_id={user_id}")
+        _local.set(local_key, user, settings.AUTH_USER_LOCAL_TTL)
+    # Chaque requête reçoit sa propre instance : aucune modification ne fuit dans le cache
+    return copy.copy(user)
+
+
+def invalidate_user(user_id):
+    user_id = int(user_id)
+    cache.delete(_redis_key(user_id))
+    _local.discard_matching(lambda key: key[0] == user_id)
+    logger.debug(f"Auth user cache invalidated for user_id={user_id}")
@@ -1,4 +1,4 @@
-import json
+import datetime
 import logging
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -7,13 +7,15 @@ from django.contrib.auth import get_user_model
 from .models import Comment
 from django.core.mail import send_mail
 from django.core.cache import cache
+from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from datadoit import settings
+from datadoit.pagination import InvalidCursor, paginate_keyset, wants_pagination
 from users.authentication import JWTBearerAuthentication
 from users.serializers import LoginSerializer, UserSerializer, SignupSerializer, UserUpdateSerializer
-from users.models import Client, Comment, Marchand, User
+from users.models import Client, Comment, Marchand, Purchase, User
 from django.core.files.storage import default_storage
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.core.exceptions import PermissionDenied
@@ -246,19 +248,46 @@ def update_avatar(request):
         'avatar_url': f"{settings.MEDIA_URL}{file_path}"
     }, status=status.HTTP_200_OK)
 
+def _day_start(value, name, days=0):
+    """'YYYY-MM-DD' -> début du jour (+ ``days``) ; lève ValueError si la date est invalide."""
+    try:
+        day = datetime.datetime.strptime(value, '%Y-%m-%d') + datetime.timedelta(days=days)
+    except ValueError:
+        raise ValueError(f"{name} doit être une date AAAA-MM-JJ")
+    return timezone.make_aware(day)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_purchase_history(request):
+    """
+    Historique d'achats du client connecté (table ``purchases``), filtrable
+    par ``?date_start=`` / ``?date_end=`` (AAAA-MM-JJ, inclus). Sans
+    ``?cursor=`` ni ``?page_size=``, tout l'historique est renvoyé du plus
+    ancien au plus récent, comme avant ; sinon pagination par curseur, du plus
+    récent au plus ancien.
+    """
     try:
-        client = Client.objects.get(user=request.user)
-        history = json.loads(client.historique_achats or '{"orders": []}')
-        if not isinstance(history, dict) or 'orders' not in history:
-            history = {'orders': []}
-        return Response(history, status=status.HTTP_200_OK)
-    except Client.DoesNotExist:
-        return Response({'message': 'Profil client non trouvé.'}, status=status.HTTP_404_NOT_FOUND)
-    except json.JSONDecodeError:
-        return Response({'message': 'Erreur de format dans l\'historique des achats.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Client.objects.filter(user=request.user).exists():
+            return Response({'message': 'Profil client non trouvé.'}, status=status.HTTP_404_NOT_FOUND)
+        purchases = Purchase.objects.filter(client_id=request.user.id)
+        date_start = request.query_params.get('date_start')
+        date_end = request.query_params.get('date_end')
+        if date_start:
+            purchases = purchases.filter(purchased_at__gte=_day_start(date_start, 'date_start'))
+        if date_end:
+            purchases = purchases.filter(purchased_at__lt=_day_start(date_end, 'date_end', days=1))
+
+        if not wants_pagination(request):
+            orders = [purchase.as_history_entry() for purchase in purchases.order_by('purchased_at', 'pk')]
+            return Response({'orders': orders}, status=status.HTTP_200_OK)
+        page, meta = paginate_keyset(purchases, request, sort_field='purchased_at')
+        return Response(
+            {**meta, 'orders': [purchase.as_history_entry() for purchase in page]},
+            status=status.HTTP_200_OK
+        )
+    except (ValueError, InvalidCursor) as e:
+        return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 from rest_framework.decorators import api_view